@@ -0,0 +1,67 @@
+import pytest
+
+from tests.testapp.models import TestModel
+
+from .helpers import FORM, SIZES, rounds
+
+pytestmark = pytest.mark.django_db
+
+sizes = pytest.mark.parametrize("size", SIZES)
+
+
+def new_instances(size):
+    return [TestModel(**FORM) for _ in range(size)]
+
+
+def changed_instances(size):
+    """``size`` saved instances, with a changed logged field."""
+    TestModel.objects.all().delete()
+    instances = TestModel.objects.bulk_create(new_instances(size), log_fields=False)
+    for instance in instances:
+        instance.test_integer_field += 1
+        instance.test_char_field += "!"
+    return instances
+
+
+@sizes
+@pytest.mark.benchmark(group="bulk_create")
+def bench_bulk_create(measure, size):
+    measure(
+        TestModel.objects.bulk_create,
+        setup=lambda: (new_instances(size),),
+        rounds=rounds(size),
+    )
+
+
+@sizes
+@pytest.mark.benchmark(group="bulk_create")
+def bench_bulk_create_without_logging(measure, size):
+    measure(
+        lambda objs: TestModel.objects.bulk_create(objs, log_fields=False),
+        setup=lambda: (new_instances(size),),
+        rounds=rounds(size),
+    )
+
+
+@sizes
+@pytest.mark.benchmark(group="bulk_update")
+def bench_bulk_update(measure, size):
+    measure(
+        lambda objs: TestModel.objects.bulk_update(
+            objs, ["test_integer_field", "test_char_field"]
+        ),
+        setup=lambda: (changed_instances(size),),
+        rounds=rounds(size),
+    )
+
+
+@sizes
+@pytest.mark.benchmark(group="bulk_update")
+def bench_bulk_update_without_logging(measure, size):
+    measure(
+        lambda objs: TestModel.objects.bulk_update(
+            objs, ["test_integer_field", "test_char_field"], log_fields=False
+        ),
+        setup=lambda: (changed_instances(size),),
+        rounds=rounds(size),
+    )
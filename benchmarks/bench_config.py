@@ -0,0 +1,24 @@
+import pytest
+from django.db import connections, router
+
+from fieldlogger import fieldlogger
+from fieldlogger.models import FieldLog
+
+pytestmark = pytest.mark.django_db
+
+
+def resolve_returning_pks(model_class):
+    """What ``db_supports_returning_pks`` did on every call before its
+    result was cached."""
+    using = router.db_for_write(model_class)
+    return connections[using].features.can_return_rows_from_bulk_insert
+
+
+@pytest.mark.benchmark(group="returning-pks")
+def bench_returning_pks_uncached(measure):
+    measure(resolve_returning_pks, FieldLog)
+
+
+@pytest.mark.benchmark(group="returning-pks")
+def bench_returning_pks_cached(measure):
+    measure(fieldlogger.db_supports_returning_pks, FieldLog)
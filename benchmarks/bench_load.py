@@ -0,0 +1,36 @@
+import pytest
+
+from fieldlogger.models import FieldLog
+from tests.testapp.models import TestModel, TestModelRelated
+
+from .helpers import FORM, SIZES, rounds
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark(group="load")]
+
+
+@pytest.fixture
+def logs(size):
+    """At least ``size`` logs, of every logged field type."""
+    related = TestModelRelated.objects.create()
+    per_instance = len(FORM) + 1
+    TestModel.objects.bulk_create(
+        [
+            TestModel(**FORM, test_related_field=related)
+            for _ in range(-(-size // per_instance))
+        ]
+    )
+    return FieldLog.objects.all()[:size]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def bench_load(measure, logs, size):
+    measure(lambda: list(logs.all()), rounds=rounds(size))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def bench_load_and_read_values(measure, logs, size):
+    def load():
+        for log in logs.all():
+            log.old_value, log.new_value  # noqa: B018
+
+    measure(load, rounds=rounds(size))
@@ -0,0 +1,45 @@
+import pytest
+
+from tests.testapp.models import TestModel, TestModelRelated2
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark(group="m2m")]
+
+# Relations the instance already has, which every change reads.
+RELATED = 100
+
+
+@pytest.fixture
+def instance():
+    instance = TestModel.objects.create()
+    instance.test_many_to_many_field.add(
+        *TestModelRelated2.objects.bulk_create(
+            [TestModelRelated2() for _ in range(RELATED)]
+        )
+    )
+    return instance
+
+
+def bench_add(measure, instance):
+    def setup():
+        return (TestModelRelated2.objects.create(),)
+
+    measure(instance.test_many_to_many_field.add, setup=setup, rounds=50)
+
+
+def bench_remove(measure, instance):
+    def setup():
+        related = TestModelRelated2.objects.create()
+        instance.test_many_to_many_field.add(related)
+        return (related,)
+
+    measure(instance.test_many_to_many_field.remove, setup=setup, rounds=50)
+
+
+def bench_clear(measure, instance):
+    related = list(TestModelRelated2.objects.all())
+
+    def setup():
+        instance.test_many_to_many_field.set(related)
+        return ()
+
+    measure(instance.test_many_to_many_field.clear, setup=setup, rounds=20)
@@ -0,0 +1,41 @@
+import pytest
+
+from tests.testapp.models import TestModel
+
+from .helpers import FORM, logging_settings
+
+pytestmark = [pytest.mark.django_db, pytest.mark.benchmark(group="save")]
+
+
+def save_changed(instance):
+    instance.test_integer_field += 1
+    instance.save()
+
+
+@pytest.fixture
+def instance():
+    instance = TestModel.objects.create(**FORM)
+    return TestModel.objects.get(pk=instance.pk)
+
+
+def bench_save_without_logging(measure, settings, instance):
+    settings.FIELD_LOGGER_SETTINGS = {}
+    measure(save_changed, instance)
+
+
+def bench_save(measure, instance):
+    measure(save_changed, instance)
+
+
+def bench_save_with_in_memory_state(measure, settings, instance):
+    settings.FIELD_LOGGER_SETTINGS = logging_settings(in_memory_state=True)
+    measure(save_changed, TestModel.objects.get(pk=instance.pk))
+
+
+def bench_create_without_logging(measure, settings):
+    settings.FIELD_LOGGER_SETTINGS = {}
+    measure(TestModel.objects.create, **FORM)
+
+
+def bench_create(measure):
+    measure(TestModel.objects.create, **FORM)
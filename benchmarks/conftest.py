@@ -0,0 +1,52 @@
+import tracemalloc
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Queries and memory of a single call, by benchmark name.
+_calls = {}
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmark ``func(*args, **kwargs)``, also reporting the queries and memory
+    allocated by a single call in the ``extra_info`` of the results.
+
+    ``setup``, if given, runs before every call (untimed) and returns the
+    arguments, for operations that cannot be repeated on the same data.
+    """
+
+    def measure(func, *args, setup=None, rounds=None, **kwargs):
+        call_args = setup() if setup else args
+
+        with CaptureQueriesContext(connection) as ctx:
+            tracemalloc.start()
+            func(*call_args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        benchmark.extra_info["queries"] = len(ctx.captured_queries)
+        benchmark.extra_info["peak_kib"] = round(peak / 1024, 1)
+        _calls[benchmark.name] = benchmark.extra_info
+
+        if setup:
+            return benchmark.pedantic(
+                func, setup=lambda: (setup(), {}), rounds=rounds or 10
+            )
+        return benchmark(func, *args, **kwargs)
+
+    return measure
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _calls:
+        return
+
+    width = max(len(name) for name in _calls)
+    terminalreporter.section("queries and peak memory per call")
+    terminalreporter.write_line(f"{'Name':<{width}}  {'Queries':>8}  {'Peak KiB':>10}")
+    for name, info in sorted(_calls.items()):
+        terminalreporter.write_line(
+            f"{name:<{width}}  {info['queries']:>8}  {info['peak_kib']:>10}"
+        )
@@ -0,0 +1,24 @@
+import os
+
+from tests.helpers import CREATE_FORM
+
+from .settings import logging_settings  # noqa: F401
+
+# Row counts of the bulk benchmarks, e.g. BENCHMARK_SIZES=1000,10000
+SIZES = [
+    int(size)
+    for size in os.environ.get("BENCHMARK_SIZES", "1000,10000,100000").split(",")
+]
+
+# Values for every logged field but the files, whose storage would
+# dominate the timings.
+FORM = {
+    name: value
+    for name, value in CREATE_FORM.items()
+    if name not in ("test_file_field", "test_image_field")
+}
+
+
+def rounds(size):
+    """Fewer rounds for the larger sizes, which take seconds each."""
+    return max(1, min(10, 100_000 // size // 10))
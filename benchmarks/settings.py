@@ -0,0 +1,46 @@
+"""Settings of the benchmarks: the test settings, on SQLite by default or
+on PostgreSQL if ``BENCHMARK_DATABASE=postgresql`` (configured with the
+usual ``PG*`` environment variables)."""
+
+import os
+
+from tests.settings import *  # noqa: F403
+
+if os.environ.get("BENCHMARK_DATABASE") == "postgresql":
+    DATABASES = {
+        alias: {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("PGDATABASE", "fieldlogger"),
+            "USER": os.environ.get("PGUSER", ""),
+            "PASSWORD": os.environ.get("PGPASSWORD", ""),
+            "HOST": os.environ.get("PGHOST", ""),
+            "PORT": os.environ.get("PGPORT", ""),
+            "TEST": {"NAME": f"test_fieldlogger_{alias}"},
+        }
+        for alias in ("default", "other")
+    }
+
+
+def logging_settings(**model_options):
+    """``FIELD_LOGGER_SETTINGS`` logging every field of ``TestModel``, with
+    extra model options and no callbacks."""
+    return {
+        "LOGGING_APPS": {
+            "testapp": {
+                "models": {
+                    "TestModel": {
+                        "fields": "__all__",
+                        "exclude_fields": ["id"],
+                        **model_options,
+                    },
+                },
+            },
+        },
+    }
+
+
+# Logging to a file would add noise to the timings.
+LOGGING = {"version": 1, "disable_existing_loggers": False}
+
+# No callbacks: the test callbacks save every log again.
+FIELD_LOGGER_SETTINGS = logging_settings()
@@ -0,0 +1,268 @@
+"""Archival of cold logs (see the ``ARCHIVE_DAYS`` setting and the
+``archive_fieldlogs`` command).
+
+Logs older than the archival age are moved out of the ``FieldLog`` table,
+and out of its indexes, into a ``FieldLogArchive`` row per instance: a
+zlib-compressed JSON list of the stored log values, which later runs
+extend. The history of an instance merges its archived and live logs
+back together.
+"""
+
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .deltas import checkpoint_survivors
+from .encoding import DECODER, ENCODER
+from .models import FieldLog, FieldLogArchive
+from .retention import Cutoffs, expired_logs, last_pk_before
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Values of each archived log, in this order.
+ARCHIVED_FIELDS = (
+    "id",
+    "field",
+    "timestamp",
+    "old_value",
+    "new_value",
+    "extra_data",
+    "created",
+)
+
+# (app_label, model_name, instance_id)
+InstanceKey = Tuple[str, str, str]
+
+
+def _log_rows(logs: List[FieldLog]) -> List[List[Any]]:
+    """Return the stored values of the loaded ``logs``, as packed, with
+    their many-to-many deltas expanded (see ``fieldlogger.deltas``)."""
+    rows = [
+        [
+            log.pk,
+            log.field,
+            log.timestamp.isoformat(),
+            # Not converted yet.
+            log.__dict__["old_value"],
+            log.__dict__["new_value"],
+            log.extra_data,
+            log.created,
+        ]
+        for log in logs
+    ]
+    return json.loads(json.dumps(rows, cls=ENCODER))
+
+
+def _rows(archive: FieldLogArchive) -> List[List[Any]]:
+    """Return the stored values of the logs of ``archive``, as packed."""
+    return json.loads(zlib.decompress(bytes(archive.data)))
+
+
+def _fill(archive: FieldLogArchive, rows: List[List[Any]]) -> None:
+    """Set the blob of ``archive`` and the fields that summarize it to
+    ``rows``, the stored values of its logs."""
+    rows.sort(key=lambda row: row[0])
+    timestamps = [parse_datetime(row[2]) for row in rows]
+    archive.first_log_id = rows[0][0]
+    archive.last_log_id = rows[-1][0]
+    archive.first_timestamp = min(timestamps)
+    archive.last_timestamp = max(timestamps)
+    archive.log_count = len(rows)
+    archive.data = zlib.compress(json.dumps(rows).encode())
+
+
+def unpack(archive: FieldLogArchive) -> List[FieldLog]:
+    """Return the logs of ``archive``, loaded like logs read from the
+    ``FieldLog`` table: their values are converted on first access.
+
+    They are not saved in the ``FieldLog`` table, so they are read-only.
+    """
+    rows = json.loads(zlib.decompress(bytes(archive.data)), cls=DECODER)
+    attnames = [field.attname for field in FieldLog._meta.concrete_fields]
+
+    logs = []
+    for row in rows:
+        values: Dict[str, Any] = dict.fromkeys(attnames)
+        values.update(zip(ARCHIVED_FIELDS, row))
+        values.update(
+            app_label=archive.app_label,
+            model_name=archive.model_name,
+            instance_id=archive.instance_id,
+            timestamp=parse_datetime(values["timestamp"]),
+        )
+        logs.append(
+            FieldLog.from_db(
+                archive._state.db, attnames, [values[name] for name in attnames]
+            )
+        )
+    return logs
+
+
+def _archives(keys: Iterable[InstanceKey], using: str) -> Dict[InstanceKey, Any]:
+    """Return the archives of the instances of ``keys``, locked until the
+    end of the transaction."""
+    instance_ids: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    for app_label, model_name, instance_id in keys:
+        instance_ids[app_label, model_name].append(instance_id)
+
+    condition = Q()
+    for (app_label, model_name), ids in instance_ids.items():
+        condition |= Q(app_label=app_label, model_name=model_name, instance_id__in=ids)
+
+    return {
+        (archive.app_label, archive.model_name, archive.instance_id): archive
+        for archive in FieldLogArchive.objects.using(using)
+        .select_for_update()
+        .filter(condition)
+    }
+
+
+def archive_logs(
+    before: datetime,
+    using: str = DEFAULT_DB_ALIAS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[Tuple[int, int, int]]:
+    """Move the logs older than ``before`` to archives, in batches of
+    ``batch_size`` consecutive primary keys, each in its own transaction.
+
+    Each instance has a single archive: the logs of an instance that
+    already has one are merged into it. Yields the last primary key of
+    each batch, the number of logs it archived and the number of archives
+    it created. The scan stops at the greatest primary key of the logs to
+    archive, looked up first, as in ``retention.delete_expired``.
+    """
+    logs = FieldLog.objects.using(using)
+    last_pk = last_pk_before(logs, before)
+    next_pk = None
+
+    while True:
+        batch_start = logs.order_by("pk").values_list("pk", flat=True)
+        if next_pk is not None:
+            batch_start = batch_start.filter(pk__gte=next_pk)
+        batch_start = batch_start.first()
+        if batch_start is None or last_pk is None or batch_start > last_pk:
+            return
+
+        batch = logs.filter(
+            pk__gte=batch_start, pk__lt=batch_start + batch_size, timestamp__lt=before
+        ).order_by("pk")
+        with transaction.atomic(using=using):
+            # Evaluating the batch expands its deltas.
+            by_instance: Dict[InstanceKey, List[FieldLog]] = defaultdict(list)
+            for log in batch:
+                key = (log.app_label, log.model_name, str(log.raw_instance_id))
+                by_instance[key].append(log)
+
+            archives = _archives(by_instance, using) if by_instance else {}
+            new_archives = []
+            for key, instance_logs in by_instance.items():
+                archive = archives.get(key)
+                if archive is None:
+                    app_label, model_name, instance_id = key
+                    archive = FieldLogArchive(
+                        app_label=app_label,
+                        model_name=model_name,
+                        instance_id=instance_id,
+                    )
+                    new_archives.append(archive)
+                    rows = []
+                else:
+                    rows = _rows(archive)
+                _fill(archive, rows + _log_rows(instance_logs))
+
+            FieldLogArchive.objects.using(using).bulk_create(new_archives)
+            FieldLogArchive.objects.using(using).bulk_update(
+                archives.values(),
+                [
+                    "first_log_id",
+                    "last_log_id",
+                    "first_timestamp",
+                    "last_timestamp",
+                    "log_count",
+                    "data",
+                ],
+            )
+            archived = sum(map(len, by_instance.values()))
+            if archived:
+                checkpoint_survivors(batch)
+                batch._raw_delete(using)
+
+        yield batch_start + batch_size - 1, archived, len(new_archives)
+
+        next_pk = batch_start + batch_size
+
+
+def prune_archives(cutoffs: Cutoffs, using: str = DEFAULT_DB_ALIAS) -> Tuple[int, int]:
+    """Delete the archives whose logs are all expired according to
+    ``cutoffs`` (see ``retention.retention_cutoffs``), and the expired
+    logs of the others.
+
+    Returns the number of archives deleted and of archives trimmed.
+    """
+    _, condition = expired_logs(cutoffs, "last_timestamp")
+    deleted = FieldLogArchive.objects.using(using).filter(condition)._raw_delete(using)
+
+    trimmed = 0
+    _, condition = expired_logs(cutoffs, "first_timestamp")
+    archives = FieldLogArchive.objects.using(using).filter(condition)
+    for archive_id in list(archives.values_list("pk", flat=True)):
+        with transaction.atomic(using=using):
+            archive = (
+                FieldLogArchive.objects.using(using)
+                .select_for_update()
+                .get(pk=archive_id)
+            )
+            before = cutoffs.get((archive.app_label, archive.model_name), cutoffs[None])
+            _fill(
+                archive,
+                [row for row in _rows(archive) if parse_datetime(row[2]) >= before],
+            )
+            archive.save()
+        trimmed += 1
+
+    return deleted, trimmed
+
+
+def archived_logs(
+    app_label: str,
+    model_name: str,
+    instance_id: Any,
+    field: Optional[str] = None,
+    using: Optional[str] = None,
+) -> List[FieldLog]:
+    """Return the archived logs of an instance (of one of its fields, if
+    given), in order."""
+    archives = FieldLogArchive.objects.using(using).filter(
+        app_label=app_label, model_name=model_name, instance_id=str(instance_id)
+    )
+
+    logs = [log for archive in archives for log in unpack(archive)]
+    if field is not None:
+        logs = [log for log in logs if log.field == field]
+    return sorted(logs, key=lambda log: log.pk)
+
+
+def history(
+    app_label: str,
+    model_name: str,
+    instance_id: Any,
+    field: Optional[str] = None,
+    using: Optional[str] = None,
+) -> List[FieldLog]:
+    """Return all the logs of an instance (of one of its fields, if given),
+    archived and live, in order."""
+    live_logs = FieldLog.objects.using(using).filter(
+        app_label=app_label, model_name=model_name, instance_id=instance_id
+    )
+    if field is not None:
+        live_logs = live_logs.filter(field=field)
+
+    return archived_logs(app_label, model_name, instance_id, field, using) + list(
+        live_logs.order_by("pk")
+    )
@@ -2,19 +2,37 @@
 
 Reads the ``FIELD_LOGGER_SETTINGS`` dict from the Django settings and builds
 a per-model logging configuration, resolving the ``logging_enabled``,
-``fail_silently`` and ``callbacks`` options across the global, app and model
-scopes.
+``fail_silently``, ``callbacks``, ``in_memory_state``, ``retention_days``,
+``snapshot_every``, ``snapshot_interval`` and ``m2m_checkpoint_every``
+options across the global, app and model scopes, and compiling the field
+plan of each model (see ``FieldPlan``).
 """
 
-from typing import TYPE_CHECKING, Any, Dict, FrozenSet, List, Tuple, Type
+from collections import OrderedDict
+from operator import attrgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
 
 from django.apps import apps
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router
 from django.db.models import Model
 from django.db.models.fields import Field
 from django.utils.module_loading import import_string
 
+from .conversion import value_converter
+
 if TYPE_CHECKING:
     from .models import Callback
 
@@ -23,6 +41,39 @@ ModelConfig = Dict[str, Any]
 # Django >= 5.0 only; None on older versions.
 GENERATED_FIELD = getattr(models, "GeneratedField", None)
 
+# Number of field plans filtered by update_fields kept by the config.
+PLAN_CACHE_SIZE = 256
+
+
+class PlannedField(NamedTuple):
+    """How a logged field is read from an instance: its value, normalized
+    like it is logged (e.g. decimals rounded to their decimal places), or
+    ``None`` if it needs no normalization."""
+
+    field: Field
+    get: Callable[[Model], Any]
+    normalize: Optional[Callable[[Any], Any]]
+
+
+class FieldPlan(NamedTuple):
+    """The logged fields of a model, as a set and as ``PlannedField``
+    entries in the order of the model fields."""
+
+    fields: FrozenSet[Field]
+    entries: Tuple[PlannedField, ...]
+
+
+def _field_plan(fields: Iterable[Field]) -> FieldPlan:
+    entries = tuple(
+        PlannedField(
+            field,
+            attrgetter(field.name),
+            value_converter(field) if isinstance(field, models.DecimalField) else None,
+        )
+        for field in sorted(fields)
+    )
+    return FieldPlan(frozenset(entry.field for entry in entries), entries)
+
 
 def _is_loggable(field: Field) -> bool:
     """Whether a field can be logged on save: concrete (excludes reverse
@@ -58,6 +109,10 @@ class LoggingConfig:
         self._settings: dict = {}
         self._config: Dict[Type[Model], ModelConfig] = {}
         self._m2m_config: Dict[Type[Model], Tuple[Type[Model], Field]] = {}
+        self._returning_pks: Dict[Tuple[Type[Model], Optional[str]], bool] = {}
+        self._plans: OrderedDict[Tuple[Type[Model], FrozenSet[str]], FieldPlan] = (
+            OrderedDict()
+        )
         self._loaded = False
 
     def _all_scopes(self, key: str, *configs: dict) -> bool:
@@ -67,6 +122,15 @@ class LoggingConfig:
             config.get(key, True) for config in configs
         )
 
+    def _most_specific(self, key: str, default: Any, *configs: dict) -> Any:
+        """Value of a setting in the most specific scope that sets it,
+        falling back to the global scope and then to ``default``."""
+        for config in reversed(configs):
+            if key in config:
+                return config[key]
+
+        return self._settings.get(key.upper(), default)
+
     def _logging_enabled(self, *configs: dict) -> bool:
         return self._all_scopes("logging_enabled", *configs)
 
@@ -134,9 +198,25 @@ class LoggingConfig:
 
                 self._config[model_class] = {
                     "logging_fields": logging_fields,
+                    "field_plan": _field_plan(logging_fields),
                     "logging_m2m_fields": logging_m2m_fields,
                     "callbacks": self._callbacks(app_config, model_config),
                     "fail_silently": self._fail_silently(app_config, model_config),
+                    "in_memory_state": self._most_specific(
+                        "in_memory_state", False, app_config, model_config
+                    ),
+                    "retention_days": self._most_specific(
+                        "retention_days", None, app_config, model_config
+                    ),
+                    "snapshot_every": self._most_specific(
+                        "snapshot_every", None, app_config, model_config
+                    ),
+                    "snapshot_interval": self._most_specific(
+                        "snapshot_interval", None, app_config, model_config
+                    ),
+                    "m2m_checkpoint_every": self._most_specific(
+                        "m2m_checkpoint_every", None, app_config, model_config
+                    ),
                 }
 
                 for field in logging_m2m_fields:
@@ -159,14 +239,65 @@ class LoggingConfig:
         self.get_config()
         return self._m2m_config
 
+    def field_plan(
+        self, model_class: Type[Model], update_fields: Optional[Iterable[str]] = None
+    ) -> FieldPlan:
+        """The plan of the logged fields of ``model_class`` written by a
+        ``save()`` with ``update_fields`` (by field name or attname), or of
+        all of them if ``update_fields`` is empty.
+
+        Filtered plans are cached per model and ``update_fields``, for the
+        ``PLAN_CACHE_SIZE`` most recently used ones.
+        """
+        plan = self.get_config()[model_class]["field_plan"]
+        if not update_fields:
+            return plan
+
+        key = (model_class, frozenset(update_fields))
+        try:
+            self._plans.move_to_end(key)
+            return self._plans[key]
+        except KeyError:
+            pass
+
+        names = key[1]
+        filtered = _field_plan(
+            entry.field
+            for entry in plan.entries
+            if entry.field.name in names or entry.field.attname in names
+        )
+        self._plans[key] = filtered
+        if len(self._plans) > PLAN_CACHE_SIZE:
+            self._plans.popitem(last=False)
+        return filtered
+
+    def supports_returning_pks(
+        self, model_class: Type[Model], using: Optional[str] = None
+    ) -> bool:
+        """Whether the database that ``model_class`` writes to (``using``,
+        or the one picked by the routers) returns primary keys from bulk
+        inserts; resolved once per model and database."""
+        key = (model_class, using)
+        try:
+            return self._returning_pks[key]
+        except KeyError:
+            alias = using or router.db_for_write(model_class)
+            supported = connections[alias].features.can_return_rows_from_bulk_insert
+            self._returning_pks[key] = supported
+            return supported
+
     def invalidate(self) -> None:
         """Discard the cached configuration; rebuilt on next access."""
         self._config = {}
         self._m2m_config = {}
+        self._returning_pks = {}
+        self._plans.clear()
         self._loaded = False
 
 
 _logging_config = LoggingConfig()
 get_config = _logging_config.get_config
 get_m2m_config = _logging_config.get_m2m_config
+field_plan = _logging_config.field_plan
+supports_returning_pks = _logging_config.supports_returning_pks
 invalidate_config = _logging_config.invalidate
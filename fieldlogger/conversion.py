@@ -0,0 +1,140 @@
+"""Conversion of the JSON-decoded values of ``FieldLog`` back to the Python
+objects of the logged fields."""
+
+from base64 import b64decode
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple, Type
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils.functional import SimpleLazyObject
+
+from .utils import getrmodel
+
+
+def _fetch_related(field: models.ForeignKey, pk: Any) -> models.Model:
+    """Fetch the related instance of a logged foreign key value.
+
+    If the instance no longer exists, return an unsaved shell instance
+    carrying only the primary key, so reading old logs never fails.
+    """
+    try:
+        return field.related_model._base_manager.get(pk=pk)
+    except field.related_model.DoesNotExist:
+        return field.related_model(pk=pk)
+
+
+# Converts a JSON-decoded value back to a Python object.
+Converter = Callable[[Any], Any]
+
+
+def _unconverted(value: Any) -> Any:
+    return value
+
+
+def value_converter(field: models.Field) -> Converter:
+    """Return the converter of the JSON-decoded values of ``field`` back to
+    the Python objects it would hold on its model instance."""
+    to_python = field.to_python
+
+    if isinstance(field, models.BinaryField):
+
+        def convert(value):
+            if isinstance(value, str):
+                try:
+                    value = b64decode(value)
+                except ValueError:
+                    # Logs written before binary values were base64-encoded.
+                    value = bytes(value, "utf-8")
+            return to_python(value)
+
+    elif isinstance(field, models.DecimalField):
+        decimal_places = field.decimal_places
+
+        def convert(value):
+            if value is not None:
+                value = round(to_python(value), decimal_places)
+            return to_python(value)
+
+    elif isinstance(field, models.ForeignKey):
+
+        def convert(value):
+            if not value:
+                return None
+            # Lazy so that loading logs does not query one related
+            # instance per row.
+            return SimpleLazyObject(lambda: _fetch_related(field, value))
+
+    else:
+        convert = to_python
+
+    return convert
+
+
+@lru_cache(maxsize=1024)
+def resolve_field(
+    app_label: str, model_name: str, field: str
+) -> Tuple[Optional[Type[models.Model]], Optional[models.Field]]:
+    """Return the model that the logged ``field`` of the
+    ``app_label.model_name`` model belongs to (the related model for
+    paths like ``"fk__name"``), and the field itself; ``None`` for what no
+    longer exists.
+
+    Cached, since there are far fewer logged fields than logs; the cache
+    is cleared when ``INSTALLED_APPS`` changes.
+    """
+    try:
+        model_class = apps.get_model(app_label, model_name)
+    except LookupError:
+        return None, None
+
+    field_path, _, field_name = field.rpartition("__")
+    model_class = getrmodel(model_class, field_path) or model_class
+
+    try:
+        return model_class, model_class._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return model_class, None
+
+
+@lru_cache(maxsize=1024)
+def resolve_converters(
+    app_label: str, model_name: str, field: str
+) -> Tuple[Converter, Converter]:
+    """Return the converters of the ``instance_id`` and of the values of
+    the logs of ``field`` of the ``app_label.model_name`` model (see
+    ``resolve_field``). Logs whose model or field no longer exists are
+    left as decoded JSON."""
+    model_class, model_field = resolve_field(app_label, model_name, field)
+    if model_class is None:
+        return _unconverted, _unconverted
+
+    pk_converter = model_class._meta.pk.to_python
+    if model_field is None:
+        return pk_converter, _unconverted
+
+    return pk_converter, value_converter(model_field)
+
+
+@lru_cache(maxsize=1024)
+def native_instance_id_field(app_label: str, model_name: str) -> Optional[str]:
+    """Return the ``FieldLog`` field that stores the instance ids of the
+    ``app_label.model_name`` model natively (see the
+    ``NATIVE_INSTANCE_IDS`` setting), or ``None`` if they are stored as
+    strings."""
+    try:
+        model_class = apps.get_model(app_label, model_name)
+    except LookupError:
+        return None
+
+    pk = model_class._meta.pk
+    while pk.is_relation:
+        # E.g. the parent link of multi-table inheritance.
+        pk = pk.target_field
+
+    if isinstance(pk, models.IntegerField):
+        return "instance_int_id"
+    if isinstance(pk, models.UUIDField):
+        return "instance_uuid"
+    return None
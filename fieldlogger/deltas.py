@@ -0,0 +1,254 @@
+"""Delta storage of the logs of many-to-many fields (see the
+``m2m_checkpoint_every`` option).
+
+Logs of many-to-many fields hold the full lists of related pks before and
+after each change. With deltas, most of them are stored with a NULL
+``old_value`` and only the added and removed pks in ``new_value``, and a
+full log is stored as a checkpoint every ``m2m_checkpoint_every`` logs of
+the field of an instance. Loaded logs are expanded back to the full lists
+from the latest checkpoint before them and the deltas in between.
+
+Logs deleted by retention or archival would leave the deltas after them
+without a checkpoint, so the first delta after them is stored as a full
+log first (see ``checkpoint_survivors``).
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+from django.db.models import Field, ManyToManyField, Max, Min, Model, Q, QuerySet
+
+from .config import get_config
+from .conversion import resolve_field
+from .models import NATIVE_INSTANCE_ID_FIELDS, FieldLog
+
+# Attribute of the logs to store as deltas holding their stored
+# ``new_value``, see ``fieldlogger.fieldlogger._stored``.
+DELTA_ATTR = "_fieldlogger_m2m_delta"
+
+# Keys of the stored ``new_value`` of a delta.
+DELTA_KEYS = frozenset(["added", "removed"])
+
+# (app_label, model_name, instance_id, field) of a log
+LogKey = Tuple[str, str, str, str]
+
+# The fields needed to group logs by ``_log_key``, loaded without their
+# values so that they are not expanded.
+KEY_FIELDS = [
+    "app_label",
+    "model_name",
+    "instance_id",
+    "field",
+    "logged_field",
+    *NATIVE_INSTANCE_ID_FIELDS,
+]
+
+
+def delta_value(old_pks: Set[Any], new_pks: Set[Any]) -> Dict[str, List[Any]]:
+    """Return the stored ``new_value`` of the change from ``old_pks`` to
+    ``new_pks``."""
+    return {"added": sorted(new_pks - old_pks), "removed": sorted(old_pks - new_pks)}
+
+
+def tail_counts(
+    model_class: Type[Model], field: Field, pks: Iterable[Any], using: str
+) -> Dict[Any, Optional[int]]:
+    """Return the number of logs of ``field`` of the instances with the
+    given ``pks`` since their latest full log, by pk; ``None`` for those
+    without one. Costs two queries."""
+    pk_field = model_class._meta.pk
+    logs = FieldLog.objects.using(using).filter(
+        app_label=model_class._meta.app_label,
+        model_name=model_class._meta.model_name,
+        field=field.name,
+        instance_id__in=list(pks),
+    )
+
+    checkpoints: Dict[Any, int] = {}
+    rows = (
+        logs.filter(old_value__isnull=False)
+        .order_by()
+        .values("instance_id", *NATIVE_INSTANCE_ID_FIELDS)
+        .annotate(last_pk=Max("pk"))
+    )
+    for row in rows:
+        # Logs with native instance ids have a blank instance_id.
+        stored_ids = [row[name] for name in NATIVE_INSTANCE_ID_FIELDS]
+        stored_ids = [value for value in stored_ids if value is not None]
+        pk = pk_field.to_python(stored_ids[0] if stored_ids else row["instance_id"])
+        checkpoints[pk] = max(row["last_pk"], checkpoints.get(pk, 0))
+
+    counts: Dict[Any, Optional[int]] = dict.fromkeys(pks)
+    counts.update(dict.fromkeys(checkpoints, 0))
+    if not checkpoints:
+        return counts
+
+    tail = logs.filter(pk__gt=min(checkpoints.values())).only(
+        "instance_id", *NATIVE_INSTANCE_ID_FIELDS
+    )
+    for log in tail:
+        pk = pk_field.to_python(log.instance_id)
+        if pk in checkpoints and log.pk > checkpoints[pk]:
+            counts[pk] += 1
+    return counts
+
+
+def is_delta(log: FieldLog) -> bool:
+    """Whether the values of ``log``, loaded with all the fields needed to
+    convert them and not accessed yet, are a stored delta."""
+    if not {"old_value", "new_value"}.issubset(log.__dict__.get("_unconverted", ())):
+        return False
+
+    new_value = log.__dict__["new_value"]
+    if not (
+        log.__dict__["old_value"] is None
+        and isinstance(new_value, dict)
+        and new_value.keys() == DELTA_KEYS
+    ):
+        return False
+
+    _, field = resolve_field(log.app_label, log.model_name, log.field)
+    return isinstance(field, ManyToManyField)
+
+
+def _log_key(log: FieldLog) -> LogKey:
+    return (log.app_label, log.model_name, str(log.raw_instance_id), log.field)
+
+
+def _key_q(key: LogKey, **lookups: Any) -> Q:
+    app_label, model_name, instance_id, field = key
+    return Q(
+        app_label=app_label,
+        model_name=model_name,
+        instance_id=instance_id,
+        field=field,
+        **lookups,
+    )
+
+
+def expand_deltas(logs: List[FieldLog]) -> None:
+    """Replace the stored deltas among the loaded ``logs`` (see
+    ``is_delta``) with the full lists of related pks before and after
+    them, with two queries: the full logs before them, and the logs from
+    the latest of those on.
+
+    Deltas without a full log before them (e.g. pruned or archived) are
+    left as stored.
+    """
+    deltas: Dict[LogKey, List[FieldLog]] = defaultdict(list)
+    for log in logs:
+        if is_delta(log):
+            deltas[_log_key(log)].append(log)
+    if not deltas:
+        return
+
+    using = next(iter(deltas.values()))[0]._state.db
+
+    # The latest full log before the first delta of each key.
+    first_pks = {
+        key: min(log.pk for log in key_logs) for key, key_logs in deltas.items()
+    }
+    condition = Q()
+    for key, pk in first_pks.items():
+        condition |= _key_q(key, pk__lt=pk)
+    checkpoints: Dict[LogKey, int] = {}
+    full_logs = (
+        FieldLog.objects.using(using)
+        .filter(condition, old_value__isnull=False)
+        .only(*KEY_FIELDS)
+    )
+    for log in full_logs:
+        key = _log_key(log)
+        checkpoints[key] = max(log.pk, checkpoints.get(key, 0))
+    if not checkpoints:
+        return
+
+    condition = Q()
+    for key, pk in checkpoints.items():
+        last_pk = max(log.pk for log in deltas[key])
+        condition |= _key_q(key, pk__gte=pk, pk__lte=last_pk)
+    chains = (
+        FieldLog.objects.using(using)
+        .filter(condition)
+        .only(*KEY_FIELDS, "old_value", "new_value")
+        .order_by("pk")
+    )
+
+    expanded: Dict[int, Tuple[List[Any], List[Any]]] = {}
+    states: Dict[LogKey, Set[Any]] = {}
+    for log in chains:
+        key = _log_key(log)
+        old_value, new_value = log.__dict__["old_value"], log.__dict__["new_value"]
+        if old_value is not None:
+            states[key] = set(new_value)
+        else:
+            state = states[key]
+            states[key] = (state | set(new_value["added"])) - set(new_value["removed"])
+            expanded[log.pk] = (sorted(state), sorted(states[key]))
+
+    for key_logs in deltas.values():
+        for log in key_logs:
+            if log.pk in expanded:
+                log.__dict__["old_value"], log.__dict__["new_value"] = expanded[log.pk]
+
+
+def _m2m_logs_q() -> Optional[Q]:
+    """Return the condition matching the logs of the logged many-to-many
+    fields, or ``None`` if there are none."""
+    condition = None
+    for model_class, model_config in get_config().items():
+        for field in model_config["logging_m2m_fields"]:
+            field_q = Q(
+                app_label=model_class._meta.app_label,
+                model_name=model_class._meta.model_name,
+                field=field.name,
+            )
+            condition = field_q if condition is None else condition | field_q
+    return condition
+
+
+def checkpoint_survivors(logs: QuerySet) -> int:
+    """Store as full logs the deltas that follow the ``logs`` about to be
+    deleted (e.g. pruned or archived) in their chains, so that they can
+    still be expanded once those are gone. Returns how many were stored.
+
+    The logs of a field of an instance that come after the first of them
+    are looked at: those between them, and the first one after them.
+    """
+    m2m_logs = _m2m_logs_q()
+    if m2m_logs is None:
+        return 0
+
+    using = logs.db
+    deleted: Dict[LogKey, List[int]] = defaultdict(list)
+    for log in logs.filter(m2m_logs).only(*KEY_FIELDS):
+        deleted[_log_key(log)].append(log.pk)
+    if not deleted:
+        return 0
+
+    survivors = FieldLog.objects.using(using).exclude(pk__in=logs.values("pk"))
+    between = Q()
+    after = Q()
+    for key, pks in deleted.items():
+        between |= _key_q(key, pk__gt=min(pks), pk__lt=max(pks))
+        after |= _key_q(key, pk__gt=max(pks))
+    # Logs stored alike share a group, see ``tail_counts``.
+    firsts = (
+        survivors.filter(after)
+        .order_by()
+        .values(*KEY_FIELDS)
+        .annotate(first_pk=Min("pk"))
+        .values_list("first_pk", flat=True)
+    )
+    candidates = survivors.filter(
+        between | Q(pk__in=list(firsts)), old_value__isnull=True
+    )
+
+    # Expanded as they are loaded, while the logs before them are still
+    # there; deltas without a checkpoint before them are left.
+    stored = [log for log in candidates if log.__dict__["old_value"] is not None]
+    for log in stored:
+        FieldLog.objects.using(using).filter(pk=log.pk).update(
+            old_value=log.__dict__["old_value"], new_value=log.__dict__["new_value"]
+        )
+    return len(stored)
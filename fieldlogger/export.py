@@ -0,0 +1,145 @@
+"""Streaming export of logs to JSON Lines or CSV files (see the
+``export_fieldlogs`` command).
+
+Logs are read with ``iterator()``, in chunks through a server-side cursor
+where the database supports it, and written one by one, so memory use
+does not grow with the number of logs.
+"""
+
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import IO, Any, Dict, Iterator, Optional
+
+from django.db.models import QuerySet
+
+from .deltas import expand_deltas
+from .encoding import ENCODER
+from .models import FieldLog
+
+FORMAT_JSONL = "jsonl"
+FORMAT_CSV = "csv"
+FORMATS = (FORMAT_JSONL, FORMAT_CSV)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+COLUMNS = (
+    "id",
+    "timestamp",
+    "app_label",
+    "model_name",
+    "instance_id",
+    "field",
+    "created",
+    "old_value",
+    "new_value",
+    "extra_data",
+)
+
+
+def filter_logs(
+    logs: Optional[QuerySet] = None,
+    app_label: Optional[str] = None,
+    model_name: Optional[str] = None,
+    field: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> QuerySet:
+    """Return the ``logs`` (all by default) of the given app, model and
+    field, logged from ``since`` and before ``until``, in primary key
+    order."""
+    if logs is None:
+        logs = FieldLog.objects.all()
+
+    lookups: Dict[str, Any] = {
+        "app_label": app_label,
+        "model_name": model_name,
+        "field": field,
+        "timestamp__gte": since,
+        "timestamp__lt": until,
+    }
+    return logs.filter(
+        **{lookup: value for lookup, value in lookups.items() if value is not None}
+    ).order_by("pk")
+
+
+def export_rows(
+    logs: QuerySet, chunk_size: int = DEFAULT_CHUNK_SIZE, convert: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """Yield a dict per log of ``logs``, with the ``COLUMNS`` as keys.
+
+    Values are exported as stored unless ``convert`` is set, in which case
+    they are converted back to the Python objects of the logged fields
+    first (e.g. to follow a custom ``ENCODER``). Either way, many-to-many
+    deltas are expanded to the full lists (see ``fieldlogger.deltas``),
+    a chunk at a time.
+    """
+    log_iterator = logs.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(log_iterator, chunk_size))
+        if not chunk:
+            return
+        expand_deltas(chunk)
+
+        for log in chunk:
+            yield {
+                "id": log.pk,
+                "timestamp": log.timestamp.isoformat(),
+                "app_label": log.app_label,
+                "model_name": log.model_name,
+                "instance_id": log.instance_id if convert else log.raw_instance_id,
+                "field": log.field,
+                "created": log.created,
+                "old_value": log.old_value if convert else _stored(log, "old_value"),
+                "new_value": log.new_value if convert else _stored(log, "new_value"),
+                "extra_data": log.extra_data,
+            }
+
+
+def _stored(log: FieldLog, name: str) -> Any:
+    """Return the value of the ``name`` field of ``log`` as stored, once
+    expanded if a delta."""
+    if name in log.__dict__.get("_unconverted", ()):
+        return log.__dict__[name]
+    return getattr(log, f"raw_{name}")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, cls=ENCODER)
+
+
+def export_logs(
+    logs: QuerySet,
+    stream: IO[str],
+    format: str = FORMAT_JSONL,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    convert: bool = False,
+) -> int:
+    """Write ``logs`` to the text ``stream`` (e.g. opened with
+    ``gzip.open(path, "wt")``) in the given format, and return how many
+    were written.
+
+    JSON Lines files have a JSON object per log; CSV files have a header
+    row, and the JSON of ``old_value``, ``new_value`` and ``extra_data``.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Invalid export format: {format!r}")
+
+    rows = export_rows(logs, chunk_size, convert)
+    count = 0
+
+    if format == FORMAT_JSONL:
+        for row in rows:
+            stream.write(_dumps(row) + "\n")
+            count += 1
+        return count
+
+    writer = csv.DictWriter(stream, COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        for name in ("old_value", "new_value", "extra_data"):
+            row[name] = _dumps(row[name])
+        writer.writerow(row)
+        count += 1
+    return count
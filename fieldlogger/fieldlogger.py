@@ -1,14 +1,39 @@
 """Core logging logic: detect field changes and create ``FieldLog`` records."""
 
 import logging
-from typing import Any, Dict, FrozenSet, Iterable, Optional, Sequence, Set, Type
-
-from django.db import connections, router, transaction
-from django.db.models import Max, Model
+from contextlib import contextmanager
+from copy import deepcopy
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Type,
+)
+
+from django.db import router, transaction
+from django.db.models import Model
 from django.db.models.fields import DecimalField, Field
-
-from .config import get_config
-from .models import Callback, FieldLog
+from django.db.models.fields.files import FieldFile
+
+from .config import (
+    FieldPlan,
+    field_plan,
+    get_config,
+    get_settings,
+    supports_returning_pks,
+)
+from .conversion import native_instance_id_field
+from .deltas import DELTA_ATTR, delta_value, tail_counts
+from .models import Callback, FieldLog, LoggedField
+from .sequences import allocate_pks
+from .snapshots import STATE_ATTR, snapshots_enabled, write_snapshots
+from .writers import hold_async_logs, write_logs
 
 # Logs created in a single operation, keyed by instance pk and field name.
 Logs = Dict[Any, Dict[str, FieldLog]]
@@ -24,54 +49,202 @@ def db_supports_returning_pks(
 
     Backends without this capability need primary keys to be assigned
     manually with ``set_primary_keys`` before calling ``bulk_create``.
+    The answer is cached with the configuration.
     """
-    using = using or router.db_for_write(model_class)
-    return connections[using].features.can_return_rows_from_bulk_insert
+    return supports_returning_pks(model_class, using)
 
 
 def set_primary_keys(
     objs: Sequence[Model], model_class: Type[Model], using: Optional[str] = None
 ) -> None:
-    """Assign sequential primary keys to ``objs`` before a bulk insert.
+    """Assign unused primary keys to ``objs`` before a bulk insert.
 
     Needed on databases that cannot return primary keys from bulk inserts
     (see ``db_supports_returning_pks``). Objects that already have a
-    primary key are left untouched.
-
-    Note that concurrent bulk inserts may compute the same starting key;
-    callers that need concurrency must serialize these operations.
+    primary key are left untouched. Keys come from
+    ``sequences.allocate_pks``, so concurrent callers never collide.
     """
+    objs = [obj for obj in objs if obj.pk is None]
+    if not objs:
+        return
+
     using = using or router.db_for_write(model_class)
-    with transaction.atomic(using=using):
-        next_pk = (
-            model_class.objects.using(using).aggregate(max_pk=Max("pk"))["max_pk"] or 0
-        )
-        for obj in objs:
-            if obj.pk is None:
-                next_pk += 1
-                obj.pk = next_pk
+    for obj, pk in zip(objs, allocate_pks(model_class, len(objs), using)):
+        obj.pk = pk
+
+
+@contextmanager
+def _stored(field_logs: List[FieldLog], using: str) -> Iterator[None]:
+    """Store ``field_logs`` as compact logs and with native instance ids,
+    according to the ``COMPACT_LOGS`` and ``NATIVE_INSTANCE_IDS``
+    settings, and as deltas if they carry one (see
+    ``fieldlogger.deltas``), while they are inserted: their
+    ``stored_values()`` replace their own, which are restored
+    afterwards."""
+    settings = get_settings()
+    compact = settings.get("COMPACT_LOGS", False)
+    native = settings.get("NATIVE_INSTANCE_IDS", False)
+    logged_fields = LoggedField.objects.db_manager(using)
+    replaced = []
+
+    for log in field_logs:
+        if compact:
+            log.logged_field = logged_fields.get_for_names(
+                log.app_label, log.model_name, log.field
+            )
+        if native:
+            native_field = native_instance_id_field(log.app_label, log.model_name)
+            if native_field is not None:
+                native_id = FieldLog._meta.get_field(native_field).to_python(
+                    log.instance_id
+                )
+                setattr(log, native_field, native_id)
+
+        stored = log.stored_values()
+        replaced.append({name: getattr(log, name) for name in stored})
+        for name, value in stored.items():
+            setattr(log, name, value)
+
+    try:
+        yield
+    finally:
+        for log, values in zip(field_logs, replaced):
+            for name, value in values.items():
+                setattr(log, name, value)
+
+
+def _insert_logs(field_logs: List[FieldLog], using: str) -> None:
+    """Insert ``field_logs`` into the ``using`` database with a single
+    ``bulk_create``, stored as configured (see ``_stored``), along with
+    the snapshots they are due (see ``fieldlogger.snapshots``)."""
+    if not db_supports_returning_pks(FieldLog, using):
+        set_primary_keys(field_logs, FieldLog, using)
+
+    with transaction.atomic(using=using, savepoint=False):
+        with _stored(field_logs, using):
+            FieldLog.objects.using(using).bulk_create(field_logs)
+        write_snapshots(field_logs, using)
+
+
+def _state_value(field: Field, value: Any) -> Any:
+    """Normalize a field value like ``_log_fields`` does (e.g. rounding
+    decimals), and copy it so that in-place changes to the
+    instance (e.g. to a JSON dict) do not leak into its stored state."""
+    if isinstance(value, FieldFile):
+        # The name is enough to rebuild it, and avoids copying the instance.
+        return value.name
+    if isinstance(field, DecimalField):
+        return FieldLog.from_db_field(field, value)
+    if isinstance(value, (dict, list, bytearray)):
+        return deepcopy(value)
+    return value
+
+
+def store_state(instance: Model, fields: Optional[Iterable[str]] = None) -> None:
+    """Keep the current values of the logged fields of ``instance`` as its
+    database state, for models with the ``in_memory_state`` option.
+
+    Called when the instance is loaded, refreshed or saved; ``fields``
+    limits the update to those field names. Deferred fields are not
+    stored, so an incomplete state makes ``state_pre_instance`` fall back
+    to a query.
+    """
+    logging_config = get_config().get(instance.__class__)
+    if not logging_config or not logging_config["in_memory_state"]:
+        return
+
+    if fields is not None:
+        fields = set(fields)
+
+    state = instance.__dict__.setdefault("_fieldlogger_state", {})
+    for field in logging_config["logging_fields"]:
+        if fields is not None and not {field.name, field.attname} & fields:
+            continue
+        if field.attname in instance.__dict__:
+            state[field.attname] = _state_value(field, instance.__dict__[field.attname])
+
+
+def snapshot_state(
+    instance: Model,
+    logging_fields: FrozenSet[Field],
+    saved_fields: FrozenSet[Field],
+    pre_instance: Optional[Model] = None,
+) -> Optional[Dict[str, Any]]:
+    """Return the values of the logged fields of ``instance`` to snapshot,
+    by field name, stored like the values of logs (foreign keys by their
+    primary key), or ``None`` if any of them is unknown.
+
+    Only the ``saved_fields`` are read from ``instance``: the others were
+    not written, so their values are read from ``pre_instance``, and are
+    unknown if it is missing or they are deferred on it.
+    """
+    state = {}
+    for field in logging_fields:
+        source = instance if field in saved_fields else pre_instance
+        if source is None or field.attname not in source.__dict__:
+            return None
+        state[field.name] = _state_value(field, source.__dict__[field.attname])
+    return state
+
+
+def state_pre_instance(
+    model_class: Type[Model],
+    instance: Model,
+    logging_fields: FrozenSet[Field],
+    using: Optional[str] = None,
+) -> Optional[Model]:
+    """Build the previous state of ``instance`` from the values stored by
+    ``store_state``, without querying the database.
+
+    The ``logging_fields`` are required, and the other stored fields are
+    loaded too (e.g. for ``snapshot_state``). Returns ``None`` if the
+    state is missing (e.g. the instance was never loaded from the
+    database), incomplete, or belongs to another database.
+    """
+    state = instance.__dict__.get("_fieldlogger_state")
+    if not state or instance._state.db != using:
+        return None
+
+    if not all(field.attname in state for field in logging_fields):
+        return None
+
+    # from_db expects the values in the order of the concrete fields.
+    attnames = [
+        field.attname
+        for field in model_class._meta.concrete_fields
+        if field.attname in state
+    ]
+    return model_class.from_db(using, attnames, [state[name] for name in attnames])
 
 
-def _log_fields(instances: Iterable[Model], logging_fields: FrozenSet[Field]) -> Logs:
-    """Create a ``FieldLog`` for every changed field of every instance.
+def _log_fields(
+    instances: Iterable[Model],
+    plan: FieldPlan,
+    snapshot_fields: Optional[FrozenSet[Field]] = None,
+) -> Logs:
+    """Create a ``FieldLog`` for every changed field of the ``plan`` of
+    every instance.
 
     The previous state of each instance is read from its
     ``_fieldlogger_pre_instance`` attribute; instances without it are
-    considered newly created.
+    considered newly created. If ``snapshot_fields`` is given, the last
+    log of each instance carries the values of those fields, for
+    ``fieldlogger.snapshots``.
     """
     logs: Logs = {}
     field_logs_to_create = []
 
     for instance in instances:
         pre_instance = getattr(instance, "_fieldlogger_pre_instance", None)
+        field_log = None
 
-        for field in logging_fields:
+        for field, get, normalize in plan.entries:
             try:
-                new_value = getattr(instance, field.name)
-                if isinstance(field, DecimalField):
-                    new_value = FieldLog.from_db_field(field, new_value)
+                new_value = get(instance)
+                if normalize is not None:
+                    new_value = normalize(new_value)
 
-                old_value = getattr(pre_instance, field.name) if pre_instance else None
+                old_value = get(pre_instance) if pre_instance else None
 
             except AttributeError:
                 # E.g. a foreign key whose related instance was deleted.
@@ -93,10 +266,13 @@ def _log_fields(instances: Iterable[Model], logging_fields: FrozenSet[Field]) ->
             field_logs_to_create.append(field_log)
             logs.setdefault(instance.pk, {})[field.name] = field_log
 
+        if field_log is not None and snapshot_fields:
+            state = snapshot_state(instance, snapshot_fields, plan.fields, pre_instance)
+            if state is not None:
+                field_log.__dict__[STATE_ATTR] = state
+
     if field_logs_to_create:
-        if not db_supports_returning_pks(FieldLog):
-            set_primary_keys(field_logs_to_create, FieldLog)
-        FieldLog.objects.bulk_create(field_logs_to_create)
+        write_logs(field_logs_to_create, _insert_logs)
 
     return logs
 
@@ -138,23 +314,23 @@ def log_fields(
     if not logging_config:
         return {}
 
-    logging_fields = logging_config["logging_fields"]
-    if update_fields:
-        update_fields = set(update_fields)
-        logging_fields = frozenset(
-            field for field in logging_fields if field.name in update_fields
-        )
+    plan = field_plan(sender, update_fields)
 
-    logs = _log_fields(instances, logging_fields)
+    snapshot_fields = None
+    if snapshots_enabled(sender):
+        snapshot_fields = logging_config["logging_fields"]
 
-    if run_callbacks:
-        _run_callbacks(
-            instances,
-            logging_config["callbacks"],
-            logs,
-            logging_fields,
-            logging_config["fail_silently"],
-        )
+    with hold_async_logs():
+        logs = _log_fields(instances, plan, snapshot_fields)
+
+        if run_callbacks:
+            _run_callbacks(
+                instances,
+                logging_config["callbacks"],
+                logs,
+                plan.fields,
+                logging_config["fail_silently"],
+            )
 
     return logs
 
@@ -186,26 +362,39 @@ def log_m2m_fields(
     old_state: Dict[Any, Set[Any]],
     using: Optional[str] = None,
     run_callbacks: bool = True,
+    new_state: Optional[Dict[Any, Set[Any]]] = None,
 ) -> Logs:
     """Log changes to the many-to-many ``field`` of ``model_class``.
 
     ``old_state`` maps instance pks to the sets of related pks before the
-    change; instances whose current related pks differ get a log holding
-    the old and new pk lists. Returns the created logs like ``log_fields``.
+    change, and ``new_state`` after it; it is read from the through table
+    if not given. Instances whose related pks differ get a log holding the
+    old and new pk lists, stored as a delta between checkpoints with the
+    ``m2m_checkpoint_every`` option (see ``fieldlogger.deltas``). Returns
+    the created logs like ``log_fields``.
     """
     logging_config = get_config().get(model_class)
     if not logging_config or field not in logging_config["logging_m2m_fields"]:
         return {}
 
-    new_state = m2m_pks(field, old_state, using)
+    if new_state is None:
+        new_state = m2m_pks(field, old_state, using)
+
+    changed_pks = [pk for pk, old_pks in old_state.items() if old_pks != new_state[pk]]
+    if not changed_pks:
+        return {}
+
+    checkpoint_every = logging_config["m2m_checkpoint_every"]
+    counts = {}
+    if checkpoint_every is not None:
+        counts = tail_counts(
+            model_class, field, changed_pks, router.db_for_write(FieldLog)
+        )
 
     logs: Logs = {}
     field_logs_to_create = []
-    for instance_pk, old_pks in old_state.items():
-        new_pks = new_state[instance_pk]
-        if old_pks == new_pks:
-            continue
-
+    for instance_pk in changed_pks:
+        old_pks, new_pks = old_state[instance_pk], new_state[instance_pk]
         field_log = FieldLog(
             app_label=model_class._meta.app_label,
             model_name=model_class._meta.model_name,
@@ -214,24 +403,23 @@ def log_m2m_fields(
             old_value=sorted(old_pks),
             new_value=sorted(new_pks),
         )
+        count = counts.get(instance_pk)
+        if count is not None and count + 1 < checkpoint_every:
+            field_log.__dict__[DELTA_ATTR] = delta_value(old_pks, new_pks)
         field_logs_to_create.append(field_log)
         logs.setdefault(instance_pk, {})[field.name] = field_log
 
-    if not field_logs_to_create:
-        return logs
-
-    if not db_supports_returning_pks(FieldLog):
-        set_primary_keys(field_logs_to_create, FieldLog)
-    FieldLog.objects.bulk_create(field_logs_to_create)
-
-    if run_callbacks:
-        instances = model_class._base_manager.using(using).filter(pk__in=list(logs))
-        _run_callbacks(
-            instances,
-            logging_config["callbacks"],
-            logs,
-            frozenset({field}),
-            logging_config["fail_silently"],
-        )
+    with hold_async_logs():
+        write_logs(field_logs_to_create, _insert_logs)
+
+        if run_callbacks:
+            instances = model_class._base_manager.using(using).filter(pk__in=list(logs))
+            _run_callbacks(
+                instances,
+                logging_config["callbacks"],
+                logs,
+                frozenset({field}),
+                logging_config["fail_silently"],
+            )
 
     return logs
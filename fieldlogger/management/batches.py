@@ -0,0 +1,21 @@
+"""Batching of the commands that rewrite existing logs."""
+
+from typing import Iterator, List
+
+from django.db.models import QuerySet
+
+
+def pk_batches(queryset: QuerySet, batch_size: int) -> Iterator[List[int]]:
+    """Yield the primary keys of ``queryset`` in ascending batches of up
+    to ``batch_size``, each read after the previous one is processed."""
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return
+
+        yield pks
+        last_pk = pks[-1]
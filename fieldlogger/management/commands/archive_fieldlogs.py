@@ -0,0 +1,49 @@
+"""Move the logs older than the ``ARCHIVE_DAYS`` setting to compressed
+archives (see ``fieldlogger.archive``)."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from ...archive import DEFAULT_BATCH_SIZE, archive_logs
+from ...config import get_settings
+from ...retention import cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the logs older than the ARCHIVE_DAYS setting to a compressed "
+        "archive per instance, in batches of consecutive primary keys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Primary keys per transaction (default: {DEFAULT_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to archive the logs of.",
+        )
+
+    def handle(self, *args, batch_size, database, verbosity, **options):
+        before = cutoff(get_settings().get("ARCHIVE_DAYS"))
+        if before is None:
+            raise CommandError("Set the ARCHIVE_DAYS setting first.")
+
+        archived = archives = 0
+        for end_pk, batch_archived, batch_archives in archive_logs(
+            before, database, batch_size
+        ):
+            archived += batch_archived
+            archives += batch_archives
+            if verbosity > 1:
+                self.stdout.write(f"Archived {archived} logs up to pk {end_pk}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {archived} logs, creating {archives} archives."
+            )
+        )
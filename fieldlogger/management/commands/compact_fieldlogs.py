@@ -0,0 +1,55 @@
+"""Convert the existing logs to compact logs (see the ``COMPACT_LOGS``
+setting)."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from ...config import get_settings
+from ...models import LOGGED_FIELD_NAMES, FieldLog, LoggedField
+from ..batches import pk_batches
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Reference the logged field of the existing logs by its LoggedField "
+        "row and blank their names, in batches of consecutive primary keys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Logs converted per transaction (default: {DEFAULT_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to convert the logs of.",
+        )
+
+    def handle(self, *args, batch_size, database, verbosity, **options):
+        if not get_settings().get("COMPACT_LOGS", False):
+            # The converted logs would not be found by their names.
+            raise CommandError("Enable the COMPACT_LOGS setting first.")
+
+        logs = FieldLog._base_manager.using(database).filter(logged_field__isnull=True)
+        logged_fields = LoggedField.objects.db_manager(database)
+        converted = 0
+
+        for pks in pk_batches(logs, batch_size):
+            batch = logs.filter(pk__range=(pks[0], pks[-1]))
+            with transaction.atomic(using=database):
+                for names in batch.values_list(*LOGGED_FIELD_NAMES).distinct():
+                    batch.filter(**dict(zip(LOGGED_FIELD_NAMES, names))).update(
+                        logged_field=logged_fields.get_for_names(*names),
+                        **dict.fromkeys(LOGGED_FIELD_NAMES, ""),
+                    )
+
+            converted += len(pks)
+            if verbosity > 1:
+                self.stdout.write(f"Converted {converted} logs up to pk {pks[-1]}")
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} logs."))
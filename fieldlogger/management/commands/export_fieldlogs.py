@@ -0,0 +1,113 @@
+"""Export the logs to a JSON Lines or CSV file, optionally gzip-compressed
+(see ``fieldlogger.export``)."""
+
+import gzip
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from ...export import (
+    DEFAULT_CHUNK_SIZE,
+    FORMAT_JSONL,
+    FORMATS,
+    export_logs,
+    filter_logs,
+)
+from ...models import FieldLog
+
+
+def _parse_time(value: str) -> datetime:
+    """Parse an ISO 8601 date or datetime, in the current time zone if it
+    has none."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = None if day is None else datetime.combine(day, time())
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise CommandError(f"Invalid date or datetime: {value!r}")
+
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the logs to a JSON Lines or CSV file, gzip-compressed if its "
+        "name ends with .gz, streaming them in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            help="File to write the logs to, or - for the standard output.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default=FORMAT_JSONL,
+            help=f"File format (default: {FORMAT_JSONL}).",
+        )
+        parser.add_argument("--app-label", help="Only export the logs of this app.")
+        parser.add_argument("--model-name", help="Only export the logs of this model.")
+        parser.add_argument("--field", help="Only export the logs of this field.")
+        parser.add_argument(
+            "--since",
+            help="Only export the logs from this ISO 8601 date or datetime on.",
+        )
+        parser.add_argument(
+            "--until",
+            help="Only export the logs before this ISO 8601 date or datetime.",
+        )
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the values to the logged field types before encoding.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f"Logs read per database round trip (default: {DEFAULT_CHUNK_SIZE}).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to export the logs from.",
+        )
+
+    def handle(
+        self,
+        *args,
+        output,
+        format,
+        app_label,
+        model_name,
+        field,
+        since,
+        until,
+        convert,
+        chunk_size,
+        database,
+        **options,
+    ):
+        logs = filter_logs(
+            FieldLog.objects.using(database),
+            app_label=app_label,
+            model_name=model_name,
+            field=field,
+            since=None if since is None else _parse_time(since),
+            until=None if until is None else _parse_time(until),
+        )
+
+        if output == "-":
+            export_logs(logs, self.stdout, format, chunk_size, convert)
+        else:
+            opener = gzip.open if output.endswith(".gz") else open
+            with opener(output, "wt", encoding="utf-8", newline="") as stream:
+                count = export_logs(logs, stream, format, chunk_size, convert)
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} logs."))
@@ -0,0 +1,81 @@
+"""Move the instance ids of the existing logs to the native id fields (see
+the ``NATIVE_INSTANCE_IDS`` setting)."""
+
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from ...config import get_settings
+from ...conversion import native_instance_id_field
+from ...models import FieldLog, LoggedField
+from ..batches import pk_batches
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the instance ids of the existing logs of models with integer "
+        "or UUID primary keys in the native id fields, in batches of "
+        "consecutive primary keys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Logs converted per transaction (default: {DEFAULT_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to convert the logs of.",
+        )
+
+    def handle(self, *args, batch_size, database, verbosity, **options):
+        if not get_settings().get("NATIVE_INSTANCE_IDS", False):
+            # The converted logs would not be found by their instance ids.
+            raise CommandError("Enable the NATIVE_INSTANCE_IDS setting first.")
+
+        logs = FieldLog._base_manager.using(database).exclude(instance_id="")
+        logged_fields = LoggedField.objects.db_manager(database)
+        converted = 0
+
+        for pks in pk_batches(logs, batch_size):
+            rows = logs.filter(pk__range=(pks[0], pks[-1])).values_list(
+                "pk", "app_label", "model_name", "logged_field", "instance_id"
+            )
+            # Logs to update by native id field
+            updates = defaultdict(list)
+            for pk, app_label, model_name, logged_field_id, instance_id in rows:
+                if logged_field_id is not None:
+                    logged_field = logged_fields.get_for_id(logged_field_id)
+                    app_label, model_name, _ = logged_field.names
+
+                native_field = native_instance_id_field(app_label, model_name)
+                if native_field is None:
+                    continue
+                try:
+                    native_id = FieldLog._meta.get_field(native_field).to_python(
+                        instance_id
+                    )
+                except ValidationError:
+                    continue
+                updates[native_field].append(
+                    FieldLog(pk=pk, instance_id="", **{native_field: native_id})
+                )
+
+            with transaction.atomic(using=database):
+                for native_field, objs in updates.items():
+                    FieldLog._base_manager.using(database).bulk_update(
+                        objs, [native_field, "instance_id"]
+                    )
+                    converted += len(objs)
+
+            if verbosity > 1:
+                self.stdout.write(f"Converted {converted} logs up to pk {pks[-1]}")
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} logs."))
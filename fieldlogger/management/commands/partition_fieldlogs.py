@@ -0,0 +1,66 @@
+"""Partition the logs by timestamp on PostgreSQL (see the
+``PARTITION_INTERVAL`` setting)."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from ...config import get_settings
+from ...partitions import (
+    DEFAULT_PARTITION_INTERVAL,
+    INTERVAL_MONTH,
+    INTERVAL_WEEK,
+    create_partitions,
+    is_partitioned,
+    setup_partitioning,
+)
+
+DEFAULT_AHEAD = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the partitions of the logs ahead of time on PostgreSQL, "
+        "converting the log table to a partitioned table first with --setup. "
+        "Expired partitions are dropped by prune_fieldlogs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--setup",
+            action="store_true",
+            help="Convert the log table to a partitioned table first.",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=DEFAULT_AHEAD,
+            help=f"Periods to create partitions ahead for (default: {DEFAULT_AHEAD}).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to partition the logs of.",
+        )
+
+    def handle(self, *args, setup, ahead, database, **options):
+        interval = get_settings().get("PARTITION_INTERVAL", DEFAULT_PARTITION_INTERVAL)
+        if interval not in (INTERVAL_MONTH, INTERVAL_WEEK):
+            raise CommandError(f"Invalid PARTITION_INTERVAL value: {interval!r}")
+
+        connection = connections[database]
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning requires PostgreSQL.")
+
+        with transaction.atomic(using=database):
+            partitioned = is_partitioned(connection)
+            if setup and not partitioned:
+                setup_partitioning(connection, interval, timezone.now())
+                self.stdout.write("Partitioned the log table.")
+                partitioned = True
+
+            if not partitioned:
+                raise CommandError("The log table is not partitioned, use --setup.")
+
+            for name in create_partitions(connection, interval, ahead, timezone.now()):
+                self.stdout.write(f"Created partition {name}.")
@@ -0,0 +1,120 @@
+"""Delete the logs older than their retention period (see the
+``RETENTION_DAYS`` setting and the ``retention_days`` option)."""
+
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from ...archive import prune_archives
+from ...deltas import checkpoint_survivors
+from ...models import FieldLog, FieldStateSnapshot
+from ...partitions import drop_partitions, is_partitioned
+from ...retention import (
+    DEFAULT_BATCH_SIZE,
+    delete_expired,
+    expired_logs,
+    retention_cutoffs,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the expired logs in batches of consecutive primary keys, "
+        "each in its own transaction, after dropping the expired "
+        "partitions of a partitioned table, and then the expired archives, "
+        "archived logs and snapshots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f"Primary keys per delete (default: {DEFAULT_BATCH_SIZE}).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to wait between batches, e.g. for replicas to catch up.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=Path,
+            help=(
+                "File to record the progress in, so that an interrupted run "
+                "resumes where it stopped. Removed once done."
+            ),
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to prune the logs of.",
+        )
+
+    def handle(
+        self, *args, batch_size, sleep, checkpoint, database, verbosity, **options
+    ):
+        cutoffs = retention_cutoffs()
+        expired = expired_logs(cutoffs)
+        if expired is None:
+            raise CommandError(
+                "Set the RETENTION_DAYS setting or a retention_days option first."
+            )
+        before, condition = expired
+
+        connection = connections[database]
+        if is_partitioned(connection) and None not in cutoffs.values():
+            # Partitions whose logs are all expired, whatever their model.
+            partitions_before = min(cutoffs.values())
+            with transaction.atomic(using=database):
+                checkpoint_survivors(
+                    FieldLog.objects.using(database).filter(
+                        timestamp__lt=partitions_before
+                    )
+                )
+                for name in drop_partitions(connection, partitions_before):
+                    self.stdout.write(f"Dropped partition {name}.")
+
+        start_pk = None
+        if checkpoint is not None and checkpoint.exists():
+            start_pk = int(checkpoint.read_text())
+            self.stdout.write(f"Resuming from pk {start_pk}.")
+
+        deleted = 0
+        for end_pk, batch_deleted in delete_expired(
+            before, database, batch_size, start_pk, condition
+        ):
+            deleted += batch_deleted
+            if checkpoint is not None:
+                checkpoint.write_text(str(end_pk + 1))
+            if verbosity > 1:
+                self.stdout.write(f"Deleted {deleted} logs up to pk {end_pk}")
+            if sleep:
+                time.sleep(sleep)
+
+        if checkpoint is not None and checkpoint.exists():
+            checkpoint.unlink()
+
+        deleted_archives, trimmed_archives = prune_archives(cutoffs, database)
+        # Snapshots as of an expired log (see fieldlogger.snapshots).
+        snapshots = FieldStateSnapshot.objects.using(database).filter(condition)
+        deleted_snapshots = snapshots._raw_delete(database)
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} logs."))
+        if deleted_archives:
+            self.stdout.write(
+                self.style.SUCCESS(f"Deleted {deleted_archives} archives.")
+            )
+        if trimmed_archives:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Deleted the expired logs of {trimmed_archives} archives."
+                )
+            )
+        if deleted_snapshots:
+            self.stdout.write(
+                self.style.SUCCESS(f"Deleted {deleted_snapshots} snapshots.")
+            )
@@ -1,49 +1,303 @@
-"""Manager that adds field logging to bulk operations."""
+"""Manager and queryset that add field logging to bulk operations."""
 
-from django.db import models
+from copy import copy
+from itertools import islice
 
-from .config import get_config
-from .fieldlogger import db_supports_returning_pks, set_primary_keys
+import django
+from django.db import connections, models, transaction
+from django.db.models import Q, constants
+
+from .config import field_plan, get_config, get_settings
+from .fieldlogger import db_supports_returning_pks, set_primary_keys, store_state
 from .fieldlogger import log_fields as _log_fields
 
+DEFAULT_UPDATE_CHUNK_SIZE = 1000
+
+# Django >= 4.1
+ON_CONFLICT = getattr(constants, "OnConflict", None)
+
+
+def _refresh_state(instance):
+    """Store the values of ``instance``, a copy of a row changed in the
+    database, as its state (see ``store_state``), instead of the state of
+    the row it was copied from, which the copy shares."""
+    instance.__dict__.pop("_fieldlogger_state", None)
+    store_state(instance)
+
+
+def _updated_values(model_class, values):
+    """Return ``values``, passed to ``update()``, by attname, converted
+    to the Python values the updated rows hold."""
+    updated_values = {}
+    for name, value in values.items():
+        field = model_class._meta.get_field(name)
+        if isinstance(value, models.Model):
+            value = getattr(value, field.target_field.attname)
+        updated_values[field.attname] = field.to_python(value)
+    return updated_values
+
+
+class FieldLoggerQuerySet(models.QuerySet):
+    """Logs field changes on ``update()``.
+
+    It accepts two extra keyword arguments: ``log_fields`` to disable
+    logging for the call, and ``run_callbacks`` to skip the configured
+    callbacks.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._log_updates = True
+        # Set by FieldLoggerManager.bulk_create to collect the pks of the
+        # rows actually inserted with ignore_conflicts.
+        self._inserted_pks = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._log_updates = self._log_updates
+        return clone
+
+    def _batched_insert(self, objs, fields, batch_size, *args, **kwargs):
+        # _inserted_pks is only set on Django >= 4.1, whose on_conflict
+        # argument replaced ignore_conflicts.
+        if (
+            self._inserted_pks is None
+            or kwargs.get("on_conflict") != ON_CONFLICT.IGNORE
+        ):
+            return super()._batched_insert(objs, fields, batch_size, *args, **kwargs)
+
+        # INSERT ... ON CONFLICT DO NOTHING RETURNING pk: only the rows that
+        # did not conflict come back.
+        ops = connections[self.db].ops
+        max_batch_size = max(ops.bulk_batch_size(fields, objs), 1)
+        batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+        for start in range(0, len(objs), batch_size):
+            rows = self._insert(
+                objs[start : start + batch_size],
+                fields=fields,
+                using=self.db,
+                returning_fields=[self.model._meta.pk],
+                **kwargs,
+            )
+            # A single row that conflicted comes back as None.
+            self._inserted_pks.update(row[0] for row in rows if row is not None)
+        # The objects already have their pks (see set_primary_keys).
+        return []
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # Implemented with update(); the changes are logged by
+        # FieldLoggerManager.bulk_update instead.
+        queryset = self._chain()
+        queryset._log_updates = False
+        return super(FieldLoggerQuerySet, queryset).bulk_update(
+            objs, fields, *args, **kwargs
+        )
+
+    def update(self, log_fields: bool = True, run_callbacks: bool = True, **kwargs):
+        """Update the matched rows in chunks of consecutive primary keys
+        (the ``UPDATE_CHUNK_SIZE`` setting), logging their changes.
+
+        For each chunk, the logged fields being updated are fetched before
+        the update, and the new values are the given ones; they are only
+        fetched again after the update if any of them is an expression
+        (e.g. ``F("count") + 1``), and converted with ``to_python()``
+        otherwise. All the chunks are updated in one transaction.
+        Callbacks receive instances with only those fields loaded.
+        """
+        logging_config = get_config().get(self.model)
+        if (
+            not (log_fields and self._log_updates)
+            or logging_config is None
+            or self.query.is_sliced
+        ):
+            return super().update(**kwargs)
+
+        plan = field_plan(self.model, kwargs)
+        if not plan.entries:
+            return super().update(**kwargs)
+
+        names = [entry.field.name for entry in plan.entries]
+        expressions = any(
+            hasattr(value, "resolve_expression") for value in kwargs.values()
+        )
+        if not expressions:
+            values = _updated_values(self.model, kwargs)
+        chunk_size = get_settings().get("UPDATE_CHUNK_SIZE", DEFAULT_UPDATE_CHUNK_SIZE)
+        matched = self.order_by("pk").values_list("pk", flat=True)
+        rows = self.model._base_manager.using(self.db)
+
+        updated = 0
+        last_pk = None
+        with transaction.atomic(using=self.db, savepoint=False):
+            while True:
+                if last_pk is not None:
+                    matched = matched.filter(pk__gt=last_pk)
+                pks = list(matched[:chunk_size])
+                if not pks:
+                    return updated
+                last_pk = pks[-1]
 
-class FieldLoggerManager(models.Manager):
-    """Logs field changes on ``bulk_create`` and ``bulk_update``.
+                chunk = rows.filter(pk__in=pks)
+                pre_instances = chunk.only(*names).in_bulk()
+                updated += chunk.update(**kwargs)
 
-    Both methods accept two extra keyword arguments: ``log_fields`` to
-    disable logging for the call, and ``run_callbacks`` to skip the
+                if expressions:
+                    instances = list(chunk.only(*names))
+                else:
+                    instances = []
+                    for pre_instance in pre_instances.values():
+                        instance = copy(pre_instance)
+                        for attname, value in values.items():
+                            setattr(instance, attname, value)
+                        _refresh_state(instance)
+                        instances.append(instance)
+
+                for instance in instances:
+                    instance._fieldlogger_pre_instance = pre_instances.get(instance.pk)
+                _log_fields(
+                    self.model,
+                    instances,
+                    update_fields=kwargs,
+                    run_callbacks=run_callbacks,
+                )
+
+
+class FieldLoggerManager(models.Manager.from_queryset(FieldLoggerQuerySet)):
+    """Logs field changes on ``bulk_create``, ``bulk_update`` and
+    ``update()`` (see ``FieldLoggerQuerySet``).
+
+    Both bulk methods accept two extra keyword arguments: ``log_fields``
+    to disable logging for the call, and ``run_callbacks`` to skip the
     configured callbacks.
     """
 
     def bulk_create(
         self, objs, log_fields: bool = True, run_callbacks: bool = True, **kwargs
     ):
+        ignore_conflicts = kwargs.get("ignore_conflicts", False)
+        update_conflicts = kwargs.get("update_conflicts", False)
+        update_fields = kwargs.get("update_fields") or []
+        returning_pks = db_supports_returning_pks(self.model, using=self.db)
+        queryset = self.get_queryset()
+
+        # Rows that upserted objects conflict with, fetched before they are
+        # updated, by id of the object.
+        conflicting = {}
+        if log_fields and update_conflicts and kwargs.get("unique_fields"):
+            conflicting = self._conflicting_rows(
+                objs,
+                kwargs["unique_fields"],
+                update_fields,
+                kwargs.get("batch_size")
+                or get_settings().get("UPDATE_CHUNK_SIZE", DEFAULT_UPDATE_CHUNK_SIZE),
+            )
+
         # With ignore_conflicts, or on databases that cannot return primary
-        # keys from bulk inserts, pks must be assigned manually so the logs
-        # can reference their instances.
+        # keys from bulk inserts (from upserts before Django 5.0), pks must
+        # be assigned manually so the logs can reference their instances.
         if isinstance(self.model._meta.pk, models.AutoField) and (
-            kwargs.get("ignore_conflicts", False)
-            or not db_supports_returning_pks(self.model, using=self.db)
+            ignore_conflicts
+            or not returning_pks
+            or (update_conflicts and django.VERSION < (5, 0))
         ):
-            set_primary_keys(objs, self.model, using=self.db)
+            set_primary_keys(
+                [obj for obj in objs if id(obj) not in conflicting],
+                self.model,
+                using=self.db,
+            )
+        if log_fields and ignore_conflicts and returning_pks and ON_CONFLICT:
+            queryset._inserted_pks = set()
 
-        res = super().bulk_create(objs, **kwargs)
+        res = queryset.bulk_create(objs, **kwargs)
 
         if log_fields:
-            logged_objs = objs
-            if kwargs.get("ignore_conflicts", False):
+            created = [obj for obj in objs if id(obj) not in conflicting]
+            if ignore_conflicts:
                 # Rows that conflicted were not inserted; do not log them.
-                inserted_pks = set(
-                    self.model._base_manager.using(self.db)
-                    .filter(pk__in=[obj.pk for obj in objs])
-                    .values_list("pk", flat=True)
-                )
-                logged_objs = [obj for obj in objs if obj.pk in inserted_pks]
+                inserted_pks = queryset._inserted_pks
+                if inserted_pks is None:
+                    inserted_pks = set(
+                        self.model._base_manager.using(self.db)
+                        .filter(pk__in=[obj.pk for obj in objs])
+                        .values_list("pk", flat=True)
+                    )
+                created = [obj for obj in objs if obj.pk in inserted_pks]
 
-            _log_fields(self.model, logged_objs, run_callbacks=run_callbacks)
+            _log_fields(self.model, created, run_callbacks=run_callbacks)
+            if conflicting:
+                _log_fields(
+                    self.model,
+                    self._upserted_instances(objs, conflicting, update_fields),
+                    update_fields=update_fields,
+                    run_callbacks=run_callbacks,
+                )
 
         return res
 
+    def _conflicting_rows(self, objs, unique_fields, update_fields, batch_size):
+        """Return the rows that ``objs`` conflict with on ``unique_fields``,
+        by id of the object, with only those and the logged
+        ``update_fields`` loaded, looked up ``batch_size`` objects at a
+        time."""
+        opts = self.model._meta
+        fields = [
+            opts.pk if name == "pk" else opts.get_field(name) for name in unique_fields
+        ]
+        attnames = [field.attname for field in fields]
+
+        objs_by_key = {}
+        for obj in objs:
+            key = tuple(getattr(obj, attname) for attname in attnames)
+            # NULLs never conflict.
+            if None not in key:
+                objs_by_key[key] = obj
+
+        names = [
+            entry.field.name for entry in field_plan(self.model, update_fields).entries
+        ]
+        rows = self.model._base_manager.using(self.db).only(
+            *[field.name for field in fields], *names
+        )
+
+        conflicting = {}
+        keys = iter(objs_by_key)
+        while True:
+            batch = list(islice(keys, batch_size))
+            if not batch:
+                return conflicting
+
+            if len(attnames) == 1:
+                condition = Q((f"{attnames[0]}__in", [key[0] for key in batch]))
+            else:
+                condition = Q()
+                for key in batch:
+                    condition |= Q(*zip(attnames, key))
+
+            for row in rows.filter(condition):
+                key = tuple(getattr(row, attname) for attname in attnames)
+                if key in objs_by_key:
+                    conflicting[id(objs_by_key[key])] = row
+
+    def _upserted_instances(self, objs, conflicting, update_fields):
+        """Return the state of the rows updated by upserting ``objs``: the
+        ``conflicting`` rows with the ``update_fields`` of their objects,
+        which get the pks of the rows."""
+        attnames = [self.model._meta.get_field(name).attname for name in update_fields]
+
+        instances = []
+        for obj in objs:
+            pre_instance = conflicting.get(id(obj))
+            if pre_instance is None:
+                continue
+            obj.pk = pre_instance.pk
+            instance = copy(pre_instance)
+            for attname in attnames:
+                setattr(instance, attname, getattr(obj, attname))
+            _refresh_state(instance)
+            instance._fieldlogger_pre_instance = pre_instance
+            instances.append(instance)
+        return instances
+
     def bulk_update(
         self,
         objs,
@@ -56,24 +310,47 @@ class FieldLoggerManager(models.Manager):
         if not log_fields or logging_config is None:
             return super().bulk_update(objs, fields, **kwargs)
 
-        # Only the logged fields are compared, so only they are fetched.
-        pre_instances = (
-            self.model._base_manager.using(self.db)
-            .only(*(field.name for field in logging_config["logging_fields"]))
-            .in_bulk([obj.pk for obj in objs])
+        # Fetched, compared and logged in chunks, so that memory use does
+        # not grow with the number of objects.
+        chunk_size = kwargs.get("batch_size") or get_settings().get(
+            "UPDATE_CHUNK_SIZE", DEFAULT_UPDATE_CHUNK_SIZE
         )
+        # Only the logged fields being updated are compared, so only they
+        # are fetched.
+        names = [entry.field.name for entry in field_plan(self.model, fields).entries]
+        base_manager = self.model._base_manager.using(self.db)
 
-        res = super().bulk_update(objs, fields, **kwargs)
+        updated = 0
+        objs = iter(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            while True:
+                chunk = list(islice(objs, chunk_size))
+                if not chunk:
+                    return updated
 
-        for obj in objs:
-            obj._fieldlogger_pre_instance = pre_instances.get(obj.pk)
+                pre_instances = {}
+                if names:
+                    pre_instances = base_manager.only(*names).in_bulk(
+                        [obj.pk for obj in chunk]
+                    )
 
-        try:
-            _log_fields(
-                self.model, objs, update_fields=fields, run_callbacks=run_callbacks
-            )
-        finally:
-            for obj in objs:
-                del obj._fieldlogger_pre_instance
+                rows = super().bulk_update(chunk, fields, **kwargs)
+                # Django < 4.0 returns None.
+                updated = None if rows is None else updated + rows
 
-        return res
+                for obj in chunk:
+                    obj._fieldlogger_pre_instance = pre_instances.get(obj.pk)
+                try:
+                    _log_fields(
+                        self.model,
+                        chunk,
+                        update_fields=fields,
+                        run_callbacks=run_callbacks,
+                    )
+                finally:
+                    for obj in chunk:
+                        del obj._fieldlogger_pre_instance
+
+                # The updated values are now the database state.
+                for obj in chunk:
+                    store_state(obj, fields)
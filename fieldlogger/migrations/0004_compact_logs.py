@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fieldlogger', '0003_alter_fieldlog_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoggedField',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=100)),
+                ('model_name', models.CharField(max_length=100)),
+                ('field', models.CharField(max_length=100, verbose_name='field name')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('app_label', 'model_name', 'field'), name='fieldlogger_loggedfield_unique')],
+            },
+        ),
+        migrations.AddField(
+            model_name='fieldlog',
+            name='logged_field',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='fieldlogger.loggedfield'),
+        ),
+        migrations.AddIndex(
+            model_name='fieldlog',
+            index=models.Index(condition=models.Q(('logged_field__isnull', False)), fields=['logged_field', 'instance_id'], name='fieldlogger_compact_idx'),
+        ),
+    ]
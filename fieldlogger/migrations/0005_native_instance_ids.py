@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fieldlogger', '0004_compact_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fieldlog',
+            name='instance_int_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fieldlog',
+            name='instance_uuid',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='fieldlog',
+            index=models.Index(condition=models.Q(('instance_int_id__isnull', False)), fields=['app_label', 'model_name', 'instance_int_id', 'logged_field'], name='fieldlogger_int_instance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fieldlog',
+            index=models.Index(condition=models.Q(('instance_uuid__isnull', False)), fields=['app_label', 'model_name', 'instance_uuid', 'logged_field'], name='fieldlogger_uuid_instance_idx'),
+        ),
+    ]
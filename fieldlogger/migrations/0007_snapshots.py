@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+import fieldlogger.encoding
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fieldlogger', '0006_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FieldStateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=100)),
+                ('model_name', models.CharField(max_length=100)),
+                ('instance_id', models.CharField(max_length=255)),
+                ('last_log_id', models.BigIntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('state', models.JSONField(decoder=fieldlogger.encoding.Decoder, encoder=fieldlogger.encoding.Encoder)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['app_label', 'model_name', 'instance_id', 'last_log_id'], name='fieldlogger_snapshot_idx')],
+            },
+        ),
+    ]
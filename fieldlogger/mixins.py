@@ -1,17 +1,23 @@
 """Mixin that gives logged models easy access to their logs."""
 
+from datetime import datetime
 from functools import cached_property
+from typing import Any, Dict, List
 
 from django.db import models
 
+from .archive import history
+from .fieldlogger import store_state
 from .models import FieldLog
 
 
 class FieldLoggerMixin(models.Model):
-    """Adds a ``fieldlog_set`` property to a logged model.
+    """Adds a ``fieldlog_set`` property to a logged model, a
+    ``fieldlog_history`` property that includes the archived logs, and an
+    ``as_of()`` class method for the values of an instance in the past.
 
-    ``FieldLog`` has no foreign key to the logged models, so this property
-    provides the equivalent of a reverse relation.
+    ``FieldLog`` has no foreign key to the logged models, so
+    ``fieldlog_set`` provides the equivalent of a reverse relation.
     """
 
     @cached_property
@@ -23,5 +29,40 @@ class FieldLoggerMixin(models.Model):
             app_label=self._meta.app_label,
         )
 
+    @property
+    def fieldlog_history(self) -> List[FieldLog]:
+        """All the logs of this instance, archived (see
+        ``fieldlogger.archive``) and live, in order."""
+        return history(self._meta.app_label, self._meta.model_name, self.pk)
+
+    @classmethod
+    def as_of(cls, instance_or_pk: Any, timestamp: datetime) -> Dict[str, Any]:
+        """The values of the logged fields of an instance at ``timestamp``,
+        by field name, see ``FieldLogQuerySet.as_of_many()``."""
+        return FieldLog.objects.as_of(cls, instance_or_pk, timestamp)
+
+    class Meta:
+        abstract = True
+
+
+class FieldLoggerStateMixin(models.Model):
+    """Keeps the values of the logged fields that an instance was loaded
+    with.
+
+    With the ``in_memory_state`` option enabled, saving an instance loaded
+    from the database compares it against these values instead of
+    fetching its previous state with an extra query.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        store_state(instance)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        store_state(self, fields)
+
     class Meta:
         abstract = True
@@ -1,17 +1,17 @@
-"""The ``FieldLog`` model and the ``Callback`` type alias."""
+"""The ``FieldLog``, ``LoggedField``, ``FieldLogArchive`` and
+``FieldStateSnapshot`` models and the ``Callback`` type alias."""
 
-from base64 import b64decode
 from functools import cached_property
-from typing import Any, Callable, Dict, FrozenSet, Optional, Type
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, Type
 
 from django.apps import apps
-from django.core.exceptions import FieldDoesNotExist
-from django.db import models
-from django.utils.functional import SimpleLazyObject
+from django.db import models, transaction
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import gettext_lazy as _
 
+from .conversion import resolve_converters, value_converter
 from .encoding import DECODER, ENCODER
-from .utils import getrmodel
+from .querysets import FieldLogQuerySet
 
 # Fields needed by ``FieldLog.from_db`` to convert raw values; if any of
 # them is deferred, the conversion is skipped.
@@ -27,17 +27,113 @@ _CONVERSION_FIELDS = frozenset(
     ]
 )
 
+# Fields whose values ``FieldLog.from_db`` leaves to be converted on first
+# access.
+_CONVERTED_FIELDS = frozenset(["instance_id", "old_value", "new_value"])
 
-def _fetch_related(field: models.ForeignKey, pk: Any) -> models.Model:
-    """Fetch the related instance of a logged foreign key value.
 
-    If the instance no longer exists, return an unsaved shell instance
-    carrying only the primary key, so reading old logs never fails.
-    """
-    try:
-        return field.related_model._base_manager.get(pk=pk)
-    except field.related_model.DoesNotExist:
-        return field.related_model(pk=pk)
+# Fields of ``FieldLog`` interned in ``LoggedField`` by compact logs.
+LOGGED_FIELD_NAMES = ("app_label", "model_name", "field")
+
+# Fields of ``FieldLog`` that store instance ids natively instead of
+# ``instance_id``.
+NATIVE_INSTANCE_ID_FIELDS = ("instance_int_id", "instance_uuid")
+
+# Attribute of the logs waiting in a buffer or queue to be inserted (see
+# ``fieldlogger.writers``).
+PENDING_ATTR = "_fieldlogger_pending"
+
+
+class LoggedFieldManager(models.Manager):
+    """Caches the ``LoggedField`` rows per database, like the
+    ``ContentType`` manager does; there are few of them and they never
+    change."""
+
+    def __init__(self):
+        super().__init__()
+        # {database: {pk or (app_label, model_name, field): LoggedField}}
+        self._cache: Dict[str, Dict[Any, LoggedField]] = {}
+
+    def _add_to_cache(self, using: str, logged_field: "LoggedField") -> None:
+        cache = self._cache.setdefault(using, {})
+        cache[logged_field.pk] = cache[logged_field.names] = logged_field
+
+    def _cache_on_commit(self, logged_field: "LoggedField") -> None:
+        # Rows read or created in a transaction are only cached once it
+        # commits, so a rollback never leaves a stale pk behind.
+        transaction.on_commit(
+            lambda: self._add_to_cache(self.db, logged_field), using=self.db
+        )
+
+    def get_for_names(
+        self, app_label: str, model_name: str, field: str
+    ) -> "LoggedField":
+        """Return the row of a logged field, creating it if needed."""
+        try:
+            return self._cache[self.db][(app_label, model_name, field)]
+        except KeyError:
+            logged_field, _ = self.get_or_create(
+                app_label=app_label, model_name=model_name, field=field
+            )
+            self._cache_on_commit(logged_field)
+            return logged_field
+
+    def get_for_id(self, pk: int) -> "LoggedField":
+        """Return the row of a logged field by its primary key."""
+        try:
+            return self._cache[self.db][pk]
+        except KeyError:
+            logged_field = self.get(pk=pk)
+            self._cache_on_commit(logged_field)
+            return logged_field
+
+    def ids_for_names(
+        self, app_label: str, model_name: str, field: Optional[str] = None
+    ) -> List[int]:
+        """Return the pks of the logged fields of a model, or of one of
+        them if ``field`` is given, without creating any."""
+        if field is not None:
+            logged_field = self._cache.get(self.db, {}).get(
+                (app_label, model_name, field)
+            )
+            if logged_field is not None:
+                return [logged_field.pk]
+
+        lookups = {"app_label": app_label, "model_name": model_name}
+        if field is not None:
+            lookups["field"] = field
+        return list(self.filter(**lookups).values_list("pk", flat=True))
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+
+class LoggedField(models.Model):
+    """A logged field of a model, referenced by compact logs instead of
+    repeating its names on every ``FieldLog`` row (see the
+    ``COMPACT_LOGS`` setting)."""
+
+    app_label = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100)
+    field = models.CharField(_("field name"), max_length=100)
+
+    objects = LoggedFieldManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["app_label", "model_name", "field"],
+                name="fieldlogger_loggedfield_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.app_label}__{self.model_name}__{self.field}"
+
+    @property
+    def names(self) -> Tuple[str, str, str]:
+        """The ``(app_label, model_name, field)`` of this logged field."""
+        return (self.app_label, self.model_name, self.field)
 
 
 class FieldLog(models.Model):
@@ -56,6 +152,22 @@ class FieldLog(models.Model):
     )
     extra_data = models.JSONField(encoder=ENCODER, decoder=DECODER, default=dict)
     created = models.BooleanField(default=False, editable=False)
+    # Set on compact logs, whose names are left blank (see LoggedField).
+    logged_field = models.ForeignKey(
+        LoggedField,
+        on_delete=models.PROTECT,
+        related_name="+",
+        db_index=False,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    # Set on logs with native instance ids, whose instance_id is left blank.
+    instance_int_id = models.BigIntegerField(null=True, blank=True, editable=False)
+    instance_uuid = models.UUIDField(null=True, blank=True, editable=False)
+
+    objects = FieldLogQuerySet.as_manager()
 
     class Meta:
         indexes = [
@@ -63,6 +175,24 @@ class FieldLog(models.Model):
                 fields=["app_label", "model_name", "instance_id", "field"],
                 name="fieldlogger_instance_idx",
             ),
+            # Partial, so that they cost nothing without compact logs and
+            # native instance ids; compact logs have blank names (see
+            # querysets._storage_q).
+            models.Index(
+                fields=["logged_field", "instance_id"],
+                name="fieldlogger_compact_idx",
+                condition=models.Q(logged_field__isnull=False),
+            ),
+            models.Index(
+                fields=["app_label", "model_name", "instance_int_id", "logged_field"],
+                name="fieldlogger_int_instance_idx",
+                condition=models.Q(instance_int_id__isnull=False),
+            ),
+            models.Index(
+                fields=["app_label", "model_name", "instance_uuid", "logged_field"],
+                name="fieldlogger_uuid_instance_idx",
+                condition=models.Q(instance_uuid__isnull=False),
+            ),
         ]
 
     def __str__(self):
@@ -75,64 +205,114 @@ class FieldLog(models.Model):
     def from_db_field(field: models.Field, value: Any) -> Any:
         """Convert a JSON-decoded ``value`` back to the Python object that
         ``field`` would hold on its model instance."""
-        if isinstance(field, models.BinaryField):
-            if isinstance(value, str):
-                try:
-                    value = b64decode(value)
-                except ValueError:
-                    # Logs written before binary values were base64-encoded.
-                    value = bytes(value, "utf-8")
-        elif isinstance(field, models.DecimalField):
-            if value is not None:
-                value = round(field.to_python(value), field.decimal_places)
-        elif isinstance(field, models.ForeignKey):
-            if not value:
-                return None
-            # Lazy so that loading logs does not query one related
-            # instance per row.
-            return SimpleLazyObject(lambda: _fetch_related(field, value))
-
-        return field.to_python(value)
+        return value_converter(field)(value)
 
     @classmethod
     def from_db(cls, db, field_names, values):
         instance = super().from_db(db, field_names, values)
+        if instance.__dict__.get("logged_field_id") is not None:
+            # A compact log: fill in its blank names.
+            logged_field = LoggedField.objects.db_manager(db).get_for_id(
+                instance.logged_field_id
+            )
+            for name, value in zip(LOGGED_FIELD_NAMES, logged_field.names):
+                if instance.__dict__.get(name) == "":
+                    instance.__dict__[name] = value
+        if instance.__dict__.get("instance_id") == "":
+            # A log with a native instance id.
+            for name in NATIVE_INSTANCE_ID_FIELDS:
+                if instance.__dict__.get(name) is not None:
+                    instance.__dict__["instance_id"] = instance.__dict__[name]
         if _CONVERSION_FIELDS.issubset(field_names):
-            instance._convert_db_values()
+            # Converted on first access, see ``_ConvertedAttribute``.
+            instance._db_values = {
+                name: instance.__dict__[name] for name in _CONVERTED_FIELDS
+            }
+            instance._unconverted = _CONVERTED_FIELDS
         return instance
 
-    def _convert_db_values(self) -> None:
-        """Convert the JSON-decoded values to the Python objects of the
-        logged field.
+    def save(self, *args, **kwargs):
+        if (
+            kwargs.get("update_fields") is not None
+            and self._state.adding
+            and self.__dict__.get(PENDING_ATTR)
+        ):
+            # Not inserted yet: the changes are inserted with the log.
+            return
+        super().save(*args, **kwargs)
+
+    def stored_values(self) -> Dict[str, Any]:
+        """The values that this log is stored with in place of its own, by
+        field name: the blank names of compact logs (see ``LoggedField``),
+        the blank ``instance_id`` of logs with native instance ids, and
+        the values of many-to-many deltas (see ``fieldlogger.deltas``)."""
+        from .deltas import DELTA_ATTR
+
+        stored: Dict[str, Any] = {}
+        if self.logged_field_id is not None:
+            stored.update(dict.fromkeys(LOGGED_FIELD_NAMES, ""))
+        if any(
+            self.__dict__.get(name) is not None for name in NATIVE_INSTANCE_ID_FIELDS
+        ):
+            stored["instance_id"] = ""
+        if DELTA_ATTR in self.__dict__:
+            stored.update(old_value=None, new_value=self.__dict__[DELTA_ATTR])
+        return stored
+
+    def _do_update(self, base_qs, using, pk_val, values, *args, **kwargs):
+        # Saved logs keep the form they are stored in.
+        stored = self.stored_values()
+        values = [
+            (field, model, stored.get(field.name, value))
+            for field, model, value in values
+        ]
+        return super()._do_update(base_qs, using, pk_val, values, *args, **kwargs)
+
+    @property
+    def raw_instance_id(self) -> Any:
+        """``instance_id`` as loaded from the database, without conversion."""
+        db_values = self.__dict__.get("_db_values")
+        return self.instance_id if db_values is None else db_values["instance_id"]
+
+    @property
+    def raw_old_value(self) -> Any:
+        """``old_value`` as decoded from JSON, without conversion."""
+        db_values = self.__dict__.get("_db_values")
+        return self.old_value if db_values is None else db_values["old_value"]
+
+    @property
+    def raw_new_value(self) -> Any:
+        """``new_value`` as decoded from JSON, without conversion."""
+        db_values = self.__dict__.get("_db_values")
+        return self.new_value if db_values is None else db_values["new_value"]
+
+    def _convert_db_value(self, name: str) -> None:
+        """Convert the JSON-decoded value of the ``name`` field (one of
+        ``_CONVERTED_FIELDS``) to the Python object of the logged field.
 
         ``old_value``/``new_value`` are stored as JSON, so on load they are
         converted back using the original model field (e.g. strings become
-        ``Decimal`` or related instances). Logs whose model or field no
-        longer exists are left as decoded JSON.
+        ``Decimal`` or related instances), see ``resolve_converters``.
+        Many-to-many deltas are expanded first, see
+        ``fieldlogger.deltas``.
         """
-        if self.created:
-            # Newly created instances have no previous value.
-            self.old_value = None
+        from .deltas import expand_deltas, is_delta
 
-        try:
-            model_class = apps.get_model(self.app_label, self.model_name)
-        except LookupError:
-            return
+        if name != "instance_id" and is_delta(self):
+            expand_deltas([self])
+        self._unconverted = self._unconverted - {name}
 
-        field_path, _, field_name = self.field.rpartition("__")
-        model_class = getrmodel(model_class, field_path) or model_class
-
-        self.instance_id = model_class._meta.pk.to_python(self.instance_id)
-
-        try:
-            field = model_class._meta.get_field(field_name)
-        except FieldDoesNotExist:
+        if name == "old_value" and self.created:
+            # Newly created instances have no previous value.
+            self.__dict__[name] = None
             return
 
-        if not self.created:
-            self.old_value = self.from_db_field(field, self.old_value)
-
-        self.new_value = self.from_db_field(field, self.new_value)
+        pk_converter, converter = resolve_converters(
+            self.app_label, self.model_name, self.field
+        )
+        if name == "instance_id":
+            converter = pk_converter
+        self.__dict__[name] = converter(self.__dict__[name])
 
     @cached_property
     def model(self) -> Type[models.Model]:
@@ -160,6 +340,88 @@ class FieldLog(models.Model):
         )
 
 
+class _ConvertedAttribute(DeferredAttribute):
+    """Descriptor of the ``_CONVERTED_FIELDS`` of ``FieldLog``, converting
+    the value loaded from the database on first access, so iterating over
+    logs only pays for the values it reads."""
+
+    def __get__(self, instance, cls=None):
+        if instance is not None and self.field.attname in instance.__dict__.get(
+            "_unconverted", ()
+        ):
+            instance._convert_db_value(self.field.attname)
+        return super().__get__(instance, cls)
+
+    def __set__(self, instance, value):
+        unconverted = instance.__dict__.get("_unconverted")
+        if unconverted:
+            instance._unconverted = unconverted - {self.field.attname}
+        instance.__dict__[self.field.attname] = value
+
+
+for _name in _CONVERTED_FIELDS:
+    setattr(FieldLog, _name, _ConvertedAttribute(FieldLog._meta.get_field(_name)))
+
+
+class FieldLogArchive(models.Model):
+    """Logs of an instance moved out of the ``FieldLog`` table into a
+    single compressed blob (see ``fieldlogger.archive``)."""
+
+    app_label = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100)
+    instance_id = models.CharField(max_length=255)
+    first_log_id = models.BigIntegerField()
+    last_log_id = models.BigIntegerField()
+    # Timestamps of the first and last archived logs, for retention.
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    log_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["app_label", "model_name", "instance_id"],
+                name="fieldlogger_archive_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.app_label}__{self.model_name}__{self.instance_id}: "
+            f"{self.log_count} logs up to {self.last_timestamp}"
+        )
+
+
+class FieldStateSnapshot(models.Model):
+    """The values of all the logged fields of an instance as of one of its
+    logs, checkpointed so that its state at a point in time is read from
+    the snapshot and the logs after it (see ``fieldlogger.snapshots``)."""
+
+    app_label = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100)
+    instance_id = models.CharField(max_length=255)
+    # The last log whose value is in the state, and its timestamp.
+    last_log_id = models.BigIntegerField()
+    timestamp = models.DateTimeField()
+    # Stored values by field name, like the new_value of logs.
+    state = models.JSONField(encoder=ENCODER, decoder=DECODER)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["app_label", "model_name", "instance_id", "last_log_id"],
+                name="fieldlogger_snapshot_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.app_label}__{self.model_name}__{self.instance_id}: "
+            f"state as of log {self.last_log_id}"
+        )
+
+
 # Signature of the callback functions run after logging an instance:
 # (instance, logging_fields, logs keyed by field name) -> None
 Callback = Callable[[models.Model, FrozenSet[models.Field], Dict[str, FieldLog]], None]
@@ -0,0 +1,226 @@
+"""Range partitioning of the ``FieldLog`` table by ``timestamp``, on
+PostgreSQL (see the ``partition_fieldlogs`` command).
+
+The table is converted once: the existing table is renamed with the
+``_legacy`` suffix and attached as the partition of every log up to the
+end of the current period. Partitions of the following periods, a month
+or a week each (the ``PARTITION_INTERVAL`` setting), are created ahead
+of time, and dropped whole once expired (see ``fieldlogger.retention``).
+"""
+
+import re
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+from django.utils.dateparse import parse_datetime
+
+from .models import FieldLog, LoggedField
+
+INTERVAL_MONTH = "month"
+INTERVAL_WEEK = "week"
+DEFAULT_PARTITION_INTERVAL = INTERVAL_MONTH
+
+LEGACY_SUFFIX = "_legacy"
+
+# (name, lower bound, upper bound); None bounds are unbounded.
+Partition = Tuple[str, Optional[datetime], Optional[datetime]]
+
+_BOUNDS_RE = re.compile(r"FROM \((?P<lower>[^)]*)\) TO \((?P<upper>[^)]*)\)")
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    """Return the start, in UTC, of the period of ``moment``."""
+    day = moment.astimezone(dt_timezone.utc).date()
+    if interval == INTERVAL_MONTH:
+        day = day.replace(day=1)
+    elif interval == INTERVAL_WEEK:
+        day -= timedelta(days=day.weekday())
+    else:
+        raise ValueError(f"Invalid PARTITION_INTERVAL value: {interval!r}")
+    return datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+
+
+def next_period_start(start: datetime, interval: str) -> datetime:
+    """Return the start of the period after the one starting at ``start``."""
+    if interval == INTERVAL_MONTH:
+        return start.replace(
+            year=start.year + start.month // 12, month=start.month % 12 + 1
+        )
+    return start + timedelta(weeks=1)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{FieldLog._meta.db_table}_p{start:%Y%m%d}"
+
+
+def _parse_bound(bound: str) -> Optional[datetime]:
+    if bound in ("MINVALUE", "MAXVALUE"):
+        return None
+    return parse_datetime(bound.strip("'"))
+
+
+def is_partitioned(connection) -> bool:
+    """Whether the ``FieldLog`` table of ``connection`` is partitioned."""
+    if connection.vendor != "postgresql":
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [FieldLog._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(connection) -> List[Partition]:
+    """Return the partitions of the ``FieldLog`` table, with their bounds."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [FieldLog._meta.db_table],
+        )
+        rows = cursor.fetchall()
+
+    result = []
+    for name, bounds in rows:
+        match = _BOUNDS_RE.search(bounds)
+        if match is None:
+            # The DEFAULT partition.
+            result.append((name, None, None))
+        else:
+            result.append(
+                (name, _parse_bound(match["lower"]), _parse_bound(match["upper"]))
+            )
+    return result
+
+
+def setup_statements(
+    connection, sequence: str, primary_key: str, cutover: datetime
+) -> List[str]:
+    """Return the SQL converting the ``FieldLog`` table to a partitioned
+    table, whose first partition is the existing table, up to
+    ``cutover``, and whose ``primary_key`` constraint is replaced by the
+    one of the partitioned table.
+
+    The ``sequence`` of the existing table would be dropped along with
+    it once its logs expire, so new ids come from a sequence owned by
+    the partitioned table, which carries on from it.
+    """
+    qn = connection.ops.quote_name
+    table = FieldLog._meta.db_table
+    legacy = table + LEGACY_SUFFIX
+    pk = FieldLog._meta.pk.column
+    timestamp = FieldLog._meta.get_field("timestamp").column
+    logged_field = FieldLog._meta.get_field("logged_field")
+    cutover_check = legacy + "_cutover"
+    new_sequence = f"{table}_{pk}_seq"
+    legacy_sequence = new_sequence + LEGACY_SUFFIX
+
+    statements = [
+        f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}",
+        f"ALTER SEQUENCE {sequence} RENAME TO {qn(legacy_sequence)}",
+    ]
+    statements += [
+        f"ALTER INDEX {qn(index.name)} RENAME TO {qn(index.name + LEGACY_SUFFIX)}"
+        for index in FieldLog._meta.indexes
+    ]
+    statements += [
+        # The partition key must be part of the primary key, of the table
+        # and of its partitions.
+        f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(primary_key)}",
+        f"ALTER TABLE {qn(legacy)} ADD PRIMARY KEY ({qn(pk)}, {qn(timestamp)})",
+        f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS "
+        f"INCLUDING CONSTRAINTS) PARTITION BY RANGE ({qn(timestamp)})",
+        f"CREATE SEQUENCE {qn(new_sequence)} OWNED BY {qn(table)}.{qn(pk)}",
+        f"SELECT setval('{qn(new_sequence)}', nextval('{qn(legacy_sequence)}'))",
+        f"ALTER TABLE {qn(table)} ALTER COLUMN {qn(pk)} "
+        f"SET DEFAULT nextval('{qn(new_sequence)}'::regclass)",
+        f"ALTER TABLE {qn(table)} ADD PRIMARY KEY ({qn(pk)}, {qn(timestamp)})",
+        f"ALTER TABLE {qn(table)} ADD FOREIGN KEY ({qn(logged_field.column)}) "
+        f"REFERENCES {qn(LoggedField._meta.db_table)} "
+        f"({qn(LoggedField._meta.pk.column)}) DEFERRABLE INITIALLY DEFERRED",
+        # Proves the bounds of the partition, so that attaching it skips
+        # its own scan of the table. Added after the partitioned table is
+        # created, which would copy it.
+        f"ALTER TABLE {qn(legacy)} ADD CONSTRAINT {qn(cutover_check)} "
+        f"CHECK ({qn(timestamp)} < '{cutover.isoformat()}') NOT VALID",
+        f"ALTER TABLE {qn(legacy)} VALIDATE CONSTRAINT {qn(cutover_check)}",
+    ]
+    for index in FieldLog._meta.indexes:
+        columns = ", ".join(
+            qn(FieldLog._meta.get_field(name).column) for name in index.fields
+        )
+        statements.append(f"CREATE INDEX {qn(index.name)} ON {qn(table)} ({columns})")
+    statements += [
+        f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{cutover.isoformat()}')",
+        # Redundant with the bounds of the partition.
+        f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(cutover_check)}",
+    ]
+    return statements
+
+
+def setup_partitioning(connection, interval: str, now: datetime) -> None:
+    """Convert the ``FieldLog`` table to a partitioned table; the existing
+    logs, and the ones of the current period, stay in the legacy
+    partition."""
+    cutover = next_period_start(period_start(now, interval), interval)
+    table = FieldLog._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, %s), (SELECT conname "
+            "FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p')",
+            [table, FieldLog._meta.pk.column, table],
+        )
+        sequence, primary_key = cursor.fetchone()
+        for statement in setup_statements(connection, sequence, primary_key, cutover):
+            cursor.execute(statement)
+
+
+def create_partitions(
+    connection, interval: str, ahead: int, now: datetime
+) -> List[str]:
+    """Create the partitions of the current period and the ``ahead``
+    following ones that no existing partition overlaps; return their
+    names."""
+    qn = connection.ops.quote_name
+    existing = partitions(connection)
+    created = []
+
+    start = period_start(now, interval)
+    for _ in range(ahead + 1):
+        end = next_period_start(start, interval)
+        overlaps = any(
+            (lower is None or lower < end) and (upper is None or start < upper)
+            for _, lower, upper in existing
+        )
+        if not overlaps:
+            name = partition_name(start)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TABLE {qn(name)} PARTITION OF "
+                    f"{qn(FieldLog._meta.db_table)} FOR VALUES FROM "
+                    f"('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            created.append(name)
+        start = end
+
+    return created
+
+
+def drop_partitions(connection, before: datetime) -> List[str]:
+    """Drop the partitions whose logs are all older than ``before``;
+    return their names."""
+    qn = connection.ops.quote_name
+    dropped = []
+
+    for name, _, upper in partitions(connection):
+        if upper is not None and upper <= before:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+            dropped.append(name)
+
+    return dropped
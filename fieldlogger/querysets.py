@@ -0,0 +1,463 @@
+"""QuerySet of ``FieldLog`` that loads what its logs refer to in batches."""
+
+from collections import defaultdict
+from copy import copy
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type
+from uuid import UUID
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import connections, models
+from django.db.models import Max, OuterRef, Q, Subquery
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Coalesce
+from django.db.models.query import ModelIterable
+
+from .config import get_settings
+from .conversion import native_instance_id_field, resolve_field
+
+# Values of a BigIntegerField.
+_BIGINT = range(-(2**63), 2**63)
+
+# Fields that identify the logged field and instance of a log in the
+# database, whatever the storage mode (see the COMPACT_LOGS and
+# NATIVE_INSTANCE_IDS settings).
+_STORED_LOG_KEY = (
+    "instance_id",
+    "instance_int_id",
+    "instance_uuid",
+    "logged_field",
+    "field",
+)
+
+# The model of a lookup is not known, see _native_lookup.
+_UNKNOWN = object()
+
+# Fills in something for a list of loaded logs, with a constant number of
+# queries.
+Prefetch = Callable[[list], None]
+
+
+def prefetch_values(logs: list) -> None:
+    """Resolve the foreign key values of ``logs`` with one ``in_bulk``
+    query per related model, instead of one query per value on access.
+
+    Like the values resolved one by one, a related instance that no
+    longer exists is replaced by an unsaved shell instance carrying only
+    the primary key.
+    """
+    # (log, "old_value"/"new_value", pk) by related model
+    pending = defaultdict(list)
+    for log in logs:
+        unconverted = log.__dict__.get("_unconverted", ())
+        if not unconverted:
+            continue
+
+        _, field = resolve_field(log.app_label, log.model_name, log.field)
+        if not isinstance(field, models.ForeignKey):
+            continue
+
+        for name in ("old_value", "new_value"):
+            if name not in unconverted or (name == "old_value" and log.created):
+                continue
+            value = log.__dict__[name]
+            if value:
+                pk = field.related_model._meta.pk.to_python(value)
+                pending[field.related_model].append((log, name, pk))
+
+    for related_model, values in pending.items():
+        related = related_model._base_manager.in_bulk({pk for _, _, pk in values})
+        for log, name, pk in values:
+            instance = related.get(pk)
+            setattr(log, name, related_model(pk=pk) if instance is None else instance)
+
+
+def prefetch_instances(logs: list) -> None:
+    """Fetch the logged instances of ``logs`` with one ``in_bulk`` query
+    per model, filling their ``instance`` property.
+
+    Logs of models or instances that no longer exist are left unfilled,
+    so the property still raises on access.
+    """
+    # (log, pk) by model
+    pending = defaultdict(list)
+    for log in logs:
+        try:
+            model_class = apps.get_model(log.app_label, log.model_name)
+        except LookupError:
+            continue
+        pk = model_class._meta.pk.to_python(log.instance_id)
+        pending[model_class].append((log, pk))
+
+    for model_class, values in pending.items():
+        instances = model_class._base_manager.in_bulk({pk for _, pk in values})
+        for log, pk in values:
+            if pk in instances:
+                log.__dict__["instance"] = instances[pk]
+
+
+def prefetch_previous_logs(logs: list) -> None:
+    """Fetch the previous logs of ``logs``, annotated by
+    ``FieldLogQuerySet.prefetch_previous_logs``, with one ``in_bulk``
+    query, filling their ``previous_log`` property."""
+    if not logs:
+        return
+
+    pks = {log._previous_log_pk for log in logs} - {None}
+    previous_logs = type(logs[0]).objects.in_bulk(pks)
+    for log in logs:
+        log.__dict__["previous_log"] = previous_logs.get(log._previous_log_pk)
+
+
+def _native_id(value: Any) -> Tuple[Optional[str], Any]:
+    """Return the field and value that an ``instance_id`` would be stored
+    as natively, or ``(None, None)`` if it cannot be."""
+    if isinstance(value, str):
+        try:
+            number = int(value)
+        except ValueError:
+            number = None
+        if number is not None and str(number) == value:
+            value = number
+        else:
+            try:
+                value = UUID(value)
+            except ValueError:
+                return None, None
+
+    if isinstance(value, UUID):
+        return "instance_uuid", value
+    if isinstance(value, int) and not isinstance(value, bool) and value in _BIGINT:
+        return "instance_int_id", value
+    return None, None
+
+
+def _compact_lookup(lookup: str, value: Any) -> Q:
+    """Make a lookup on the names of the logged field also match compact
+    logs, whose names are blank, through their ``LoggedField`` rows."""
+    from .models import LoggedField
+
+    logged_fields = LoggedField.objects.filter(**{lookup: value}).values("pk")
+    return Q((lookup, value)) | Q(logged_field__in=logged_fields)
+
+
+def _native_lookup(lookup: str, value: Any, native_field: Any = _UNKNOWN) -> Q:
+    """Make an exact or ``in`` lookup on ``instance_id`` match logs with
+    native instance ids, whose ``instance_id`` is blank.
+
+    If the logged model is known (see ``_storage_q``), its logs are
+    looked up by its ``native_field`` alone, which is ``None`` if it
+    stores its instance ids as strings. Otherwise, the lookup matches
+    either column.
+    """
+    if lookup in ("instance_id", "instance_id__exact"):
+        values = [value]
+    elif lookup == "instance_id__in" and isinstance(
+        value, (list, tuple, set, frozenset)
+    ):
+        values = value
+    else:
+        return Q((lookup, value))
+
+    if native_field is None:
+        return Q((lookup, value))
+    if native_field is not _UNKNOWN:
+        from .models import FieldLog
+
+        to_python = FieldLog._meta.get_field(native_field).to_python
+        ids = []
+        for value_ in values:
+            try:
+                ids.append(to_python(value_))
+            except ValidationError:
+                continue
+        return Q((f"{native_field}__in", ids))
+
+    native_ids = defaultdict(list)
+    for value_ in values:
+        native_field, native_id = _native_id(value_)
+        if native_field is not None:
+            native_ids[native_field].append(native_id)
+
+    q = Q((lookup, value))
+    for native_field, ids in native_ids.items():
+        q |= Q((f"{native_field}__in", ids))
+    return q
+
+
+def _exact_names(q: Q) -> Dict[str, str]:
+    """Return the values of the exact lookups on the names of the logged
+    field (``app_label``, ``model_name`` and ``field``) among the children
+    of ``q``, by name, if they must all match."""
+    from .models import LOGGED_FIELD_NAMES
+
+    names = {}
+    if q.connector == Q.AND:
+        for child in q.children:
+            if isinstance(child, Q):
+                continue
+            lookup, value = child
+            name = lookup.split(LOOKUP_SEP, 1)[0]
+            if (
+                name in LOGGED_FIELD_NAMES
+                and lookup in (name, f"{name}__exact")
+                and isinstance(value, str)
+            ):
+                names[name] = value
+    return names
+
+
+def _storage_q(q: Q, compact: bool, native: bool, using: str) -> Q:
+    """Return ``q`` with its lookups matching compact logs and logs with
+    native instance ids, as enabled.
+
+    Where exact lookups on ``app_label`` and ``model_name`` identify the
+    logged model, its compact logs are looked up by the pks of its
+    ``LoggedField`` rows (of the ``field`` if also given), resolved up
+    front, and instead of the lookups on their names; and its logs by its
+    native instance id field (see ``_native_lookup``).
+    """
+    from .models import LOGGED_FIELD_NAMES, LoggedField
+
+    names = _exact_names(q)
+    model_known = {"app_label", "model_name"}.issubset(names)
+    native_field = _UNKNOWN
+    if native and model_known:
+        native_field = native_instance_id_field(names["app_label"], names["model_name"])
+    logged_field_ids = None
+    if compact and model_known:
+        logged_field_ids = LoggedField.objects.db_manager(using).ids_for_names(**names)
+
+    storage_q = copy(q)
+    storage_q.children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            child = _storage_q(child, compact, native, using)
+        else:
+            name = child[0].split(LOOKUP_SEP, 1)[0]
+            if compact and name in LOGGED_FIELD_NAMES:
+                if logged_field_ids is not None and names.get(name) == child[1]:
+                    continue
+                child = _compact_lookup(*child)
+            elif native and name == "instance_id":
+                child = _native_lookup(*child, native_field)
+        storage_q.children.append(child)
+
+    if logged_field_ids is not None:
+        storage_q.children.append(Q(logged_field__in=logged_field_ids))
+        if native_field not in (None, _UNKNOWN):
+            # The blank names of compact logs lead the native id indexes.
+            storage_q.children.append(Q(app_label="", model_name=""))
+    return storage_q
+
+
+class FieldLogQuerySet(models.QuerySet):
+    """Adds batch loading of what the logs refer to, which otherwise
+    takes one query per log:
+
+    -  ``prefetch_values()``: the related instances of foreign key values.
+    -  ``prefetch_instances()``: the logged instances.
+    -  ``prefetch_previous_logs()``: the previous log of each log.
+
+    Like ``prefetch_related``, the batches are loaded when the queryset is
+    evaluated, and not by ``iterator()``.
+
+    ``as_of()`` and ``as_of_many()`` return the values of the logged
+    fields of instances at a point in time.
+
+    Logs of many-to-many fields stored as deltas (see
+    ``fieldlogger.deltas``) are expanded to full lists of related pks when
+    the queryset is evaluated, in batches, and by ``iterator()`` one by
+    one on access.
+
+    With the ``COMPACT_LOGS`` setting, ``filter()`` and ``exclude()``
+    lookups on ``app_label``, ``model_name`` and ``field`` also match
+    compact logs. With ``NATIVE_INSTANCE_IDS``, exact and ``in`` lookups
+    on ``instance_id`` match logs with native instance ids, only them if
+    the model of the logs is known (see ``_native_lookup``).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fieldlog_prefetches: Tuple[Prefetch, ...] = ()
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._fieldlog_prefetches = self._fieldlog_prefetches
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if not fetched and issubclass(self._iterable_class, ModelIterable):
+            from .deltas import expand_deltas
+
+            expand_deltas(self._result_cache)
+            for prefetch in self._fieldlog_prefetches:
+                prefetch(self._result_cache)
+
+    def filter(self, *args, **kwargs):
+        return super().filter(*self._storage_lookups(args, kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return super().exclude(*self._storage_lookups(args, kwargs))
+
+    def _storage_lookups(self, args: tuple, kwargs: dict) -> list:
+        settings = get_settings()
+        compact = settings.get("COMPACT_LOGS", False)
+        native = settings.get("NATIVE_INSTANCE_IDS", False)
+        # Without lookups, e.g. from get() on a sliced queryset, which
+        # Django allows.
+        args = (*args, Q(**kwargs)) if kwargs else args
+        if not (compact or native):
+            return list(args)
+
+        return [
+            _storage_q(arg, compact, native, self.db) if isinstance(arg, Q) else arg
+            for arg in args
+        ]
+
+    def _add_prefetch(self, prefetch: Prefetch) -> "FieldLogQuerySet":
+        clone = self._chain()
+        if prefetch not in clone._fieldlog_prefetches:
+            clone._fieldlog_prefetches += (prefetch,)
+        return clone
+
+    def prefetch_values(self) -> "FieldLogQuerySet":
+        """Resolve the foreign key values of the logs in batches, see
+        ``fieldlogger.querysets.prefetch_values``."""
+        return self._add_prefetch(prefetch_values)
+
+    def prefetch_instances(self) -> "FieldLogQuerySet":
+        """Fetch the logged instances in batches, see
+        ``fieldlogger.querysets.prefetch_instances``."""
+        return self._add_prefetch(prefetch_instances)
+
+    def prefetch_previous_logs(self) -> "FieldLogQuerySet":
+        """Fetch the previous log of each log with a single query.
+
+        The primary key of each previous log is selected along with the
+        logs, by a subquery on the instance index.
+        """
+        previous_logs = self.model._base_manager.filter(
+            app_label=OuterRef("app_label"),
+            model_name=OuterRef("model_name"),
+            instance_id=OuterRef("instance_id"),
+            field=OuterRef("field"),
+            pk__lt=OuterRef("pk"),
+        ).order_by("-pk")
+        if get_settings().get("COMPACT_LOGS", False):
+            # Compact logs have blank names, and the others no logged field.
+            previous_logs = previous_logs.annotate(
+                _logged_field=Coalesce("logged_field", 0)
+            ).filter(_logged_field=Coalesce(OuterRef("logged_field"), 0))
+        if get_settings().get("NATIVE_INSTANCE_IDS", False):
+            # Logs with native instance ids have a blank instance_id; the
+            # other logs have neither native id.
+            previous_logs = previous_logs.filter(
+                Q(instance_int_id=OuterRef("instance_int_id"))
+                | Q(instance_int_id=None, instance_uuid=OuterRef("instance_uuid"))
+                | Q(instance_int_id=None, instance_uuid=None)
+            )
+
+        return self.annotate(
+            _previous_log_pk=Subquery(previous_logs.values("pk")[:1])
+        )._add_prefetch(prefetch_previous_logs)
+
+    def _latest_logs(self, timestamp: datetime) -> "FieldLogQuerySet":
+        """The latest log up to ``timestamp`` of each field of each
+        instance, with ``DISTINCT ON`` where supported (PostgreSQL), and
+        otherwise the greatest primary key of each group.
+
+        Compact and older logs of a field (or logs with and without native
+        instance ids) are grouped apart, so there may be more than one
+        latest log per field.
+        """
+        logs = self.filter(timestamp__lte=timestamp)
+        if connections[self.db].features.can_distinct_on_fields:
+            return logs.order_by(*_STORED_LOG_KEY, "-pk").distinct(*_STORED_LOG_KEY)
+
+        latest_pks = (
+            logs.order_by()
+            .values(*_STORED_LOG_KEY)
+            .annotate(latest_pk=Max("pk"))
+            .values("latest_pk")
+        )
+        return logs.filter(pk__in=Subquery(latest_pks))
+
+    def as_of_many(
+        self,
+        model: Type[models.Model],
+        instances_or_pks: Iterable[Any],
+        timestamp: datetime,
+    ) -> Dict[Any, Dict[str, Any]]:
+        """Return the values of the logged fields of instances of
+        ``model`` at ``timestamp``, by primary key and field name, as
+        logged by the latest log of each field up to then.
+
+        Fields without logs up to then are left out. The logs are fetched
+        with a single query (and the related instances of foreign key
+        values with one query per related model). Archived logs (see
+        ``fieldlogger.archive``) are not taken into account.
+
+        For models with snapshots (see ``fieldlogger.snapshots``), the
+        values start from the latest snapshot of each instance up to
+        then, with all of its fields, and only the logs after it are
+        fetched, with one more query for the snapshots.
+        """
+        from .snapshots import latest_snapshots, snapshot_logs, snapshots_enabled
+
+        pk_field = model._meta.pk
+        pks = [
+            pk_field.to_python(obj.pk if isinstance(obj, models.Model) else obj)
+            for obj in instances_or_pks
+        ]
+        logs = self.filter(
+            app_label=model._meta.app_label,
+            model_name=model._meta.model_name,
+            instance_id__in=pks,
+        )
+
+        snapshots = {}
+        if snapshots_enabled(model):
+            snapshots = latest_snapshots(model, pks, timestamp, self.db)
+        if snapshots:
+            # Logs of snapshotted fields up to the snapshot of their
+            # instance are covered by it.
+            fields = {
+                field for snapshot in snapshots.values() for field in snapshot.state
+            }
+            tail = Q(
+                pk__gt=min(snapshot.last_log_id for snapshot in snapshots.values())
+            ) | ~Q(field__in=fields)
+            others = [pk for pk in pks if pk not in snapshots]
+            if others:
+                tail |= Q(instance_id__in=others)
+            logs = logs.filter(tail)
+
+        latest = [
+            log for snapshot in snapshots.values() for log in snapshot_logs(snapshot)
+        ]
+        for log in logs._latest_logs(timestamp):
+            snapshot = snapshots.get(pk_field.to_python(log.raw_instance_id))
+            if (
+                snapshot is None
+                or log.pk > snapshot.last_log_id
+                or log.field not in snapshot.state
+            ):
+                latest.append(log)
+        prefetch_values(latest)
+
+        values: Dict[Any, Dict[str, Any]] = {pk: {} for pk in pks}
+        for log in sorted(latest, key=lambda log: log.pk):
+            pk = pk_field.to_python(log.raw_instance_id)
+            values[pk][log.field] = log.new_value
+        return values
+
+    def as_of(
+        self, model: Type[models.Model], instance_or_pk: Any, timestamp: datetime
+    ) -> Dict[str, Any]:
+        """Return the values of the logged fields of an instance of
+        ``model`` at ``timestamp``, by field name, see ``as_of_many()``."""
+        return next(iter(self.as_of_many(model, [instance_or_pk], timestamp).values()))
@@ -0,0 +1,139 @@
+"""Deletion of the logs older than their retention period (the
+``RETENTION_DAYS`` setting, and the ``retention_days`` option of the
+apps and models)."""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .config import get_config, get_settings
+from .deltas import checkpoint_survivors
+from .models import FieldLog
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Cutoff of the logs of each model with its own retention, by app label
+# and model name, and of all the other logs under None.
+Cutoffs = Dict[Optional[Tuple[str, str]], Optional[datetime]]
+
+
+def cutoff(
+    retention_days: Optional[int], now: Optional[datetime] = None
+) -> Optional[datetime]:
+    """Return the time before which logs are expired, or ``None`` if they
+    are kept forever."""
+    if retention_days is None:
+        return None
+    return (now or timezone.now()) - timedelta(days=retention_days)
+
+
+def retention_cutoffs(now: Optional[datetime] = None) -> Cutoffs:
+    """Return the cutoffs of the logs, from ``RETENTION_DAYS`` and the
+    ``retention_days`` of the logged models that differ from it."""
+    now = now or timezone.now()
+    default = get_settings().get("RETENTION_DAYS")
+    cutoffs: Cutoffs = {None: cutoff(default, now)}
+
+    for model_class, model_config in get_config().items():
+        days = model_config["retention_days"]
+        if days != default:
+            model = (model_class._meta.app_label, model_class._meta.model_name)
+            cutoffs[model] = cutoff(days, now)
+
+    return cutoffs
+
+
+def expired_logs(
+    cutoffs: Cutoffs, timestamp: str = "timestamp"
+) -> Optional[Tuple[datetime, Q]]:
+    """Return the latest of ``cutoffs`` and the condition matching the
+    logs they expire, by their ``timestamp`` field, or ``None`` if no log
+    expires."""
+    models = [model for model in cutoffs if model is not None]
+    latest = None
+    condition = Q()
+
+    for model, before in cutoffs.items():
+        if before is None:
+            continue
+
+        if model is None:
+            expired = Q((f"{timestamp}__lt", before))
+            for app_label, model_name in models:
+                expired &= ~Q(app_label=app_label, model_name=model_name)
+        else:
+            app_label, model_name = model
+            expired = Q(
+                (f"{timestamp}__lt", before), app_label=app_label, model_name=model_name
+            )
+
+        condition |= expired
+        latest = before if latest is None else max(latest, before)
+
+    return None if latest is None else (latest, condition)
+
+
+def last_pk_before(
+    logs: QuerySet, before: datetime, filters: Optional[Q] = None
+) -> Optional[int]:
+    """Return the greatest primary key of the ``logs`` older than
+    ``before`` (and matching ``filters``), or ``None`` if there are none.
+
+    ``timestamp`` is not indexed, so rather than aggregating over every
+    log, the primary key index is walked down from the newest log until
+    one matches: logs are mostly inserted in timestamp order, so only the
+    logs since ``before`` are read.
+    """
+    return (
+        logs.filter(filters or Q(), timestamp__lt=before)
+        .order_by("-pk")
+        .values_list("pk", flat=True)
+        .first()
+    )
+
+
+def delete_expired(
+    before: datetime,
+    using: str = DEFAULT_DB_ALIAS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    start_pk: Optional[int] = None,
+    filters: Optional[Q] = None,
+) -> Iterator[Tuple[int, int]]:
+    """Delete the logs older than ``before`` (and matching ``filters``) in
+    batches of ``batch_size`` consecutive primary keys, from ``start_pk``
+    on, each batch in its own transaction.
+
+    Yields the last primary key of each batch and the number of logs it
+    deleted. The scan stops at the greatest primary key of the logs to
+    delete, looked up first (see ``last_pk_before``): logs are not always
+    inserted in timestamp order (e.g. by the async writer), so batches
+    without expired logs may come before others with some.
+    """
+    logs = FieldLog.objects.using(using)
+    last_pk = last_pk_before(logs, before, filters)
+    next_pk = start_pk
+
+    while True:
+        batch_start = logs.order_by("pk").values_list("pk", flat=True)
+        if next_pk is not None:
+            batch_start = batch_start.filter(pk__gte=next_pk)
+        batch_start = batch_start.first()
+        if batch_start is None or last_pk is None or batch_start > last_pk:
+            return
+
+        batch = logs.filter(
+            pk__gte=batch_start, pk__lt=batch_start + batch_size, timestamp__lt=before
+        )
+        with transaction.atomic(using=using):
+            expired = batch.filter(filters or Q())
+            checkpoint_survivors(expired)
+            # A single DELETE: the logs are not loaded, and no delete
+            # signals are sent for them.
+            deleted = expired._raw_delete(using)
+
+        yield batch_start + batch_size - 1, deleted
+
+        next_pk = batch_start + batch_size
@@ -0,0 +1,121 @@
+"""Concurrency-safe primary key allocation for bulk inserts.
+
+On databases that cannot return primary keys from bulk inserts, primary
+keys are assigned before inserting. Where possible, they are drawn from
+the sequence the database generates the keys of the table from, so rows
+inserted with generated keys (e.g. with ``save()``) never get them:
+
+- On PostgreSQL, with ``nextval()``, which takes no lock and is not
+  undone by a rollback.
+- On SQLite, by advancing the ``AUTOINCREMENT`` counter of the table in
+  ``sqlite_sequence``; SQLite serializes writers anyway.
+
+Other databases (e.g. MySQL) are not supported: their auto-increment
+counters can only be advanced with ``ALTER TABLE``, which waits for the
+open transactions that wrote to the table, including the caller's own.
+
+Keys of ``FieldLog`` are reserved in blocks of ``PK_BLOCK_SIZE`` and
+handed out from memory until the block runs out (hi/lo allocation), so
+most batches do not touch the sequence at all. Blocks are only kept when
+the database's own sequence was advanced past them and a rollback cannot
+undo their reservation.
+"""
+
+import threading
+from typing import Dict, List, Sequence, Tuple, Type
+
+from django.db import NotSupportedError, connections, transaction
+from django.db.models import Model
+
+from .config import get_settings
+from .models import FieldLog
+
+DEFAULT_PK_BLOCK_SIZE = 100
+
+# Unused keys of the current block, keyed by (model label, database).
+_blocks: Dict[Tuple[str, str], Sequence[int]] = {}
+_lock = threading.Lock()
+
+
+def reserve_pks(model_class: Type[Model], count: int, using: str) -> Sequence[int]:
+    """Reserve ``count`` primary keys for ``model_class`` in the ``using``
+    database (see the module docstring)."""
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        return _next_values(model_class, count, using)
+    if connection.vendor == "sqlite":
+        return _advance_autoincrement(model_class, count, using)
+    raise NotSupportedError(
+        f"Primary keys cannot be reserved on {connection.display_name}, "
+        "which cannot return them from bulk inserts either."
+    )
+
+
+def _next_values(model_class: Type[Model], count: int, using: str) -> List[int]:
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+            "FROM generate_series(1, %s)",
+            [model_class._meta.db_table, model_class._meta.pk.column, count],
+        )
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def _advance_autoincrement(model_class: Type[Model], count: int, using: str) -> range:
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = model_class._meta.db_table
+    max_pk = (
+        f"SELECT COALESCE(MAX({qn(model_class._meta.pk.column)}), 0) FROM {qn(table)}"
+    )
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE sqlite_sequence SET seq = MAX(seq, ({max_pk})) + %s "
+            "WHERE name = %s",
+            [count, table],
+        )
+        if not cursor.rowcount:
+            # The table never had a row.
+            cursor.execute(
+                f"INSERT INTO sqlite_sequence (name, seq) VALUES (%s, ({max_pk}) + %s)",
+                [table, count],
+            )
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+        (end,) = cursor.fetchone()
+
+    return range(end - count + 1, end + 1)
+
+
+def _keeps_blocks(using: str) -> bool:
+    """Whether keys reserved in the ``using`` database can be handed out
+    later, see the module docstring."""
+    connection = connections[using]
+    return connection.vendor == "postgresql" or not connection.in_atomic_block
+
+
+def allocate_pks(model_class: Type[Model], count: int, using: str) -> List[int]:
+    """Return ``count`` unused primary keys for ``model_class`` in the
+    ``using`` database (see the module docstring)."""
+    if model_class is not FieldLog:
+        return list(reserve_pks(model_class, count, using))
+
+    block_size = get_settings().get("PK_BLOCK_SIZE", DEFAULT_PK_BLOCK_SIZE)
+    key = (model_class._meta.label_lower, using)
+
+    with _lock:
+        block = _blocks.get(key, range(0))
+        if len(block) < count:
+            if not _keeps_blocks(using):
+                return list(reserve_pks(model_class, count, using))
+            # The rest of the current block is wasted; keys need not be
+            # contiguous, but a single reservation keeps this O(1).
+            block = reserve_pks(model_class, max(block_size, count), using)
+
+        _blocks[key] = block[count:]
+        return list(block[:count])
+
+
+def reset() -> None:
+    """Forget the blocks reserved by this process."""
+    with _lock:
+        _blocks.clear()
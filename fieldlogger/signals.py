@@ -1,13 +1,28 @@
 """Signal receivers that log field changes on every ``save()``."""
 
 from django.core.signals import setting_changed
-from django.db.models.signals import m2m_changed, post_save, pre_save
-
-from .config import get_config, get_m2m_config, invalidate_config
-from .fieldlogger import log_fields, log_m2m_fields, m2m_pks
-
-
-def pre_save_log_fields(sender, instance, raw=False, using=None, **kwargs):
+from django.db.models.signals import m2m_changed, post_migrate, post_save, pre_save
+
+from . import writers
+from .config import field_plan, get_config, get_m2m_config, invalidate_config
+from .conversion import (
+    native_instance_id_field,
+    resolve_converters,
+    resolve_field,
+)
+from .fieldlogger import (
+    log_fields,
+    log_m2m_fields,
+    m2m_pks,
+    state_pre_instance,
+    store_state,
+)
+from .models import LoggedField
+
+
+def pre_save_log_fields(
+    sender, instance, raw=False, using=None, update_fields=None, **kwargs
+):
     """Stash the current database state of the instance before saving."""
     if raw:
         # Fixture loading; there is nothing to compare against.
@@ -17,12 +32,24 @@ def pre_save_log_fields(sender, instance, raw=False, using=None, **kwargs):
     if logging_config is None or not instance.pk:
         return
 
-    # Only the logged fields are compared, so only they are fetched, from
-    # the same database the instance is being saved to.
+    # Only the logged fields that are saved are compared.
+    logging_fields = field_plan(sender, update_fields).fields
+    if not logging_fields:
+        # Nothing to log (e.g. ``save(update_fields=["last_seen"])``).
+        return
+
+    if logging_config["in_memory_state"]:
+        pre_instance = state_pre_instance(sender, instance, logging_fields, using)
+        if pre_instance is not None:
+            instance._fieldlogger_pre_instance = pre_instance
+            return
+
+    # Only the compared fields are fetched, from the same database the
+    # instance is being saved to.
     instance._fieldlogger_pre_instance = (
         sender._base_manager.using(using)
         .filter(pk=instance.pk)
-        .only(*(field.name for field in logging_config["logging_fields"]))
+        .only(*(field.name for field in logging_fields))
         .first()
     )
 
@@ -38,6 +65,9 @@ def post_save_log_fields(sender, instance, created, update_fields, raw=False, **
     if hasattr(instance, "_fieldlogger_pre_instance"):
         del instance._fieldlogger_pre_instance
 
+    # The saved values are now the database state.
+    store_state(instance, update_fields)
+
 
 def m2m_changed_log_fields(
     sender, instance, action, reverse, model, pk_set, using=None, **kwargs
@@ -45,7 +75,12 @@ def m2m_changed_log_fields(
     """Log changes to the configured many-to-many fields.
 
     Connected to the through model of every configured field; handles
-    changes made from both sides of the relation.
+    changes made from both sides of the relation. The related pks before
+    the change are read from the through table. After ``add()`` and
+    ``remove()``, they are derived from those and ``pk_set``. They are
+    only read again after ``clear()``, and after ``remove()`` through a
+    default manager that filters its objects, since both leave the rows
+    of the objects hidden by that manager.
     """
     m2m_config = get_m2m_config().get(sender)
     if m2m_config is None:
@@ -73,7 +108,26 @@ def m2m_changed_log_fields(
     elif hasattr(instance, "_fieldlogger_pre_m2m"):
         old_state = instance._fieldlogger_pre_m2m
         del instance._fieldlogger_pre_m2m
-        log_m2m_fields(model_class, field, old_state, using=using)
+
+        new_state = None
+        if action == "post_add" or (
+            action == "post_remove"
+            and not model._default_manager.get_queryset()._has_filters()
+        ):
+            # From the reverse side, ``instance`` is the related object
+            # added to or removed from each of the ``pk_set`` instances.
+            if reverse:
+                changed_pks = {instance.pk}
+            else:
+                # remove() passes the given pks unconverted.
+                target = sender._meta.get_field(field.m2m_reverse_field_name())
+                changed_pks = {target.to_python(pk) for pk in pk_set}
+            if action == "post_add":
+                new_state = {pk: pks | changed_pks for pk, pks in old_state.items()}
+            else:
+                new_state = {pk: pks - changed_pks for pk, pks in old_state.items()}
+
+        log_m2m_fields(model_class, field, old_state, using=using, new_state=new_state)
 
 
 def connect_signals():
@@ -92,12 +146,34 @@ def connect_signals():
 
 
 def setting_changed_receiver(sender, setting, **kwargs):
-    """Rebuild the configuration and reconnect the signals when
+    """Rebuild the configuration, clear the ``LoggedField`` cache,
+    reconnect the signals and stop the async writer when
     ``FIELD_LOGGER_SETTINGS`` is overridden (e.g. with
-    ``override_settings`` in tests)."""
+    ``override_settings`` in tests), forget the cached database
+    capabilities when the databases or routers are, and the resolved
+    logged fields when the installed apps are."""
     if setting == "FIELD_LOGGER_SETTINGS":
         invalidate_config()
+        LoggedField.objects.clear_cache()
         connect_signals()
+        # The async writer is restarted with the new settings on next use.
+        writers.shutdown()
+    elif setting in ("DATABASES", "DATABASE_ROUTERS"):
+        # The cached database capabilities may no longer apply.
+        invalidate_config()
+    elif setting == "INSTALLED_APPS":
+        resolve_field.cache_clear()
+        resolve_converters.cache_clear()
+        native_instance_id_field.cache_clear()
 
 
 setting_changed.connect(setting_changed_receiver)
+
+
+def post_migrate_receiver(sender, **kwargs):
+    """Clear the ``LoggedField`` cache after migrations and flushes (e.g.
+    between ``TransactionTestCase`` tests), whose rows may be gone."""
+    LoggedField.objects.clear_cache()
+
+
+post_migrate.connect(post_migrate_receiver)
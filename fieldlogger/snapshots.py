@@ -0,0 +1,187 @@
+"""Snapshots of the logged state of instances (see the ``snapshot_every``
+and ``snapshot_interval`` options).
+
+The values of all the logged fields of an instance are checkpointed in a
+``FieldStateSnapshot`` every so many logs, or so much time, of the
+instance. Snapshots are written together with the logs, in the same
+transaction. The state of an instance at a point in time is then read
+from its latest snapshot up to then and the few logs after it, instead of
+from the latest log of each of its fields.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from django.db.models import Max, Model, Subquery
+
+from .config import get_config
+from .models import FieldLog, FieldStateSnapshot
+
+# Attribute of the last log of each logged save of an instance holding the
+# state of the instance after the save, by field name.
+STATE_ATTR = "_fieldlogger_snapshot_state"
+
+
+def snapshots_enabled(model_class: Type[Model]) -> bool:
+    """Whether the logged state of ``model_class`` instances is
+    snapshotted."""
+    logging_config = get_config().get(model_class)
+    return bool(logging_config) and (
+        logging_config["snapshot_every"] is not None
+        or logging_config["snapshot_interval"] is not None
+    )
+
+
+def _tail_counts(
+    model_class: Type[Model], last_log_ids: Dict[str, int], using: str
+) -> Dict[str, int]:
+    """Return the number of logs after ``last_log_ids``, by instance id."""
+    counts = dict.fromkeys(last_log_ids, 0)
+    if not last_log_ids:
+        return counts
+
+    tail = (
+        FieldLog.objects.using(using)
+        .filter(
+            app_label=model_class._meta.app_label,
+            model_name=model_class._meta.model_name,
+            instance_id__in=list(last_log_ids),
+            pk__gt=min(last_log_ids.values()),
+        )
+        .only("instance_id", "instance_int_id", "instance_uuid")
+    )
+    for log in tail:
+        instance_id = str(log.instance_id)
+        if log.pk > last_log_ids[instance_id]:
+            counts[instance_id] += 1
+    return counts
+
+
+def write_snapshots(field_logs: List[FieldLog], using: str) -> List[FieldStateSnapshot]:
+    """Snapshot the state carried by the inserted ``field_logs`` (see
+    ``STATE_ATTR``) of the instances that are due a snapshot, and return
+    the snapshots.
+
+    An instance is due one if it has no snapshot yet, if its latest
+    snapshot is older than its ``snapshot_interval`` (in seconds), or if
+    it has at least ``snapshot_every`` logs since. Costs a query per
+    model, and another one with ``snapshot_every``.
+    """
+    # The log with the latest state of each instance, by model.
+    states: Dict[Type[Model], Dict[str, FieldLog]] = defaultdict(dict)
+    for log in field_logs:
+        if STATE_ATTR in log.__dict__:
+            states[log.model][str(log.instance_id)] = log
+
+    snapshots = []
+    for model_class, logs in states.items():
+        logging_config = get_config()[model_class]
+        every = logging_config["snapshot_every"]
+        interval = logging_config["snapshot_interval"]
+
+        latest = {
+            row["instance_id"]: row
+            for row in FieldStateSnapshot.objects.using(using)
+            .filter(
+                app_label=model_class._meta.app_label,
+                model_name=model_class._meta.model_name,
+                instance_id__in=list(logs),
+            )
+            .values("instance_id")
+            .annotate(last_log_id=Max("last_log_id"), timestamp=Max("timestamp"))
+        }
+
+        due = set(logs) - set(latest)
+        if interval is not None:
+            due.update(
+                instance_id
+                for instance_id, row in latest.items()
+                if logs[instance_id].timestamp - row["timestamp"]
+                >= timedelta(seconds=interval)
+            )
+        if every is not None:
+            last_log_ids = {
+                instance_id: row["last_log_id"]
+                for instance_id, row in latest.items()
+                if instance_id not in due
+            }
+            due.update(
+                instance_id
+                for instance_id, count in _tail_counts(
+                    model_class, last_log_ids, using
+                ).items()
+                if count >= every
+            )
+
+        snapshots += [
+            FieldStateSnapshot(
+                app_label=model_class._meta.app_label,
+                model_name=model_class._meta.model_name,
+                instance_id=instance_id,
+                last_log_id=log.pk,
+                timestamp=log.timestamp,
+                state=log.__dict__[STATE_ATTR],
+            )
+            for instance_id, log in logs.items()
+            if instance_id in due
+        ]
+
+    return FieldStateSnapshot.objects.using(using).bulk_create(snapshots)
+
+
+def latest_snapshots(
+    model_class: Type[Model],
+    pks: Iterable[Any],
+    timestamp: datetime,
+    using: Optional[str] = None,
+) -> Dict[Any, FieldStateSnapshot]:
+    """Return the latest snapshot up to ``timestamp`` of each of the
+    instances of ``model_class`` with the given primary keys that has
+    one, by primary key, with a single query."""
+    snapshots = FieldStateSnapshot.objects.using(using).filter(
+        app_label=model_class._meta.app_label,
+        model_name=model_class._meta.model_name,
+        instance_id__in=[str(pk) for pk in pks],
+        timestamp__lte=timestamp,
+    )
+    latest_log_ids = (
+        snapshots.order_by()
+        .values("instance_id")
+        .annotate(latest_log_id=Max("last_log_id"))
+        .values("latest_log_id")
+    )
+
+    pk_field = model_class._meta.pk
+    return {
+        pk_field.to_python(snapshot.instance_id): snapshot
+        for snapshot in snapshots.filter(last_log_id__in=Subquery(latest_log_ids))
+    }
+
+
+def snapshot_logs(snapshot: FieldStateSnapshot) -> List[FieldLog]:
+    """Return the state of ``snapshot`` as unsaved logs of each field, with
+    the primary key of its last log, loaded like logs read from the
+    ``FieldLog`` table: their values are converted on first access."""
+    attnames = [field.attname for field in FieldLog._meta.concrete_fields]
+
+    logs = []
+    for field, value in snapshot.state.items():
+        values: Dict[str, Any] = dict.fromkeys(attnames)
+        values.update(
+            id=snapshot.last_log_id,
+            app_label=snapshot.app_label,
+            model_name=snapshot.model_name,
+            instance_id=snapshot.instance_id,
+            field=field,
+            timestamp=snapshot.timestamp,
+            new_value=value,
+            extra_data={},
+            created=False,
+        )
+        logs.append(
+            FieldLog.from_db(
+                snapshot._state.db, attnames, [values[name] for name in attnames]
+            )
+        )
+    return logs
@@ -0,0 +1,366 @@
+"""Writing of ``FieldLog`` records.
+
+Logs are inserted as soon as they are created, unless:
+
+-  the ``BUFFER_LOGS`` setting is enabled: then the logs created inside a
+   transaction are kept in a per-database buffer and inserted with a
+   single ``bulk_create`` when the transaction commits, or discarded if
+   it is rolled back.
+-  the ``ASYNC_LOGS`` setting is enabled: then the logs are handed to a
+   background thread that inserts them in batches (after the current
+   transaction commits, if any, and after the callbacks that receive
+   them have run, see ``hold_async_logs``).
+"""
+
+import atexit
+import logging
+import queue
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from copy import copy
+from time import monotonic
+from typing import Callable, Dict, Iterator, List, Optional
+
+from django.db import connections, router
+
+from .config import get_settings
+from .models import PENDING_ATTR, FieldLog
+
+# Inserts a list of logs into the given database.
+Insert = Callable[[List[FieldLog], str], None]
+
+DEFAULT_BUFFER_MAX_SIZE = 1000
+DEFAULT_ASYNC_QUEUE_SIZE = 10000
+DEFAULT_ASYNC_BATCH_SIZE = 500
+DEFAULT_ASYNC_FLUSH_INTERVAL = 1.0
+
+# What to do with new logs while the queue of the async writer is full.
+ON_FULL_BLOCK = "block"
+ON_FULL_DROP = "drop"
+ON_FULL_SYNC = "sync"
+
+logger = logging.getLogger(__name__)
+
+# Buffers are per connection, and connections are per thread.
+_local = threading.local()
+
+
+# Entries of ``connection.run_on_commit`` are ``(sids, func, ...)`` tuples;
+# callbacks are compared with ``==`` since bound methods are created anew
+# on every attribute access.
+
+
+def _move_to_end(using: str, func: Callable) -> None:
+    """Move the queued on-commit callback ``func`` of the ``using``
+    connection to the end of the queue, so it runs after every callback
+    registered so far."""
+    run_on_commit = connections[using].run_on_commit
+    for index, entry in enumerate(run_on_commit):
+        if entry[1] == func:
+            run_on_commit.append(run_on_commit.pop(index))
+            return
+
+
+def _is_queued(using: str, func: Callable) -> bool:
+    """Whether ``func`` is still queued to run on commit, i.e. it was not
+    discarded by a rollback."""
+    return any(entry[1] == func for entry in connections[using].run_on_commit)
+
+
+class _Chunk:
+    """The logs of one operation, registered as an on-commit callback of
+    its own so that Django discards it if its savepoint is rolled back."""
+
+    __slots__ = ("logs", "committed")
+
+    def __init__(self, logs: List[FieldLog]):
+        self.logs = logs
+        self.committed = False
+
+    def __call__(self) -> None:
+        self.committed = True
+
+
+class _TransactionBuffer:
+    """Logs created in the current transaction of a database.
+
+    Its ``flush`` is kept as the last on-commit callback, so by the time
+    it runs every chunk that survived the transaction is committed.
+    """
+
+    def __init__(self, using: str, insert: Insert):
+        self.using = using
+        self.insert = insert
+        self.chunks: List[_Chunk] = []
+
+    def add(self, logs: List[FieldLog], max_size: Optional[int]) -> None:
+        chunk = _Chunk(logs)
+        connections[self.using].on_commit(chunk)
+        _move_to_end(self.using, self.flush)
+        self.chunks.append(chunk)
+
+        if max_size and sum(len(chunk.logs) for chunk in self.chunks) >= max_size:
+            # Chunks of rolled back savepoints are no longer queued. The
+            # rest are inserted now, within the transaction, so a later
+            # rollback still discards them.
+            chunks = [c for c in self.chunks if _is_queued(self.using, c)]
+            self.chunks = []
+            logs = [log for chunk in chunks for log in chunk.logs]
+            _insert_unsaved(logs, self.using, self.insert)
+
+    def flush(self) -> None:
+        if _buffers().get(self.using) is self:
+            del _buffers()[self.using]
+
+        logs = [log for chunk in self.chunks if chunk.committed for log in chunk.logs]
+        self.chunks = []
+        _insert_unsaved(logs, self.using, self.insert)
+
+
+def _buffers() -> Dict[str, _TransactionBuffer]:
+    if not hasattr(_local, "buffers"):
+        _local.buffers = {}
+    return _local.buffers
+
+
+def _buffer(using: str, insert: Insert) -> _TransactionBuffer:
+    """Return the buffer of the current transaction of ``using``, replacing
+    the buffer of a transaction that was rolled back."""
+    buffer = _buffers().get(using)
+    if buffer is None or not _is_queued(using, buffer.flush):
+        buffer = _buffers()[using] = _TransactionBuffer(using, insert)
+        connections[using].on_commit(buffer.flush)
+
+    return buffer
+
+
+def _insert_unsaved(logs: List[FieldLog], using: str, insert: Insert) -> None:
+    """Insert the ``logs`` not saved yet by other means (e.g. by a
+    callback)."""
+    logs = [log for log in logs if log._state.adding]
+    if logs:
+        insert(logs, using)
+
+
+def _handed_over(logs: List[FieldLog]) -> List[FieldLog]:
+    """Copies of the ``logs`` not saved yet by other means, for another
+    thread to insert: storing them (see ``fieldlogger._stored``) changes
+    them while they are inserted, and the caller may still read them."""
+    copies = []
+    for log in logs:
+        if log._state.adding:
+            # Later saves of the original no longer reach the insert.
+            log.__dict__.pop(PENDING_ATTR, None)
+            copies.append(copy(log))
+    return copies
+
+
+# Queue markers: write the pending batch now / and then stop.
+_FLUSH = object()
+_STOP = object()
+
+
+class AsyncWriter:
+    """Inserts logs from a background thread, fed through a bounded queue.
+
+    Logs are inserted in batches of up to ``batch_size`` logs per database,
+    at least every ``flush_interval`` seconds. While the queue is full,
+    ``on_full`` decides whether new logs block the caller, are dropped, or
+    are inserted synchronously.
+    """
+
+    def __init__(
+        self,
+        insert: Insert,
+        queue_size: int = DEFAULT_ASYNC_QUEUE_SIZE,
+        batch_size: int = DEFAULT_ASYNC_BATCH_SIZE,
+        flush_interval: float = DEFAULT_ASYNC_FLUSH_INTERVAL,
+        on_full: str = ON_FULL_BLOCK,
+    ):
+        if on_full not in (ON_FULL_BLOCK, ON_FULL_DROP, ON_FULL_SYNC):
+            raise ValueError(f"Invalid ASYNC_ON_FULL value: {on_full!r}")
+
+        self.insert = insert
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name="fieldlogger-writer", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, logs: List[FieldLog], using: str) -> None:
+        """Queue copies of ``logs`` to be inserted into the ``using``
+        database; the logs themselves are left untouched."""
+        if self.on_full == ON_FULL_BLOCK:
+            self._queue.put((_handed_over(logs), using))
+            return
+
+        try:
+            self._queue.put_nowait((_handed_over(logs), using))
+        except queue.Full:
+            if self.on_full == ON_FULL_SYNC:
+                _insert_unsaved(logs, using, self.insert)
+            else:
+                logger.warning(
+                    "Field logger queue is full, dropping %d logs", len(logs)
+                )
+
+    def flush(self) -> None:
+        """Block until every queued log has been inserted."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def stop(self) -> None:
+        """Insert every queued log and stop the thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _write(self, batch: Dict[str, List[FieldLog]]) -> None:
+        for using, logs in batch.items():
+            try:
+                _insert_unsaved(logs, using, self.insert)
+            except Exception:
+                logger.exception("Field logger failed to insert %d logs", len(logs))
+        batch.clear()
+
+    def _run(self) -> None:
+        batch: Dict[str, List[FieldLog]] = defaultdict(list)
+        # Queue items taken but not inserted yet, marked done once they are.
+        pending = 0
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+            else:
+                pending += 1
+
+            if isinstance(item, tuple):
+                logs, using = item
+                batch[using] += logs
+                if deadline is None:
+                    deadline = monotonic() + self.flush_interval
+                if len(batch[using]) < self.batch_size:
+                    continue
+
+            self._write(batch)
+            for _ in range(pending):
+                self._queue.task_done()
+            pending = 0
+            deadline = None
+
+            if item is _STOP:
+                # The connections of this thread are not reused.
+                connections.close_all()
+                return
+
+
+_writer: Optional[AsyncWriter] = None
+_writer_lock = threading.Lock()
+
+
+def _async_writer(settings: dict, insert: Insert) -> AsyncWriter:
+    """Return the async writer, starting it on first use."""
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = AsyncWriter(
+                insert,
+                queue_size=settings.get("ASYNC_QUEUE_SIZE", DEFAULT_ASYNC_QUEUE_SIZE),
+                batch_size=settings.get("ASYNC_BATCH_SIZE", DEFAULT_ASYNC_BATCH_SIZE),
+                flush_interval=settings.get(
+                    "ASYNC_FLUSH_INTERVAL", DEFAULT_ASYNC_FLUSH_INTERVAL
+                ),
+                on_full=settings.get("ASYNC_ON_FULL", ON_FULL_BLOCK),
+            )
+
+    return _writer
+
+
+def flush() -> None:
+    """Block until every log queued for the async writer is inserted.
+
+    Useful in tests and management commands that read the logs they
+    produce. Does nothing if the async writer is not running.
+    """
+    if _writer is not None:
+        _writer.flush()
+
+
+def shutdown() -> None:
+    """Insert every queued log and stop the async writer; it is started
+    again on next use. Called on exit and when the settings change."""
+    global _writer
+
+    with _writer_lock:
+        writer, _writer = _writer, None
+
+    if writer is not None:
+        writer.stop()
+
+
+atexit.register(shutdown)
+
+
+@contextmanager
+def hold_async_logs() -> Iterator[None]:
+    """Hand the logs written outside of transactions within the block to
+    the async writer only when it exits, e.g. once the callbacks that
+    receive them, and may change or save them, have run."""
+    if hasattr(_local, "held"):
+        # Released by the outermost block.
+        yield
+        return
+
+    _local.held = []
+    try:
+        yield
+    finally:
+        held = _local.held
+        del _local.held
+        for writer, logs, using in held:
+            writer.put(logs, using)
+
+
+def write_logs(logs: List[FieldLog], insert: Insert) -> None:
+    """Write ``logs`` with ``insert``, now, when the current transaction
+    commits, or from the async writer (see the module docstring)."""
+    settings = get_settings()
+    using = router.db_for_write(FieldLog)
+    connection = connections[using]
+
+    if settings.get("ASYNC_LOGS", False) or (
+        settings.get("BUFFER_LOGS", False) and connection.in_atomic_block
+    ):
+        # Saving them with update_fields (e.g. from a callback) before
+        # they are inserted is merged into their insert.
+        for log in logs:
+            log.__dict__[PENDING_ATTR] = True
+
+    if settings.get("ASYNC_LOGS", False):
+        writer = _async_writer(settings, insert)
+        if not connection.in_atomic_block:
+            if hasattr(_local, "held"):
+                _local.held.append((writer, logs, using))
+            else:
+                writer.put(logs, using)
+        elif settings.get("BUFFER_LOGS", False):
+            # No early inserts: the writer cannot insert within the
+            # transaction.
+            _buffer(using, lambda logs, using: writer.put(logs, using)).add(logs, None)
+        else:
+            connection.on_commit(lambda: writer.put(logs, using))
+
+    elif settings.get("BUFFER_LOGS", False) and connection.in_atomic_block:
+        max_size = settings.get("BUFFER_MAX_SIZE", DEFAULT_BUFFER_MAX_SIZE)
+        _buffer(using, insert).add(logs, max_size)
+
+    else:
+        _insert_unsaved(logs, using, insert)
@@ -3,6 +3,8 @@ from copy import deepcopy
 import pytest
 from django.conf import settings
 
+from fieldlogger import sequences
+
 from .helpers import refresh_config
 
 ORIGINAL_SETTINGS = deepcopy(settings.FIELD_LOGGER_SETTINGS)
@@ -13,3 +15,12 @@ def restore_settings():
     yield
     settings.FIELD_LOGGER_SETTINGS = deepcopy(ORIGINAL_SETTINGS)
     refresh_config()
+
+
+@pytest.fixture
+def reset_pk_blocks():
+    """Forget the primary key blocks reserved in previous tests, whose
+    sequence rows were flushed."""
+    sequences.reset()
+    yield
+    sequences.reset()
@@ -5,6 +5,7 @@ from uuid import UUID
 
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import connection
 from django.utils import timezone
 
 from fieldlogger import config, signals
@@ -134,3 +135,50 @@ def check_logs(instance, expected_count, callbacks_ran=True, created=False):
 def bulk_check_logs(instances, expected_count, callbacks_ran=True, created=False):
     for instance in instances:
         check_logs(instance, expected_count, callbacks_ran, created)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, params=None):
+        self.connection.executed.append(sql)
+        self.sql = sql
+        self.params = params
+
+    def fetchone(self):
+        if "pg_partitioned_table" in self.sql:
+            return (1,) if self.connection.partitioned else None
+        return ("fieldlogger_fieldlog_id_seq", "fieldlogger_fieldlog_pkey")
+
+    def fetchall(self):
+        if "nextval" in self.sql:
+            return [(pk,) for pk in range(1, self.params[-1] + 1)]
+        return self.connection.partition_rows
+
+
+class FakePostgresConnection:
+    """Records the SQL run on it, answering the catalog queries of
+    ``fieldlogger.partitions`` from its attributes, and ``nextval()`` with
+    keys from 1."""
+
+    vendor = "postgresql"
+    ops = connection.ops
+
+    def __init__(self, partitioned=False, partition_rows=()):
+        self.partitioned = partitioned
+        self.partition_rows = list(partition_rows)
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def bound(start, end):
+    return f"FOR VALUES FROM ({start}) TO ({end})"
@@ -0,0 +1,197 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from fieldlogger.archive import archive_logs, archived_logs, history
+from fieldlogger.models import FieldLog, FieldLogArchive
+from fieldlogger.retention import cutoff
+
+from .testapp.models import TestModel, TestModelRelated
+
+
+def age_logs(logs, days):
+    logs.update(timestamp=timezone.now() - timedelta(days=days))
+
+
+@pytest.fixture
+def instances():
+    """Two instances with logs 100 days old, and one more recent change
+    of the first one."""
+    related = TestModelRelated.objects.create()
+    instances = [
+        TestModel.objects.create(
+            test_char_field=str(i),
+            test_decimal_field=Decimal("1.5"),
+            test_related_field=related,
+        )
+        for i in range(2)
+    ]
+    age_logs(FieldLog.objects.all(), 100)
+
+    instances[0].test_char_field = "changed"
+    instances[0].save()
+    return instances
+
+
+@pytest.fixture
+def archive_days(settings):
+    settings.FIELD_LOGGER_SETTINGS = {
+        **settings.FIELD_LOGGER_SETTINGS,
+        "ARCHIVE_DAYS": 90,
+    }
+
+
+@pytest.mark.django_db
+class TestArchiveLogs:
+    def test_old_logs_are_archived_per_instance(self, instances):
+        old_logs = list(
+            instances[0].fieldlog_set.filter(timestamp__lt=cutoff(90)).order_by("pk")
+        )
+        archived = FieldLog.objects.filter(timestamp__lt=cutoff(90)).count()
+        live_count = FieldLog.objects.count()
+
+        batches = list(archive_logs(cutoff(90)))
+
+        assert sum(batch[1] for batch in batches) == archived
+        assert FieldLog.objects.count() == live_count - archived
+        assert not FieldLog.objects.filter(timestamp__lt=cutoff(90)).exists()
+        archive = FieldLogArchive.objects.get(instance_id=str(instances[0].pk))
+        assert archive.log_count == len(old_logs)
+        assert archive.first_log_id == old_logs[0].pk
+        assert archive.last_log_id == old_logs[-1].pk
+        assert str(archive).startswith(f"testapp__testmodel__{instances[0].pk}: ")
+
+    def test_archived_logs_are_converted_on_access(self, instances):
+        list(archive_logs(cutoff(90)))
+
+        logs = {
+            log.field: log
+            for log in archived_logs("testapp", "testmodel", instances[1].pk)
+        }
+
+        log = logs["test_decimal_field"]
+        assert log._unconverted
+        assert log.new_value == Decimal("1.5")
+        assert log.instance_id == instances[1].pk
+        assert log.timestamp < cutoff(90)
+        assert log.created
+        assert logs["test_related_field"].new_value == instances[1].test_related_field
+
+    def test_history_merges_archived_and_live_logs(self, instances):
+        expected = list(instances[0].fieldlog_set.order_by("pk"))
+        list(archive_logs(cutoff(90), batch_size=2))
+
+        # One archive per instance, whatever the batches.
+        assert FieldLogArchive.objects.count() == 2
+        assert instances[0].fieldlog_history == expected
+        assert [
+            log.new_value
+            for log in history(
+                "testapp", "testmodel", instances[0].pk, field="test_char_field"
+            )
+        ] == ["0", "changed"]
+
+    def test_recent_logs_are_left(self, instances):
+        assert list(archive_logs(cutoff(200))) == []
+        assert not FieldLogArchive.objects.exists()
+
+    def test_batches_without_old_logs_are_skipped(self, instances):
+        """Logs are not always inserted in timestamp order."""
+        old = TestModel.objects.create(test_char_field="old")
+        age_logs(old.fieldlog_set.all(), 100)
+        live_count = FieldLog.objects.filter(timestamp__gte=cutoff(90)).count()
+
+        batches = list(archive_logs(cutoff(90), batch_size=1))
+
+        assert 0 in [batch[1] for batch in batches]
+        assert FieldLog.objects.count() == live_count
+        assert FieldLogArchive.objects.count() == 3
+
+    def test_later_runs_merge_into_the_archive(self, instances):
+        expected = list(instances[0].fieldlog_set.order_by("pk"))
+        assert [batch[2] for batch in archive_logs(cutoff(90))] == [2]
+        recent_count = instances[0].fieldlog_set.count()
+        age_logs(instances[0].fieldlog_set.all(), 95)
+
+        assert [batch[1:] for batch in archive_logs(cutoff(90))] == [(recent_count, 0)]
+
+        archive = FieldLogArchive.objects.get(instance_id=str(instances[0].pk))
+        assert archive.log_count == len(expected)
+        assert archive.last_log_id == expected[-1].pk
+        assert archive.first_timestamp < archive.last_timestamp
+        assert instances[0].fieldlog_history == expected
+
+    def test_empty_table(self):
+        assert list(archive_logs(timezone.now())) == []
+
+
+@pytest.mark.django_db
+class TestArchiveFieldlogsCommand:
+    @pytest.mark.usefixtures("archive_days")
+    def test_logs_are_archived(self, instances, capsys):
+        call_command("archive_fieldlogs", batch_size=1000, verbosity=2)
+
+        out = capsys.readouterr().out
+        assert "Archived" in out
+        assert "creating 2 archives." in out
+
+    def test_archive_days_is_required(self):
+        with pytest.raises(CommandError, match="ARCHIVE_DAYS"):
+            call_command("archive_fieldlogs")
+
+    def test_expired_archives_are_pruned(self, instances, settings, capsys):
+        list(archive_logs(cutoff(90)))
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "RETENTION_DAYS": 30,
+        }
+
+        call_command("prune_fieldlogs")
+
+        assert "Deleted 2 archives." in capsys.readouterr().out
+        assert not FieldLogArchive.objects.exists()
+
+    def test_expired_logs_of_archives_are_pruned(self, instances, settings, capsys):
+        list(archive_logs(cutoff(90)))
+        recent_logs = list(instances[0].fieldlog_set.order_by("pk"))
+        age_logs(instances[0].fieldlog_set.all(), 95)
+        list(archive_logs(cutoff(90)))
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "RETENTION_DAYS": 98,
+        }
+
+        call_command("prune_fieldlogs")
+
+        out = capsys.readouterr().out
+        assert "Deleted 1 archives." in out
+        assert "Deleted the expired logs of 1 archives." in out
+        archive = FieldLogArchive.objects.get()
+        assert archive.log_count == len(recent_logs)
+        assert archive.first_log_id == recent_logs[0].pk
+        assert archive.first_timestamp >= cutoff(98)
+        assert [log.pk for log in instances[0].fieldlog_history] == [
+            log.pk for log in recent_logs
+        ]
+
+
+@pytest.mark.django_db
+def test_compact_logs_with_native_ids_are_archived(settings):
+    settings.FIELD_LOGGER_SETTINGS = {
+        **settings.FIELD_LOGGER_SETTINGS,
+        "COMPACT_LOGS": True,
+        "NATIVE_INSTANCE_IDS": True,
+    }
+    instance = TestModel.objects.create(test_char_field="test")
+    expected = list(instance.fieldlog_set.order_by("pk"))
+    age_logs(FieldLog.objects.all(), 100)
+
+    list(archive_logs(cutoff(90)))
+
+    archive = FieldLogArchive.objects.get()
+    assert (archive.app_label, archive.model_name) == ("testapp", "testmodel")
+    assert archive.instance_id == str(instance.pk)
+    assert instance.fieldlog_history == expected
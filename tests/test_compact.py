@@ -0,0 +1,236 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from fieldlogger.models import FieldLog, LoggedField
+
+from .testapp.models import TestModel
+
+
+@pytest.fixture
+def compact_logs(settings):
+    settings.FIELD_LOGGER_SETTINGS = {
+        **settings.FIELD_LOGGER_SETTINGS,
+        "COMPACT_LOGS": True,
+    }
+
+
+def legacy_log(**kwargs):
+    """Save a log with its names, as without the ``COMPACT_LOGS`` setting."""
+    return FieldLog._base_manager.create(
+        app_label="testapp", model_name="testmodel", instance_id="0", **kwargs
+    )
+
+
+def stored_names(log):
+    return FieldLog._base_manager.values_list(
+        "app_label", "model_name", "field", "logged_field"
+    ).get(pk=log.pk)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("compact_logs")
+class TestCompactLogs:
+    def test_logs_reference_their_logged_field(self):
+        instance = TestModel.objects.create(test_char_field="test")
+
+        log = instance.fieldlog_set.get(field="test_char_field")
+
+        logged_field = LoggedField.objects.get(field="test_char_field")
+        assert stored_names(log) == ("", "", "", logged_field.pk)
+        assert (log.app_label, log.model_name, log.field) == logged_field.names
+        assert log.new_value == "test"
+        assert str(logged_field) == "testapp__testmodel__test_char_field"
+
+    def test_created_logs_keep_their_names(self, settings):
+        created_logs = []
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "CALLBACKS": [lambda instance, fields, logs: created_logs.append(logs)],
+        }
+
+        TestModel.objects.create(test_char_field="test")
+
+        log = created_logs[0]["test_char_field"]
+        assert log.pk is not None
+        assert (log.app_label, log.model_name, log.field) == (
+            "testapp",
+            "testmodel",
+            "test_char_field",
+        )
+
+    def test_lookups_match_compact_and_legacy_logs(self):
+        TestModel.objects.create(test_char_field="compact")
+        legacy = legacy_log(field="test_char_field", new_value="legacy")
+
+        def new_values(logs):
+            return sorted(logs.values_list("new_value", flat=True))
+
+        assert new_values(FieldLog.objects.filter(field="test_char_field")) == [
+            "compact",
+            "legacy",
+        ]
+        assert new_values(
+            FieldLog.objects.filter(
+                Q(field__startswith="test_char") | Q(field="missing"),
+                model_name__in=["testmodel"],
+            )
+        ) == ["compact", "legacy"]
+        assert new_values(
+            FieldLog.objects.filter(Q(Q(field="test_char_field"), ~Q(pk=legacy.pk)))
+        ) == ["compact"]
+        assert "test_char_field" not in FieldLog.objects.exclude(
+            field="test_char_field"
+        ).values_list("field", flat=True)
+        assert FieldLog.objects.exclude(field="test_char_field").count() == (
+            FieldLog.objects.count() - 2
+        )
+
+    def test_previous_logs(self):
+        legacy = legacy_log(field="test_char_field", new_value="legacy")
+        instance = TestModel.objects.create(test_char_field="first")
+        instance.test_char_field = "second"
+        instance.save()
+        legacy_log(field="test_text_field")
+
+        first, second = instance.fieldlog_set.filter(field="test_char_field")
+        assert second.previous_log == first
+
+        logs = FieldLog.objects.order_by("pk").prefetch_previous_logs()
+        previous_logs = {log.pk: log.previous_log for log in logs}
+        assert previous_logs[legacy.pk] is None
+        assert previous_logs[first.pk] is None
+        assert previous_logs[second.pk] == first
+
+    def test_legacy_logs_of_a_model_are_found_once_converted(self):
+        instance = TestModel.objects.create(test_char_field="compact")
+        FieldLog._base_manager.create(
+            app_label="testapp",
+            model_name="testmodel",
+            instance_id=str(instance.pk),
+            field="test_char_field",
+            new_value="legacy",
+        )
+        assert [log.new_value for log in instance.fieldlog_set] == ["compact"]
+        assert TestModel.as_of(instance, timezone.now())["test_char_field"] == (
+            "compact"
+        )
+
+        call_command("compact_fieldlogs")
+
+        assert TestModel.as_of(instance, timezone.now())["test_char_field"] == (
+            "legacy"
+        )
+
+    def test_lookups_of_a_model_use_its_logged_fields(self):
+        instance = TestModel.objects.create(test_char_field="test")
+
+        assert len(instance.fieldlog_set) == 1
+        assert instance.fieldlog_set.get(field="test_char_field").new_value == "test"
+        assert not FieldLog.objects.filter(
+            app_label="testapp", model_name="testmodel", field="missing"
+        ).exists()
+        assert "logged_field" in str(instance.fieldlog_set.query).split("WHERE")[1]
+
+    @pytest.mark.skipif(connection.vendor != "sqlite", reason="SQLite plans.")
+    @pytest.mark.parametrize("native", [False, True])
+    def test_lookups_of_a_model_use_the_compact_indexes(self, settings, native):
+        settings.FIELD_LOGGER_SETTINGS["NATIVE_INSTANCE_IDS"] = native
+        instance = TestModel.objects.create(test_char_field="test")
+
+        assert (
+            "fieldlogger_int_instance_idx" if native else "fieldlogger_compact_idx"
+        ) in instance.fieldlog_set.filter(field="test_char_field").explain()
+
+    def test_saved_logs_stay_compact(self, settings):
+        def callback(instance, fields, logs):
+            for log in logs.values():
+                log.extra_data = {"saved": True}
+                log.save()
+
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "NATIVE_INSTANCE_IDS": True,
+            "CALLBACKS": [callback],
+        }
+        instance = TestModel.objects.create(test_char_field="test")
+
+        log = instance.fieldlog_set.get()
+        assert log.extra_data["saved"]
+        log.save()
+        assert FieldLog._base_manager.values_list(
+            "app_label", "model_name", "field", "instance_id", "instance_int_id"
+        ).get() == ("", "", "", "", instance.pk)
+
+    def test_logged_fields_read_in_a_transaction_are_not_cached(
+        self, django_assert_num_queries
+    ):
+        TestModel.objects.create(test_char_field="test")
+
+        with django_assert_num_queries(2):
+            list(FieldLog.objects.filter(field="test_char_field"))
+
+        assert LoggedField.objects._cache == {}
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("compact_logs")
+class TestLoggedFieldCache:
+    def test_logged_fields_are_cached_on_commit(self, django_assert_num_queries):
+        logged_field = LoggedField.objects.get_for_names("app", "model", "field")
+
+        with django_assert_num_queries(0):
+            assert LoggedField.objects.get_for_names("app", "model", "field") == (
+                logged_field
+            )
+            assert LoggedField.objects.get_for_id(logged_field.pk) == logged_field
+            assert LoggedField.objects.ids_for_names("app", "model", "field") == [
+                logged_field.pk
+            ]
+
+    def test_cache_is_cleared_on_flush(self):
+        LoggedField.objects.get_for_names("app", "model", "field")
+        assert LoggedField.objects._cache
+
+        call_command("flush", interactive=False)
+
+        assert LoggedField.objects._cache == {}
+
+    def test_rolled_back_logged_fields_are_not_cached(self):
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                LoggedField.objects.get_for_names("app", "model", "field")
+                raise ValueError
+
+        assert LoggedField.objects._cache == {}
+        assert not LoggedField.objects.exists()
+
+
+@pytest.mark.django_db
+class TestCompactFieldlogsCommand:
+    def test_logs_are_converted_in_batches(self, settings, capsys):
+        for value in ("a", "b", "c"):
+            TestModel.objects.create(test_char_field=value)
+        legacy_log(field="test_char_field", new_value="d")
+        count = FieldLog.objects.count()
+
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "COMPACT_LOGS": True,
+        }
+        call_command("compact_fieldlogs", batch_size=2, verbosity=2)
+
+        assert f"Converted {count} logs." in capsys.readouterr().out
+        assert not FieldLog._base_manager.filter(logged_field__isnull=True).exists()
+        assert not FieldLog._base_manager.exclude(field="").exists()
+        assert sorted(
+            FieldLog.objects.filter(field="test_char_field").values_list(
+                "new_value", flat=True
+            )
+        ) == ["a", "b", "c", "d"]
+
+    def test_compact_logs_must_be_enabled(self):
+        with pytest.raises(CommandError, match="COMPACT_LOGS"):
+            call_command("compact_fieldlogs")
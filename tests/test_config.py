@@ -1,9 +1,13 @@
+from decimal import Decimal
+
 import django
 import pytest
 from django.conf import settings
+from django.db import connections
 from django.test import override_settings
 
 from fieldlogger import config
+from fieldlogger.models import FieldLog
 
 from .helpers import CREATE_FORM, check_logs, refresh_config, set_config
 from .testapp.models import TestModel
@@ -70,3 +74,90 @@ class TestConfig:
             assert config.get_config() == {}
 
         assert TestModel in config.get_config()
+
+
+class CountingRouter:
+    calls = 0
+
+    def db_for_write(self, model, **hints):
+        CountingRouter.calls += 1
+        return "other"
+
+
+@pytest.mark.django_db
+class TestSupportsReturningPks:
+    def test_result_is_cached_per_model_and_database(self, monkeypatch):
+        with override_settings(DATABASE_ROUTERS=[CountingRouter()]):
+            CountingRouter.calls = 0
+            features = connections["other"].features
+            supported = features.can_return_rows_from_bulk_insert
+
+            for _ in range(3):
+                assert config.supports_returning_pks(FieldLog) == supported
+            config.supports_returning_pks(FieldLog, "default")
+            config.supports_returning_pks(TestModel)
+
+            assert CountingRouter.calls == 2
+
+            monkeypatch.setattr(
+                type(features), "can_return_rows_from_bulk_insert", not supported
+            )
+            assert config.supports_returning_pks(FieldLog) == supported
+            config.invalidate_config()
+            assert config.supports_returning_pks(FieldLog) != supported
+
+    def test_cache_is_discarded_when_routers_change(self):
+        config.supports_returning_pks(FieldLog)
+
+        with override_settings(DATABASE_ROUTERS=[CountingRouter()]):
+            CountingRouter.calls = 0
+            config.supports_returning_pks(FieldLog)
+            assert CountingRouter.calls == 1
+
+
+class TestFieldPlan:
+    def test_plan_follows_the_model_fields(self):
+        plan = config.field_plan(TestModel)
+
+        assert [entry.field for entry in plan.entries] == sorted(
+            config.get_config()[TestModel]["logging_fields"]
+        )
+        assert plan.fields == config.get_config()[TestModel]["logging_fields"]
+
+    def test_values_are_normalized_like_logs(self):
+        entries = {
+            entry.field.name: entry for entry in config.field_plan(TestModel).entries
+        }
+
+        decimal_field = entries["test_decimal_field"]
+        instance = TestModel(test_decimal_field=Decimal("3.149"))
+        assert decimal_field.normalize(decimal_field.get(instance)) == Decimal("3.15")
+        assert entries["test_char_field"].normalize is None
+
+    def test_filtered_plans_are_cached(self, monkeypatch):
+        monkeypatch.setattr(config, "PLAN_CACHE_SIZE", 2)
+        config.invalidate_config()
+
+        plan = config.field_plan(
+            TestModel, ["test_char_field", "test_related_field_id"]
+        )
+        assert {field.name for field in plan.fields} == {
+            "test_char_field",
+            "test_related_field",
+        }
+        assert (
+            config.field_plan(TestModel, {"test_related_field_id", "test_char_field"})
+            is plan
+        )
+        assert config.field_plan(TestModel, None) is config.field_plan(TestModel)
+
+        # The least recently used plan is discarded first.
+        text_plan = config.field_plan(TestModel, ["test_text_field"])
+        config.field_plan(TestModel, ["test_char_field", "test_related_field_id"])
+        config.field_plan(TestModel, ["test_integer_field"])
+        assert (
+            config.field_plan(TestModel, ["test_char_field", "test_related_field_id"])
+            is plan
+        )
+        assert config.field_plan(TestModel, ["test_text_field"]) is not text_plan
+        assert config.field_plan(TestModel, ["unknown_field"]).entries == ()
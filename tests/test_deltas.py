@@ -0,0 +1,179 @@
+from datetime import timedelta
+
+import pytest
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+
+from fieldlogger import archive, fieldlogger
+from fieldlogger.deltas import checkpoint_survivors
+from fieldlogger.models import FieldLog
+from fieldlogger.retention import cutoff, delete_expired
+
+from .helpers import set_config
+from .testapp.models import TestModel, TestModelRelated2
+
+FIELD = "test_many_to_many_field"
+
+
+@pytest.fixture
+def instance():
+    return TestModel.objects.create()
+
+
+@pytest.fixture
+def related():
+    return [TestModelRelated2.objects.create() for _ in range(4)]
+
+
+def m2m_logs(instance):
+    return FieldLog.objects.filter(instance_id=instance.pk, field=FIELD).order_by("pk")
+
+
+def age_first_logs(instance, count):
+    pks = list(m2m_logs(instance).values_list("pk", flat=True)[:count])
+    FieldLog.objects.filter(pk__in=pks).update(
+        timestamp=timezone.now() - timedelta(days=100)
+    )
+
+
+@pytest.fixture
+def history(instance, related):
+    """Five changes of the relations of ``instance``, stored with a
+    checkpoint every 3 logs, and the pks related after each one."""
+    set_config({"m2m_checkpoint_every": 3}, "testmodel")
+    relation = instance.test_many_to_many_field
+    relation.add(related[0])
+    relation.add(related[1], related[2])
+    relation.remove(related[0])
+    relation.add(related[3])
+    relation.clear()
+
+    pks = [obj.pk for obj in related]
+    return [[pks[0]], pks[:3], pks[1:3], pks[1:], []]
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestDeltas:
+    def test_deltas_are_stored_between_checkpoints(self, instance, related, history):
+        raw = [(log.raw_old_value, log.raw_new_value) for log in m2m_logs(instance)]
+
+        pks = [obj.pk for obj in related]
+        assert raw == [
+            ([], [pks[0]]),
+            (None, {"added": pks[1:3], "removed": []}),
+            (None, {"added": [], "removed": [pks[0]]}),
+            (pks[1:3], pks[1:]),
+            (None, {"added": [], "removed": pks[1:]}),
+        ]
+
+    def test_loaded_logs_are_expanded(
+        self, instance, history, django_assert_num_queries
+    ):
+        # The logs, the checkpoints before them and the logs in between.
+        with django_assert_num_queries(3):
+            logs = list(m2m_logs(instance))
+            values = [(log.old_value, log.new_value) for log in logs]
+
+        assert values == list(zip([[], *history], history))
+
+    def test_iterated_logs_are_expanded_on_access(self, instance, history):
+        logs = m2m_logs(instance).iterator()
+
+        assert [log.new_value for log in logs] == history
+        assert m2m_logs(instance).last().previous_log.old_value == history[2]
+
+    def test_created_logs_hold_the_full_lists(self, instance, related):
+        set_config({"m2m_checkpoint_every": 10}, "testmodel")
+        field = TestModel._meta.get_field(FIELD)
+        instance.test_many_to_many_field.add(related[0])
+        old_state = fieldlogger.m2m_pks(field, [instance.pk])
+        instance.test_many_to_many_field.add(related[1])
+
+        log = fieldlogger.log_m2m_fields(
+            TestModel, field, old_state, run_callbacks=False
+        )[instance.pk][FIELD]
+
+        assert log.old_value == [related[0].pk]
+        assert log.new_value == [related[0].pk, related[1].pk]
+        assert FieldLog.objects.get(pk=log.pk).raw_old_value is None
+
+    def test_as_of(self, instance, history):
+        assert TestModel.as_of(instance, timezone.now())[FIELD] == history[-1]
+
+    def test_deltas_without_checkpoint_are_left_as_stored(self, instance, history):
+        m2m_logs(instance).first().delete()
+
+        logs = list(m2m_logs(instance))
+
+        assert logs[0].old_value is None
+        assert logs[0].new_value == {"added": history[1][1:], "removed": []}
+        assert logs[-1].new_value == []
+
+    def test_only_m2m_fields_are_expanded(self, instance):
+        instance.test_json_field = {"added": [1], "removed": []}
+        instance.save()
+
+        log = FieldLog.objects.get(field="test_json_field")
+        assert log.old_value is None
+        assert log.new_value == {"added": [1], "removed": []}
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestDeletedCheckpoints:
+    """Deltas whose checkpoint is pruned or archived are stored as full
+    logs first."""
+
+    def test_pruned_checkpoints(self, instance, history):
+        age_first_logs(instance, 2)
+
+        list(delete_expired(cutoff(90)))
+
+        logs = list(m2m_logs(instance))
+        assert (logs[0].raw_old_value, logs[0].raw_new_value) == (
+            history[1],
+            history[2],
+        )
+        assert [log.new_value for log in logs] == history[2:]
+        assert [log.old_value for log in logs] == history[1:4]
+
+    def test_archived_checkpoints(self, instance, history):
+        age_first_logs(instance, 2)
+
+        list(archive.archive_logs(cutoff(90)))
+
+        assert m2m_logs(instance).first().raw_old_value == history[1]
+        assert [log.new_value for log in m2m_logs(instance)] == history[2:]
+        # Archived deltas are expanded too.
+        archived = archive.history("testapp", "testmodel", instance.pk, field=FIELD)
+        assert [log.raw_new_value for log in archived[:2]] == history[:2]
+
+    def test_survivors_after_a_checkpoint_are_left(self, instance, history):
+        age_first_logs(instance, 3)
+
+        assert (
+            checkpoint_survivors(FieldLog.objects.filter(timestamp__lt=cutoff(90))) == 0
+        )
+
+    def test_without_m2m_fields(self, instance, history):
+        with override_settings(FIELD_LOGGER_SETTINGS={}):
+            assert checkpoint_survivors(FieldLog.objects.all()) == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+def test_compact_logs_with_native_ids_are_expanded(instance, related):
+    settings.FIELD_LOGGER_SETTINGS["COMPACT_LOGS"] = True
+    settings.FIELD_LOGGER_SETTINGS["NATIVE_INSTANCE_IDS"] = True
+    set_config({"m2m_checkpoint_every": 2}, "testmodel")
+    relation = instance.test_many_to_many_field
+
+    for obj in related:
+        relation.add(obj)
+
+    logs = list(m2m_logs(instance))
+    assert [log.raw_old_value is None for log in logs] == [False, True, False, True]
+    assert logs[-1].new_value == sorted(obj.pk for obj in related)
+    assert logs[1].old_value == [related[0].pk]
@@ -0,0 +1,160 @@
+import csv
+import gzip
+import json
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from fieldlogger.export import export_logs, filter_logs
+
+from .helpers import set_config
+from .testapp.models import TestModel, TestModelRelated, TestModelRelated2
+
+
+@pytest.fixture
+def logs():
+    related = TestModelRelated.objects.create()
+    instance = TestModel.objects.create(
+        test_char_field="first", test_decimal_field="1.5", test_related_field=related
+    )
+    instance.test_char_field = "second"
+    instance.save()
+    return filter_logs(app_label="testapp", model_name="testmodel")
+
+
+def exported(logs, **kwargs):
+    stream = StringIO()
+    count = export_logs(logs, stream, **kwargs)
+    return count, stream.getvalue()
+
+
+@pytest.mark.django_db
+class TestExportLogs:
+    def test_jsonl(self, logs, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            count, output = exported(logs.filter(field="test_char_field"))
+
+        rows = [json.loads(line) for line in output.splitlines()]
+        assert count == len(rows) == 2
+        first, second = logs.filter(field="test_char_field")
+        assert rows[1] == {
+            "id": second.pk,
+            "timestamp": second.timestamp.isoformat(),
+            "app_label": "testapp",
+            "model_name": "testmodel",
+            "instance_id": str(second.instance_id),
+            "field": "test_char_field",
+            "created": False,
+            "old_value": "first",
+            "new_value": "second",
+            "extra_data": second.extra_data,
+        }
+        assert rows[0]["created"] is True
+
+    def test_values_are_exported_as_stored(self, logs, django_assert_num_queries):
+        related_logs = logs.filter(field="test_related_field")
+
+        # No query for the related instance.
+        with django_assert_num_queries(1):
+            _, output = exported(related_logs)
+
+        assert json.loads(output)["new_value"] == related_logs.get().raw_new_value
+
+    @pytest.mark.usefixtures("restore_settings")
+    @pytest.mark.parametrize("convert", [False, True])
+    def test_deltas_are_expanded(self, convert, django_assert_num_queries):
+        set_config({"m2m_checkpoint_every": 2}, "testmodel")
+        instance = TestModel.objects.create()
+        related = [TestModelRelated2.objects.create() for _ in range(3)]
+        for obj in related:
+            instance.test_many_to_many_field.add(obj)
+        pks = [obj.pk for obj in related]
+
+        # The logs, the checkpoints before the deltas and the logs since.
+        with django_assert_num_queries(3):
+            _, output = exported(
+                filter_logs(field="test_many_to_many_field"), convert=convert
+            )
+
+        rows = [json.loads(line) for line in output.splitlines()]
+        assert [(row["old_value"], row["new_value"]) for row in rows] == [
+            ([], pks[:1]),
+            (pks[:1], pks[:2]),
+            (pks[:2], pks),
+        ]
+
+    def test_deferred_values(self, logs):
+        char_logs = logs.filter(field="test_char_field")
+
+        assert exported(char_logs.defer("old_value")) == exported(char_logs)
+
+    def test_converted_values(self, logs):
+        _, output = exported(logs.filter(field="test_decimal_field"), convert=True)
+        row = json.loads(output)
+
+        assert row["instance_id"] == TestModel.objects.get().pk
+        assert row["new_value"] == 1.5
+
+    def test_csv(self, logs):
+        count, output = exported(logs, format="csv", chunk_size=2)
+
+        rows = list(csv.DictReader(StringIO(output)))
+        assert count == len(rows) == logs.count()
+        row = next(row for row in rows if row["field"] == "test_char_field")
+        assert row["new_value"] == '"first"'
+        assert row["created"] == "True"
+
+    def test_invalid_format(self, logs):
+        with pytest.raises(ValueError, match="parquet"):
+            exported(logs, format="parquet")
+
+    def test_filters(self, logs):
+        now = timezone.now()
+        assert filter_logs(field="test_char_field").count() == 2
+        assert filter_logs(since=now - timedelta(minutes=1)).count() == logs.count()
+        assert not filter_logs(until=now - timedelta(minutes=1)).exists()
+
+
+@pytest.mark.django_db
+class TestExportFieldlogsCommand:
+    def test_gzip_file(self, logs, tmp_path, capsys):
+        output = tmp_path / "logs.jsonl.gz"
+
+        call_command(
+            "export_fieldlogs",
+            str(output),
+            field="test_char_field",
+            since="2000-01-01",
+            until=(timezone.now() + timedelta(days=1)).isoformat(),
+        )
+
+        assert "Exported 2 logs." in capsys.readouterr().out
+        with gzip.open(output, "rt") as stream:
+            rows = [json.loads(line) for line in stream]
+        assert [row["new_value"] for row in rows] == ["first", "second"]
+
+    def test_plain_csv_file(self, logs, tmp_path):
+        output = tmp_path / "logs.csv"
+
+        call_command("export_fieldlogs", str(output), format="csv")
+
+        with open(output, newline="") as stream:
+            assert len(list(csv.DictReader(stream))) == logs.count()
+
+    def test_standard_output(self, logs, capsys):
+        call_command("export_fieldlogs", "-", field="test_char_field")
+
+        lines = capsys.readouterr().out.splitlines()
+        assert [json.loads(line)["new_value"] for line in lines] == [
+            "first",
+            "second",
+        ]
+
+    def test_invalid_time(self):
+        with pytest.raises(CommandError, match="Invalid date"):
+            call_command("export_fieldlogs", "-", since="yesterday")
+        with pytest.raises(CommandError, match="Invalid date"):
+            call_command("export_fieldlogs", "-", until="2024-02-30")
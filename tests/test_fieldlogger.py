@@ -25,6 +25,7 @@ def test_log_fields_returns_logs_keyed_by_pk_and_field_name():
 
 
 @pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("reset_pk_blocks")
 def test_set_primary_keys():
     logs = [
         FieldLog(app_label="testapp", model_name="testmodel", field="f", instance_id=i)
@@ -32,11 +33,12 @@ def test_set_primary_keys():
     ]
 
     fieldlogger.set_primary_keys(logs, FieldLog)
-    max_pk = FieldLog.objects.count()
-    assert [log.pk for log in logs] == [max_pk + 1, max_pk + 2, max_pk + 3]
+    start = logs[0].pk
+    assert [log.pk for log in logs] == [start, start + 1, start + 2]
 
 
 @pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("reset_pk_blocks")
 def test_set_primary_keys_respects_preset_pks():
     logs = [
         FieldLog(app_label="testapp", model_name="testmodel", field="f"),
@@ -44,7 +46,8 @@ def test_set_primary_keys_respects_preset_pks():
     ]
 
     fieldlogger.set_primary_keys(logs, FieldLog)
-    assert [log.pk for log in logs] == [1, 999]
+    assert logs[0].pk is not None
+    assert logs[1].pk == 999
 
 
 @pytest.mark.django_db(transaction=True)
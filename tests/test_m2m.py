@@ -1,4 +1,6 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from fieldlogger import fieldlogger, signals
 
@@ -21,6 +23,26 @@ def m2m_logs(instance):
     return instance.fieldlog_set.filter(field="test_many_to_many_field").order_by("pk")
 
 
+# Changes to the relations of ``instance``, by name.
+CHANGES = {
+    "add": lambda instance, related: instance.test_many_to_many_field.add(*related),
+    "reverse_add": lambda instance, related: related[1].test_reverse_m2m.add(instance),
+    "remove": lambda instance, related: instance.test_many_to_many_field.remove(
+        *related
+    ),
+    "clear": lambda instance, related: instance.test_many_to_many_field.clear(),
+}
+
+
+def through_reads(context):
+    through = TestModel.test_many_to_many_field.through._meta.db_table
+    return [
+        query
+        for query in context.captured_queries
+        if query["sql"].startswith("SELECT") and through in query["sql"]
+    ]
+
+
 @pytest.mark.django_db(transaction=True)
 class TestM2MLogging:
     def test_add(self, instance, related):
@@ -89,6 +111,37 @@ class TestM2MLogging:
         assert other_log.old_value == [related[0].pk]
         assert other_log.new_value == []
 
+    @pytest.mark.parametrize(
+        "change, reads",
+        [
+            # Django's own read of the existing rows, and the state before.
+            ("add", 2),
+            ("reverse_add", 2),
+            ("remove", 1),
+            # The state before and after.
+            ("clear", 2),
+        ],
+    )
+    def test_state_after_add_and_remove_is_not_read(
+        self, instance, related, change, reads
+    ):
+        instance.test_many_to_many_field.add(related[0])
+
+        with CaptureQueriesContext(connection) as context:
+            CHANGES[change](instance, related)
+
+        assert len(through_reads(context)) == reads
+        assert m2m_logs(instance).last().new_value == sorted(
+            instance.test_many_to_many_field.values_list("pk", flat=True)
+        )
+
+    def test_remove_by_unconverted_pk(self, instance, related):
+        instance.test_many_to_many_field.add(*related)
+        instance.test_many_to_many_field.remove(str(related[0].pk))
+
+        log = m2m_logs(instance).last()
+        assert log.new_value == sorted(obj.pk for obj in related[1:])
+
 
 @pytest.mark.django_db(transaction=True)
 def test_log_m2m_fields_on_unconfigured_model(instance, related):
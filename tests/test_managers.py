@@ -1,6 +1,22 @@
+from datetime import date
+
+import django
 import pytest
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from fieldlogger.managers import ON_CONFLICT
+from fieldlogger.models import FieldLog
 
-from .testapp.models import TestModel
+from .helpers import set_config
+from .testapp.models import TestModel, TestModelRelated
+
+# Logs are inserted with a single query where their pks are returned.
+returning_log_pks = pytest.mark.skipif(
+    not connection.features.can_return_rows_from_bulk_insert,
+    reason="The pks of the logs are reserved with extra queries.",
+)
 
 
 @pytest.mark.django_db(transaction=True)
@@ -14,3 +30,277 @@ def test_bulk_create_ignore_conflicts_skips_conflicting_rows():
 
     assert inserted.fieldlog_set.count() == 1
     assert conflicting.fieldlog_set.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("returning_pks", [True, False])
+def test_bulk_create_ignore_conflicts_reads_the_inserted_pks(
+    returning_pks, monkeypatch
+):
+    """The inserted rows come back from the insert itself, unless the
+    database cannot return them."""
+    monkeypatch.setattr(
+        "fieldlogger.managers.db_supports_returning_pks",
+        lambda *args, **kwargs: returning_pks,
+    )
+    TestModel.objects.create(test_unique_field="dup")
+    conflicting = TestModel(test_unique_field="dup")
+    inserted = TestModel(test_char_field="ok")
+
+    with CaptureQueriesContext(connection) as context:
+        TestModel.objects.bulk_create(
+            [conflicting, inserted], ignore_conflicts=True, run_callbacks=False
+        )
+
+    assert inserted.fieldlog_set.count() == 1
+    assert conflicting.fieldlog_set.count() == 0
+    pk_reads = [
+        query
+        for query in context.captured_queries
+        if query["sql"].startswith("SELECT")
+        and '"testapp_testmodel"."id" IN' in query["sql"]
+    ]
+    # Inserts return rows with conflicts ignored since Django 4.1.
+    assert len(pk_reads) == (0 if returning_pks and ON_CONFLICT else 1)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("batch_size", [None, 2])
+def test_bulk_create_ignore_conflicts_with_a_conflicting_last_batch(batch_size):
+    """A batch of a single row that conflicts inserts nothing."""
+    TestModel.objects.create(test_unique_field="dup")
+    inserted = [TestModel(test_char_field=str(i)) for i in range(2)]
+    conflicting = TestModel(test_unique_field="dup")
+    objs = [*inserted, conflicting] if batch_size else [conflicting]
+
+    TestModel.objects.bulk_create(
+        objs, batch_size=batch_size, ignore_conflicts=True, run_callbacks=False
+    )
+
+    assert conflicting.fieldlog_set.count() == 0
+    assert all(obj.fieldlog_set.exists() for obj in objs[:-1])
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+@pytest.mark.skipif(django.VERSION < (4, 1), reason="update_conflicts is Django 4.1+")
+class TestBulkCreateUpdateConflicts:
+    def test_upserted_rows_log_their_changes(self):
+        set_config(
+            {"fields": ["test_unique_field", "test_integer_field", "test_char_field"]},
+            "testmodel",
+        )
+        existing = TestModel.objects.create(
+            test_unique_field="a", test_integer_field=1, test_char_field="old"
+        )
+        upserted = TestModel(
+            test_unique_field="a", test_integer_field=2, test_char_field="ignored"
+        )
+        unchanged = TestModel(test_unique_field="b", test_integer_field=3)
+        TestModel.objects.create(test_unique_field="b", test_integer_field=3)
+        created = TestModel(test_unique_field="c", test_integer_field=4)
+
+        TestModel.objects.bulk_create(
+            [upserted, unchanged, created],
+            update_conflicts=True,
+            unique_fields=["test_unique_field"],
+            update_fields=["test_integer_field"],
+        )
+
+        assert upserted.pk == existing.pk
+        assert [
+            (log.field, log.old_value, log.new_value, log.created)
+            for log in existing.fieldlog_set.filter(created=False)
+        ] == [("test_integer_field", 1, 2, False)]
+        assert not FieldLog.objects.filter(
+            instance_id=unchanged.pk, created=False
+        ).exists()
+        assert created.fieldlog_set.filter(created=True).count() == 2
+
+    def test_conflicts_on_several_fields_are_matched(self, django_assert_num_queries):
+        existing = TestModel.objects.create(test_unique_field="a")
+        objs = [
+            TestModel(pk=existing.pk, test_unique_field="a"),
+            TestModel(pk=existing.pk, test_unique_field="b"),
+            TestModel(test_unique_field="a"),
+        ]
+
+        # One query per batch of objects that may conflict.
+        with django_assert_num_queries(2):
+            conflicting = TestModel.objects._conflicting_rows(
+                objs, ["pk", "test_unique_field"], ["test_integer_field"], 1
+            )
+
+        assert conflicting == {id(objs[0]): existing}
+        assert TestModel.objects._conflicting_rows(objs[2:], ["pk"], [], 1) == {}
+
+
+@pytest.fixture
+def instances():
+    return [TestModel.objects.create(test_integer_field=i) for i in range(5)]
+
+
+def update_logs(field="test_integer_field"):
+    return FieldLog.objects.filter(field=field, created=False).order_by("pk")
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestUpdate:
+    @returning_log_pks
+    def test_changes_are_logged(self, instances, django_assert_num_queries):
+        set_config({"update_chunk_size": 2}, "global")
+
+        # Per chunk of 2 rows: their pks, logged values, update and logs;
+        # then the pks of none left.
+        with django_assert_num_queries(2 * 4 + 1):
+            updated = TestModel.objects.filter(test_integer_field__gte=1).update(
+                test_integer_field=2, test_text_field="text", run_callbacks=False
+            )
+
+        assert updated == 4
+        assert [(log.old_value, log.new_value) for log in update_logs()] == [
+            (1, 2),
+            (3, 2),
+            (4, 2),
+        ]
+        assert update_logs("test_text_field").count() == 4
+
+    def test_expressions_are_read_back(self, instances):
+        TestModel.objects.filter(pk__in=[instances[0].pk, instances[1].pk]).update(
+            test_integer_field=F("test_integer_field") + 10
+        )
+
+        assert [(log.old_value, log.new_value) for log in update_logs()] == [
+            (0, 10),
+            (1, 11),
+        ]
+        # Callbacks get the updated instances.
+        assert all(
+            log.extra_data == {"global": True, "testapp": True, "testmodel": True}
+            for log in update_logs()
+        )
+
+    def test_foreign_keys_by_name_or_attname(self, instances):
+        related_instance = TestModelRelated.objects.create()
+
+        TestModel.objects.filter(pk=instances[0].pk).update(
+            test_related_field=related_instance
+        )
+        TestModel.objects.filter(pk=instances[1].pk).update(
+            test_related_field_id=related_instance.pk
+        )
+
+        assert [log.new_value for log in update_logs("test_related_field")] == [
+            related_instance,
+            related_instance,
+        ]
+
+    def test_foreign_keys_by_pk(self, instances):
+        related_instance = TestModelRelated.objects.create()
+
+        TestModel.objects.filter(pk=instances[0].pk).update(
+            test_related_field=related_instance.pk
+        )
+
+        assert [log.new_value for log in update_logs("test_related_field")] == [
+            related_instance
+        ]
+
+    def test_values_are_converted(self, instances):
+        TestModel.objects.filter(pk=instances[0].pk).update(
+            test_date_field=date(2020, 1, 1)
+        )
+        TestModel.objects.filter(pk=instances[0].pk).update(
+            test_date_field="2020-01-01"
+        )
+
+        assert [
+            (log.old_value, log.new_value) for log in update_logs("test_date_field")
+        ] == [(None, date(2020, 1, 1))]
+
+    def test_unlogged_fields_are_updated_directly(
+        self, instances, django_assert_num_queries
+    ):
+        set_config({"exclude_fields": ["id", "test_text_field"]}, "testmodel")
+
+        with django_assert_num_queries(1):
+            assert TestModel.objects.update(test_text_field="text") == 5
+
+    @pytest.mark.parametrize("log_fields", [False, True])
+    def test_logging_can_be_skipped(self, instances, log_fields):
+        TestModel.objects.update(
+            test_integer_field=10, log_fields=log_fields, run_callbacks=False
+        )
+
+        assert update_logs().count() == (5 if log_fields else 0)
+        assert not any(log.extra_data for log in update_logs())
+
+    def test_sliced_querysets_cannot_be_updated(self, instances):
+        # AssertionError on older Django versions.
+        with pytest.raises((TypeError, AssertionError)):
+            TestModel.objects.all()[:2].update(test_integer_field=10)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestBulkUpdate:
+    @returning_log_pks
+    def test_objects_are_logged_in_batches(self, instances, django_assert_num_queries):
+        for instance in instances:
+            instance.test_integer_field += 10
+            instance.test_text_field = "text"
+
+        # Per batch of 2 objects: their logged values, update and logs.
+        with django_assert_num_queries(3 * 3):
+            updated = TestModel.objects.bulk_update(
+                (instance for instance in instances),
+                ["test_integer_field", "test_text_field"],
+                batch_size=2,
+                run_callbacks=False,
+            )
+
+        assert updated == 5
+        assert [(log.old_value, log.new_value) for log in update_logs()] == [
+            (i, i + 10) for i in range(5)
+        ]
+        assert not any(
+            hasattr(instance, "_fieldlogger_pre_instance") for instance in instances
+        )
+
+    def test_updated_rows_are_counted(self, instances):
+        for instance in instances:
+            instance.test_integer_field += 10
+
+        updated = TestModel.objects.bulk_update(
+            instances, ["test_integer_field"], batch_size=2, run_callbacks=False
+        )
+
+        # Like Django's, which only counts them since 4.0.
+        assert updated == (None if django.VERSION < (4, 0) else 5)
+
+    @returning_log_pks
+    def test_chunk_size_setting(self, instances, django_assert_num_queries):
+        set_config({"update_chunk_size": 3}, "global")
+        for instance in instances:
+            instance.test_integer_field += 10
+
+        # Per chunk of 3 objects: their logged values, update and logs.
+        with django_assert_num_queries(2 * 3):
+            TestModel.objects.bulk_update(
+                instances, ["test_integer_field"], run_callbacks=False
+            )
+
+        assert update_logs().count() == 5
+
+    def test_unlogged_fields_are_not_fetched(
+        self, instances, django_assert_num_queries
+    ):
+        set_config({"exclude_fields": ["id", "test_text_field"]}, "testmodel")
+        for instance in instances:
+            instance.test_text_field = "text"
+
+        with django_assert_num_queries(1):
+            TestModel.objects.bulk_update(instances, ["test_text_field"])
+
+        assert not FieldLog.objects.filter(created=False).exists()
@@ -0,0 +1,183 @@
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from fieldlogger import fieldlogger
+from fieldlogger.config import get_config
+
+from .helpers import CREATE_FORM, UPDATE_FORM, check_logs, set_attributes, set_config
+from .testapp.models import TestModel
+
+
+def instance_selects(queries):
+    return [
+        query["sql"]
+        for query in queries
+        if query["sql"].startswith("SELECT") and '"testapp_testmodel"' in query["sql"]
+    ]
+
+
+@pytest.fixture
+def in_memory_state(restore_settings):
+    set_config({"in_memory_state": True}, "testmodel")
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("in_memory_state")
+class TestInMemoryState:
+    def test_loaded_instance_is_saved_without_query(self):
+        instance = TestModel.objects.create(**CREATE_FORM)
+        instance = TestModel.objects.get(pk=instance.pk)
+
+        instance.test_char_field = "changed"
+        with CaptureQueriesContext(connection) as ctx:
+            instance.save()
+
+        assert instance_selects(ctx.captured_queries) == []
+        log = instance.fieldlog_set.get(field="test_char_field", created=False)
+        assert log.old_value == "test"
+        assert log.new_value == "changed"
+
+    def test_saved_instance_keeps_its_state(self):
+        instance = TestModel.objects.create(**CREATE_FORM)
+
+        with CaptureQueriesContext(connection) as ctx:
+            set_attributes(instance, UPDATE_FORM)
+            set_attributes(instance, UPDATE_FORM)
+
+        assert instance_selects(ctx.captured_queries) == []
+        check_logs(instance, len(UPDATE_FORM))
+
+    def test_update_fields_only_refresh_the_saved_fields(self):
+        instance = TestModel.objects.create(test_char_field="a", test_text_field="a")
+
+        instance.test_char_field = "b"
+        instance.test_text_field = "b"
+        instance.save(update_fields=["test_char_field"])
+        instance.save()
+
+        logs = instance.fieldlog_set.filter(created=False)
+        assert sorted(logs.values_list("field", flat=True)) == [
+            "test_char_field",
+            "test_text_field",
+        ]
+
+    def test_in_place_changes_are_detected(self):
+        instance = TestModel.objects.create(test_json_field={"a": 1})
+
+        instance.test_json_field["a"] = 2
+        instance.save()
+
+        log = instance.fieldlog_set.get(field="test_json_field", created=False)
+        assert log.old_value == {"a": 1}
+        assert log.new_value == {"a": 2}
+
+    def test_decimals_are_rounded(self):
+        """Decimals are stored rounded, like the database would return them,
+        so saving again does not log a spurious change."""
+        instance = TestModel.objects.create(test_decimal_field=Decimal("3.14159"))
+        instance.save()
+
+        assert not instance.fieldlog_set.filter(created=False).exists()
+
+    def test_refresh_from_db_updates_the_state(self):
+        instance = TestModel.objects.create(test_char_field="a")
+        TestModel.objects.filter(pk=instance.pk).update(
+            test_char_field="b", log_fields=False
+        )
+
+        instance.refresh_from_db()
+        instance.test_char_field = "c"
+        instance.save()
+
+        log = instance.fieldlog_set.get(field="test_char_field", created=False)
+        assert log.old_value == "b"
+
+    def test_instance_never_loaded_falls_back_to_query(self):
+        instance = TestModel.objects.create(test_char_field="a")
+
+        unloaded = TestModel(pk=instance.pk, test_char_field="b")
+        with CaptureQueriesContext(connection) as ctx:
+            unloaded.save()
+
+        assert len(instance_selects(ctx.captured_queries)) == 1
+        log = instance.fieldlog_set.get(field="test_char_field", created=False)
+        assert log.old_value == "a"
+
+    def test_deferred_fields_fall_back_to_query(self):
+        instance = TestModel.objects.create(test_char_field="a")
+        instance = TestModel.objects.only("test_char_field").get(pk=instance.pk)
+
+        # Set without being loaded, so its previous value is not stored.
+        instance.test_text_field = "b"
+        with CaptureQueriesContext(connection) as ctx:
+            instance.save(update_fields=["test_char_field", "test_text_field"])
+
+        assert len(instance_selects(ctx.captured_queries)) == 1
+
+    def test_deferred_instances_compare_the_loaded_fields(self):
+        instance = TestModel.objects.create(test_char_field="a")
+        instance = TestModel.objects.only("test_char_field").get(pk=instance.pk)
+
+        # Django saves only the loaded fields, whose state is stored.
+        instance.test_char_field = "b"
+        with CaptureQueriesContext(connection) as ctx:
+            instance.save()
+
+        assert not instance_selects(ctx.captured_queries)
+        log = instance.fieldlog_set.get(field="test_char_field", created=False)
+        assert log.old_value == "a"
+
+    def test_pre_instance_matches_values_to_their_fields(self):
+        instance = TestModel.objects.create(**CREATE_FORM)
+        instance = TestModel.objects.get(pk=instance.pk)
+        # Not in the order of the model fields.
+        logging_fields = sorted(
+            get_config()[TestModel]["logging_fields"],
+            key=lambda field: field.creation_counter,
+            reverse=True,
+        )
+
+        pre_instance = fieldlogger.state_pre_instance(
+            TestModel, instance, logging_fields, "default"
+        )
+
+        state = instance._fieldlogger_state
+        for field in logging_fields:
+            assert pre_instance.__dict__[field.attname] == state[field.attname]
+
+    def test_bulk_update_refreshes_the_state(self):
+        instance = TestModel.objects.create(test_char_field="a")
+        instance = TestModel.objects.get(pk=instance.pk)
+
+        instance.test_char_field = "b"
+        TestModel.objects.bulk_update([instance], ["test_char_field"])
+        instance.test_char_field = "c"
+        instance.save()
+
+        log = instance.fieldlog_set.filter(created=False).latest("pk")
+        assert (log.old_value, log.new_value) == ("b", "c")
+
+    def test_updated_instances_get_their_own_state(self, monkeypatch):
+        instance = TestModel.objects.create(test_char_field="a")
+        logged = []
+        monkeypatch.setattr(
+            "fieldlogger.managers._log_fields",
+            lambda model_class, instances, **kwargs: logged.extend(instances),
+        )
+
+        TestModel.objects.filter(pk=instance.pk).update(test_char_field="b")
+
+        state = logged[0]._fieldlogger_state
+        pre_state = logged[0]._fieldlogger_pre_instance._fieldlogger_state
+        assert (pre_state["test_char_field"], state["test_char_field"]) == ("a", "b")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_state_is_not_stored_by_default():
+    instance = TestModel.objects.create(**CREATE_FORM)
+    instance = TestModel.objects.get(pk=instance.pk)
+
+    assert not hasattr(instance, "_fieldlogger_state")
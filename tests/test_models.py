@@ -1,7 +1,14 @@
 from decimal import Decimal
 
 import pytest
-
+from django.apps import apps
+from django.test import override_settings
+
+from fieldlogger.conversion import (
+    native_instance_id_field,
+    resolve_converters,
+    resolve_field,
+)
 from fieldlogger.models import FieldLog
 
 from .helpers import CREATE_FORM
@@ -72,6 +79,74 @@ class TestFieldLog:
         assert isinstance(deferred_log.new_value, float)
         assert deferred_log.new_value == float(log.new_value)
 
+    def test_values_are_converted_on_first_access(self, test_instance, monkeypatch):
+        log_pk = test_instance.fieldlog_set.get(field="test_decimal_field").pk
+        resolve_field.cache_clear()
+        resolve_converters.cache_clear()
+        lookups = []
+        get_model = apps.get_model
+        monkeypatch.setattr(
+            apps, "get_model", lambda *args: lookups.append(args) or get_model(*args)
+        )
+
+        log = FieldLog.objects.get(pk=log_pk)
+        assert log.field == "test_decimal_field"
+        assert log.timestamp
+        assert lookups == []
+
+        assert isinstance(log.new_value, Decimal)
+        assert isinstance(log.new_value, Decimal)
+        assert lookups == [("testapp", "testmodel")]
+
+    def test_resolution_is_cached_per_logged_field(self):
+        instance = TestModel.objects.create(test_char_field="first")
+        other = TestModel.objects.create(test_char_field="second")
+        instance.test_char_field = "third"
+        instance.save()
+        resolve_converters.cache_clear()
+
+        logs = FieldLog.objects.filter(field="test_char_field")
+        assert [log.new_value for log in logs] == ["first", "second", "third"]
+        assert [log.instance_id for log in logs] == [
+            instance.pk,
+            other.pk,
+            instance.pk,
+        ]
+        assert resolve_converters.cache_info().misses == 1
+
+    def test_resolution_cache_is_cleared_with_installed_apps(self):
+        resolve_converters("testapp", "testmodel", "test_char_field")
+        native_instance_id_field("testapp", "testmodel")
+        with override_settings(INSTALLED_APPS=["fieldlogger"]):
+            assert native_instance_id_field.cache_info().currsize == 0
+            assert resolve_field.cache_info().currsize == 0
+            assert resolve_converters.cache_info().currsize == 0
+
+    def test_raw_values(self, test_instance):
+        log = test_instance.fieldlog_set.get(field="test_decimal_field")
+        assert isinstance(log.raw_new_value, float)
+        assert log.raw_new_value == float(log.new_value)
+        assert log.raw_old_value is None
+        assert log.raw_instance_id == str(test_instance.pk)
+
+        unsaved_log = FieldLog(instance_id="1", old_value="old", new_value="new")
+        assert unsaved_log.raw_instance_id == "1"
+        assert unsaved_log.raw_old_value == "old"
+        assert unsaved_log.raw_new_value == "new"
+
+    def test_assigned_values_are_not_converted(self, test_instance):
+        log = test_instance.fieldlog_set.get(field="test_decimal_field")
+        log.new_value = "assigned"
+        assert log.new_value == "assigned"
+        assert isinstance(log.raw_new_value, float)
+
+    def test_refresh_from_db_converts_values(self, test_instance):
+        log = test_instance.fieldlog_set.get(field="test_decimal_field")
+        log.new_value = "assigned"
+        log.refresh_from_db()
+        assert isinstance(log.new_value, Decimal)
+        assert log.instance_id == test_instance.pk
+
     def test_from_db_field_on_null_foreign_key(self):
         field = TestModel._meta.get_field("test_related_field")
         assert FieldLog.from_db_field(field, None) is None
@@ -0,0 +1,250 @@
+import uuid
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from fieldlogger.conversion import native_instance_id_field
+from fieldlogger.models import FieldLog
+from fieldlogger.querysets import _native_id
+
+from .testapp.models import TestCharPkModel, TestModel, TestUUIDModel
+
+LOGGING_APPS = {
+    "testapp": {
+        "models": {
+            "TestModel": {"fields": ["test_char_field"]},
+            "TestUUIDModel": {"fields": ["test_char_field"]},
+            "TestCharPkModel": {"fields": ["test_char_field"]},
+        },
+    },
+}
+
+
+@pytest.fixture
+def logging_apps(settings):
+    settings.FIELD_LOGGER_SETTINGS = {"LOGGING_APPS": LOGGING_APPS}
+
+
+@pytest.fixture
+def native_instance_ids(settings, logging_apps):
+    settings.FIELD_LOGGER_SETTINGS = {
+        **settings.FIELD_LOGGER_SETTINGS,
+        "NATIVE_INSTANCE_IDS": True,
+    }
+
+
+def stored_ids(instance):
+    return list(
+        FieldLog._base_manager.filter(model_name=instance._meta.model_name)
+        .order_by("pk")
+        .values_list("instance_id", "instance_int_id", "instance_uuid")
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("native_instance_ids")
+class TestNativeInstanceIds:
+    def test_integer_ids(self):
+        instance = TestModel.objects.create(test_char_field="test")
+
+        assert stored_ids(instance) == [("", instance.pk, None)]
+        log = instance.fieldlog_set.get()
+        assert log.instance_id == instance.pk
+        assert log.instance == instance
+
+    def test_uuid_ids(self):
+        instance = TestUUIDModel.objects.create(test_char_field="test")
+
+        assert stored_ids(instance) == [("", None, instance.pk)]
+        assert instance.fieldlog_set.get().instance_id == instance.pk
+        assert FieldLog.objects.get(instance_id=str(instance.pk)).instance == instance
+
+    def test_as_of(self):
+        instance = TestUUIDModel.objects.create(test_char_field="first")
+        instance.test_char_field = "second"
+        instance.save()
+        other = TestCharPkModel.objects.create(id="007", test_char_field="test")
+
+        assert TestUUIDModel.as_of(instance, timezone.now()) == {
+            "test_char_field": "second"
+        }
+        assert TestCharPkModel.as_of(other.pk, timezone.now()) == {
+            "test_char_field": "test"
+        }
+
+    def test_other_ids_are_stored_as_strings(self):
+        instance = TestCharPkModel.objects.create(id="007", test_char_field="test")
+
+        assert stored_ids(instance) == [("007", None, None)]
+        assert instance.fieldlog_set.get().instance_id == "007"
+
+    def test_created_logs_keep_their_instance_id(self, settings):
+        created_logs = []
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "CALLBACKS": [lambda instance, fields, logs: created_logs.append(logs)],
+        }
+
+        instance = TestModel.objects.create(test_char_field="test")
+
+        log = created_logs[0]["test_char_field"]
+        assert log.pk is not None
+        assert log.instance_id == instance.pk
+
+    def test_lookups_match_native_and_legacy_logs(self):
+        native = TestModel.objects.create(test_char_field="native")
+        legacy = FieldLog._base_manager.create(
+            app_label="testapp",
+            model_name="testmodel",
+            instance_id=str(native.pk + 1),
+            field="test_char_field",
+            new_value="legacy",
+        )
+        uuid_instance = TestUUIDModel.objects.create(test_char_field="uuid")
+
+        def new_values(*args, **kwargs):
+            logs = FieldLog.objects.filter(*args, **kwargs)
+            return sorted(logs.values_list("new_value", flat=True))
+
+        assert new_values(instance_id=native.pk) == ["native"]
+        assert new_values(instance_id=str(native.pk)) == ["native"]
+        assert new_values(instance_id__exact=native.pk + 1) == ["legacy"]
+        assert new_values(
+            Q(instance_id__in=[native.pk, legacy.instance_id, uuid_instance.pk])
+        ) == ["legacy", "native", "uuid"]
+        assert new_values(instance_id__in=("007", "not an id")) == []
+        assert new_values(
+            instance_id__in=FieldLog.objects.filter(pk=legacy.pk).values("instance_id")
+        ) == ["legacy"]
+        assert new_values(instance_id__startswith=str(native.pk + 1)) == ["legacy"]
+        assert FieldLog.objects.exclude(instance_id=native.pk).count() == 2
+
+    def test_lookups_of_a_model_use_its_native_ids(self):
+        instance = TestModel.objects.create(test_char_field="native")
+        # Not converted yet, see the native_fieldlog_ids command.
+        FieldLog._base_manager.create(
+            app_label="testapp",
+            model_name="testmodel",
+            instance_id=str(instance.pk),
+            field="test_char_field",
+            new_value="legacy",
+        )
+        other = TestCharPkModel.objects.create(id="007", test_char_field="test")
+
+        assert [log.new_value for log in instance.fieldlog_set] == ["native"]
+        assert not FieldLog.objects.filter(
+            Q(
+                Q(field="test_char_field") | Q(field="other"),
+                app_label="testapp",
+                model_name="testmodel",
+                instance_id__in=[instance.pk + 1, "not an id"],
+            )
+        ).exists()
+        assert other.fieldlog_set.get().new_value == "test"
+        sql = str(instance.fieldlog_set.query)
+        assert '"instance_id"' not in sql.split("WHERE")[1]
+
+    @pytest.mark.skipif(connection.vendor != "sqlite", reason="SQLite plans.")
+    def test_lookups_of_a_model_use_the_native_id_index(self):
+        instance = TestUUIDModel.objects.create(test_char_field="test")
+
+        assert "fieldlogger_uuid_instance_idx" in instance.fieldlog_set.explain()
+
+    def test_previous_logs(self):
+        instance = TestModel.objects.create(test_char_field="first")
+        other_instance = TestModel.objects.create(test_char_field="other")
+        instance.test_char_field = "second"
+        instance.save()
+
+        first, second = instance.fieldlog_set.order_by("pk")
+        assert second.previous_log == first
+
+        logs = FieldLog.objects.order_by("pk").prefetch_previous_logs()
+        previous_logs = {log.pk: log.previous_log for log in logs}
+        assert previous_logs == {
+            first.pk: None,
+            other_instance.fieldlog_set.get().pk: None,
+            second.pk: first,
+        }
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1, ("instance_int_id", 1)),
+        ("-12", ("instance_int_id", -12)),
+        ("007", (None, None)),
+        (True, (None, None)),
+        (2**63, (None, None)),
+        (
+            "12345678-1234-5678-1234-567812345678",
+            ("instance_uuid", uuid.UUID("12345678-1234-5678-1234-567812345678")),
+        ),
+        ("name", (None, None)),
+        (None, (None, None)),
+    ],
+)
+def test_native_id(value, expected):
+    assert _native_id(value) == expected
+
+
+@pytest.mark.parametrize(
+    "model_name, expected",
+    [
+        ("testmodel", "instance_int_id"),
+        ("testuuidmodel", "instance_uuid"),
+        ("testuuidchildmodel", "instance_uuid"),
+        ("testcharpkmodel", None),
+        ("removedmodel", None),
+    ],
+)
+def test_native_instance_id_field(model_name, expected):
+    assert native_instance_id_field("testapp", model_name) == expected
+
+
+@pytest.mark.django_db
+class TestNativeFieldlogIdsCommand:
+    @pytest.mark.usefixtures("logging_apps")
+    def test_logs_are_converted_in_batches(self, settings, capsys):
+        instances = [
+            TestModel.objects.create(test_char_field="a"),
+            TestUUIDModel.objects.create(test_char_field="b"),
+            TestCharPkModel.objects.create(id="c", test_char_field="c"),
+            TestModel.objects.create(test_char_field="d"),
+        ]
+        FieldLog._base_manager.create(
+            app_label="testapp",
+            model_name="testmodel",
+            instance_id="not an id",
+            field="test_char_field",
+        )
+
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "NATIVE_INSTANCE_IDS": True,
+            "COMPACT_LOGS": True,
+        }
+        call_command("compact_fieldlogs")
+        call_command("native_fieldlog_ids", batch_size=2, verbosity=2)
+
+        assert "Converted 3 logs." in capsys.readouterr().out
+        assert list(
+            FieldLog._base_manager.order_by("pk").values_list(
+                "instance_id", "instance_int_id", "instance_uuid"
+            )
+        ) == [
+            ("", instances[0].pk, None),
+            ("", None, instances[1].pk),
+            ("c", None, None),
+            ("", instances[3].pk, None),
+            ("not an id", None, None),
+        ]
+        for instance in instances:
+            assert instance.fieldlog_set.get().instance == instance
+
+    def test_native_instance_ids_must_be_enabled(self):
+        with pytest.raises(CommandError, match="NATIVE_INSTANCE_IDS"):
+            call_command("native_fieldlog_ids")
@@ -0,0 +1,266 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.utils import timezone
+
+from fieldlogger import partitions
+from fieldlogger.models import FieldLog
+
+from .helpers import FakePostgresConnection, bound
+from .testapp.models import TestModel
+
+UTC = dt_timezone.utc
+
+
+@pytest.fixture
+def fake_postgres(monkeypatch):
+    fake = FakePostgresConnection()
+    monkeypatch.setattr(
+        "fieldlogger.management.commands.partition_fieldlogs.connections",
+        {"default": fake},
+    )
+    return fake
+
+
+class TestPeriods:
+    @pytest.mark.parametrize(
+        "interval, moment, start, next_start",
+        [
+            (
+                "month",
+                datetime(2024, 2, 29, 23),
+                datetime(2024, 2, 1),
+                datetime(2024, 3, 1),
+            ),
+            (
+                "month",
+                datetime(2024, 12, 5),
+                datetime(2024, 12, 1),
+                datetime(2025, 1, 1),
+            ),
+            ("week", datetime(2024, 3, 3), datetime(2024, 2, 26), datetime(2024, 3, 4)),
+        ],
+    )
+    def test_periods_are_in_utc(self, interval, moment, start, next_start):
+        start = start.replace(tzinfo=UTC)
+
+        assert partitions.period_start(moment.replace(tzinfo=UTC), interval) == start
+        assert partitions.next_period_start(start, interval) == next_start.replace(
+            tzinfo=UTC
+        )
+
+    def test_periods_of_other_timezones(self):
+        moment = datetime(2024, 3, 1, 1, tzinfo=dt_timezone(timedelta(hours=2)))
+        assert partitions.period_start(moment, "month") == datetime(
+            2024, 2, 1, tzinfo=UTC
+        )
+
+    def test_invalid_interval(self):
+        with pytest.raises(ValueError, match="PARTITION_INTERVAL"):
+            partitions.period_start(timezone.now(), "day")
+
+
+class TestPartitions:
+    def test_setup_attaches_the_existing_table(self):
+        fake = FakePostgresConnection()
+
+        partitions.setup_partitioning(fake, "month", datetime(2024, 5, 20, tzinfo=UTC))
+
+        statements = fake.executed[1:]
+        assert statements[0] == (
+            'ALTER TABLE "fieldlogger_fieldlog" RENAME TO "fieldlogger_fieldlog_legacy"'
+        )
+        # The sequence of the legacy table is dropped along with it.
+        assert statements[1] == (
+            "ALTER SEQUENCE fieldlogger_fieldlog_id_seq "
+            'RENAME TO "fieldlogger_fieldlog_id_seq_legacy"'
+        )
+        new_sequence = statements.index(
+            'CREATE SEQUENCE "fieldlogger_fieldlog_id_seq" '
+            'OWNED BY "fieldlogger_fieldlog"."id"'
+        )
+        assert statements[new_sequence + 1 : new_sequence + 3] == [
+            "SELECT setval('\"fieldlogger_fieldlog_id_seq\"', "
+            "nextval('\"fieldlogger_fieldlog_id_seq_legacy\"'))",
+            'ALTER TABLE "fieldlogger_fieldlog" ALTER COLUMN "id" '
+            "SET DEFAULT nextval('\"fieldlogger_fieldlog_id_seq\"'::regclass)",
+        ]
+        assert (
+            'ALTER TABLE "fieldlogger_fieldlog" ADD PRIMARY KEY ("id", "timestamp")'
+        ) in statements
+        assert (
+            'CREATE INDEX "fieldlogger_instance_idx" ON "fieldlogger_fieldlog" '
+            '("app_label", "model_name", "instance_id", "field")'
+        ) in statements
+        assert statements[-2] == (
+            'ALTER TABLE "fieldlogger_fieldlog" ATTACH PARTITION '
+            '"fieldlogger_fieldlog_legacy" FOR VALUES FROM (MINVALUE) '
+            "TO ('2024-06-01T00:00:00+00:00')"
+        )
+        # Before it is attached, the legacy table gets the primary key of the
+        # partitioned table, and a constraint proving its bounds.
+        order = [
+            'ALTER TABLE "fieldlogger_fieldlog_legacy" '
+            'DROP CONSTRAINT "fieldlogger_fieldlog_pkey"',
+            'ALTER TABLE "fieldlogger_fieldlog_legacy" '
+            'ADD PRIMARY KEY ("id", "timestamp")',
+            'ALTER TABLE "fieldlogger_fieldlog_legacy" ADD CONSTRAINT '
+            '"fieldlogger_fieldlog_legacy_cutover" '
+            "CHECK (\"timestamp\" < '2024-06-01T00:00:00+00:00') NOT VALID",
+            'ALTER TABLE "fieldlogger_fieldlog_legacy" '
+            'VALIDATE CONSTRAINT "fieldlogger_fieldlog_legacy_cutover"',
+        ]
+        indexes = [statements.index(statement) for statement in order]
+        assert indexes == sorted(indexes)
+        assert indexes[-1] < len(statements) - 2
+        assert statements[-1] == (
+            'ALTER TABLE "fieldlogger_fieldlog_legacy" '
+            'DROP CONSTRAINT "fieldlogger_fieldlog_legacy_cutover"'
+        )
+
+    @pytest.mark.skipif(
+        connection.vendor == "postgresql", reason="The tests run on PostgreSQL."
+    )
+    def test_other_databases_are_not_partitioned(self):
+        assert not partitions.is_partitioned(connection)
+
+    def test_is_partitioned(self):
+        assert not partitions.is_partitioned(FakePostgresConnection())
+        assert partitions.is_partitioned(FakePostgresConnection(partitioned=True))
+
+    def test_partitions_are_created_after_existing_ones(self):
+        fake = FakePostgresConnection(
+            partition_rows=[
+                (
+                    "fieldlogger_fieldlog_legacy",
+                    bound("MINVALUE", "'2024-06-01 00:00:00+00'"),
+                ),
+                ("fieldlogger_fieldlog_default", "DEFAULT"),
+            ]
+        )
+        # The default partition overlaps everything.
+        assert (
+            partitions.create_partitions(
+                fake, "week", 3, datetime(2024, 5, 20, tzinfo=UTC)
+            )
+            == []
+        )
+
+        del fake.partition_rows[1]
+        created = partitions.create_partitions(
+            fake, "week", 3, datetime(2024, 5, 20, tzinfo=UTC)
+        )
+
+        assert created == [
+            "fieldlogger_fieldlog_p20240603",
+            "fieldlogger_fieldlog_p20240610",
+        ]
+        assert fake.executed[-1] == (
+            'CREATE TABLE "fieldlogger_fieldlog_p20240610" PARTITION OF '
+            '"fieldlogger_fieldlog" FOR VALUES FROM '
+            "('2024-06-10T00:00:00+00:00') TO ('2024-06-17T00:00:00+00:00')"
+        )
+
+    def test_expired_partitions_are_dropped(self):
+        fake = FakePostgresConnection(
+            partition_rows=[
+                (
+                    "fieldlogger_fieldlog_legacy",
+                    bound("MINVALUE", "'2024-06-01 00:00:00+00'"),
+                ),
+                (
+                    "fieldlogger_fieldlog_p20240601",
+                    bound("'2024-06-01 00:00:00+00'", "'2024-07-01 00:00:00+00'"),
+                ),
+                (
+                    "fieldlogger_fieldlog_last",
+                    bound("'2024-07-01 00:00:00+00'", "MAXVALUE"),
+                ),
+            ]
+        )
+
+        dropped = partitions.drop_partitions(fake, datetime(2024, 6, 15, tzinfo=UTC))
+
+        assert dropped == ["fieldlogger_fieldlog_legacy"]
+        assert fake.executed[-1] == 'DROP TABLE "fieldlogger_fieldlog_legacy"'
+
+
+@pytest.mark.django_db
+class TestPartitionFieldlogsCommand:
+    def test_setup_and_partitions_ahead(self, fake_postgres, capsys):
+        call_command("partition_fieldlogs", setup=True, ahead=1)
+
+        out = capsys.readouterr().out
+        assert "Partitioned the log table." in out
+        assert out.count("Created partition") == 2
+        assert any("ATTACH PARTITION" in sql for sql in fake_postgres.executed)
+
+    def test_partitioned_table(self, fake_postgres, capsys):
+        fake_postgres.partitioned = True
+
+        call_command("partition_fieldlogs", setup=True, ahead=0)
+
+        out = capsys.readouterr().out
+        assert "Partitioned" not in out
+        assert out.count("Created partition") == 1
+
+    def test_unpartitioned_table(self, fake_postgres):
+        with pytest.raises(CommandError, match="--setup"):
+            call_command("partition_fieldlogs")
+
+    @pytest.mark.skipif(
+        connection.vendor == "postgresql", reason="The tests run on PostgreSQL."
+    )
+    def test_requires_postgresql(self):
+        with pytest.raises(CommandError, match="PostgreSQL"):
+            call_command("partition_fieldlogs", setup=True)
+
+    def test_invalid_interval(self, settings):
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "PARTITION_INTERVAL": "day",
+        }
+        with pytest.raises(CommandError, match="PARTITION_INTERVAL"):
+            call_command("partition_fieldlogs")
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="PostgreSQL only.")
+def test_setup_on_postgresql():
+    """The table is converted for real; the DDL is rolled back with the
+    test transaction."""
+    instance = TestModel.objects.create(test_char_field="a")
+
+    call_command("partition_fieldlogs", setup=True, ahead=1)
+
+    next_period = partitions.next_period_start(
+        partitions.period_start(timezone.now(), "month"), "month"
+    )
+    assert [name for name, _, _ in partitions.partitions(connection)] == [
+        "fieldlogger_fieldlog_legacy",
+        partitions.partition_name(next_period),
+    ]
+
+    instance.test_char_field = "b"
+    instance.save()
+    logs = FieldLog.objects.filter(
+        instance_id=instance.pk, field="test_char_field"
+    ).order_by("pk")
+    logs.filter(created=False).update(timestamp=next_period)
+
+    assert [log.new_value for log in logs] == ["a", "b"]
+    assert logs[1].pk > logs[0].pk
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM "
+            f"{connection.ops.quote_name(partitions.partition_name(next_period))}"
+        )
+        assert cursor.fetchone() == (1,)
+        # The sequence outlives the legacy partition.
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, %s)", [FieldLog._meta.db_table, "id"]
+        )
+        assert cursor.fetchone()[0].endswith("fieldlogger_fieldlog_id_seq")
@@ -0,0 +1,273 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.utils import timezone
+
+from fieldlogger.models import FieldLog
+
+from .testapp.models import TestModel, TestModelRelated, TestModelRelated2
+
+
+@pytest.fixture
+def related_logs():
+    """Logs of three instances, each with its own related instance, and of
+    a change of the related instance of the first one."""
+    related_instances = [TestModelRelated.objects.create() for _ in range(3)]
+    instances = [
+        TestModel.objects.create(
+            test_related_field=related_instance,
+            test_one_to_one_field=TestModelRelated2.objects.create(),
+        )
+        for related_instance in related_instances
+    ]
+    instances[0].test_related_field = related_instances[1]
+    instances[0].save()
+    return related_instances
+
+
+@pytest.mark.django_db
+class TestPrefetchValues:
+    def test_values_are_resolved_in_batches(
+        self, related_logs, django_assert_num_queries
+    ):
+        logs = FieldLog.objects.filter(
+            field__in=["test_related_field", "test_one_to_one_field"]
+        ).order_by("pk")
+
+        # The logs, then the instances of each related model.
+        with django_assert_num_queries(3):
+            logs = list(logs.prefetch_values())
+
+        with django_assert_num_queries(0):
+            values = [(log.old_value, log.new_value) for log in logs]
+
+        related_values = [
+            value
+            for log, value in zip(logs, values)
+            if log.field == "test_related_field"
+        ]
+        assert related_values == [
+            (None, related_logs[0]),
+            (None, related_logs[1]),
+            (None, related_logs[2]),
+            (related_logs[0], related_logs[1]),
+        ]
+        assert all(
+            isinstance(new_value, TestModelRelated2)
+            for log, (_, new_value) in zip(logs, values)
+            if log.field == "test_one_to_one_field"
+        )
+
+    def test_deleted_instances_resolve_to_shell_instances(self, related_logs):
+        related_pk = related_logs[2].pk
+        related_logs[2].delete()
+
+        log = FieldLog.objects.prefetch_values().get(
+            field="test_related_field", new_value=related_pk
+        )
+
+        assert isinstance(log.new_value, TestModelRelated)
+        assert log.new_value.pk == related_pk
+        assert log.new_value._state.adding
+
+    def test_other_values_are_left_to_convert_on_access(self):
+        TestModel.objects.create(test_char_field="test")
+        log = FieldLog.objects.prefetch_values().get(field="test_char_field")
+        assert log._unconverted == {"instance_id", "old_value", "new_value"}
+
+    def test_unconvertible_logs_are_skipped(self, related_logs):
+        logs = FieldLog.objects.prefetch_values().only("pk", "field")
+        assert len(logs) == FieldLog.objects.count()
+
+    def test_is_kept_by_chained_querysets(
+        self, related_logs, django_assert_num_queries
+    ):
+        logs = (
+            FieldLog.objects.prefetch_values()
+            .prefetch_values()
+            .filter(field="test_related_field")
+        )
+        with django_assert_num_queries(2):
+            assert len([log.new_value for log in logs]) == 4
+
+    def test_is_kept_by_exclude(self, related_logs, django_assert_num_queries):
+        logs = (
+            FieldLog.objects.filter(field="test_related_field")
+            .prefetch_values()
+            .exclude(old_value=None)
+        )
+        with django_assert_num_queries(2):
+            assert [log.old_value for log in logs] == [related_logs[0]]
+
+    def test_is_ignored_on_values_querysets(self, related_logs):
+        values = FieldLog.objects.prefetch_values().values_list("field", flat=True)
+        assert "test_related_field" in values
+
+
+@pytest.mark.django_db
+class TestPrefetchInstances:
+    def test_instances_are_fetched_in_batches(self, django_assert_num_queries):
+        instances = [TestModel.objects.create(test_char_field=str(i)) for i in range(3)]
+        related_instance = TestModelRelated.objects.create()
+        FieldLog.objects.create(
+            app_label="testapp",
+            model_name="testmodelrelated",
+            instance_id=str(related_instance.pk),
+            field="test_char_field",
+            created=True,
+        )
+        logs = FieldLog.objects.filter(field="test_char_field").order_by("pk")
+
+        # The logs, then the instances of each model.
+        with django_assert_num_queries(3):
+            logs = list(logs.prefetch_instances())
+
+        with django_assert_num_queries(0):
+            assert [log.instance for log in logs] == [*instances, related_instance]
+
+    def test_missing_instances_are_left_unfilled(self):
+        instance = TestModel.objects.create(test_char_field="deleted")
+        FieldLog.objects.create(
+            app_label="testapp",
+            model_name="removedmodel",
+            instance_id="1",
+            field="removed_field",
+            created=True,
+        )
+        instance.delete()
+
+        logs = list(FieldLog.objects.prefetch_instances())
+
+        assert len(logs) == 2
+        for log in logs:
+            assert "instance" not in log.__dict__
+
+
+@pytest.mark.django_db
+class TestPrefetchPreviousLogs:
+    def test_previous_logs_are_fetched_in_one_query(self, django_assert_num_queries):
+        instance = TestModel.objects.create(test_char_field="first")
+        other_instance = TestModel.objects.create(test_char_field="other")
+        for value in ("second", "third"):
+            instance.test_char_field = value
+            instance.save()
+
+        logs = FieldLog.objects.filter(field="test_char_field").order_by("pk")
+        first, other, second, third = logs
+
+        # The logs with the pks of their previous logs, then these logs.
+        with django_assert_num_queries(2):
+            logs = list(logs.prefetch_previous_logs())
+
+        with django_assert_num_queries(0):
+            assert [log.previous_log for log in logs] == [None, None, first, second]
+        assert logs[1].instance_id == other_instance.pk
+
+    def test_only_logs_of_the_same_field_are_previous(self):
+        TestModel.objects.create(test_char_field="test", test_text_field="test")
+
+        for log in FieldLog.objects.prefetch_previous_logs():
+            assert log.previous_log is None
+
+    def test_empty_queryset(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert list(FieldLog.objects.prefetch_previous_logs()) == []
+
+    def test_combined_prefetches(self, related_logs, django_assert_num_queries):
+        logs = (
+            FieldLog.objects.filter(field="test_related_field")
+            .prefetch_values()
+            .prefetch_instances()
+            .prefetch_previous_logs()
+        )
+
+        with django_assert_num_queries(4):
+            logs = list(logs)
+
+        with django_assert_num_queries(0):
+            for log in logs:
+                assert log.instance.test_related_field_id
+                assert log.previous_log is None or log.old_value == related_logs[0]
+
+
+@pytest.fixture
+def past_values():
+    """An instance whose char field was "first" 3 days ago, "second" 2 days
+    ago and is "third" now, with a related instance set 3 days ago."""
+    related_instance = TestModelRelated.objects.create()
+    instance = TestModel.objects.create(
+        test_char_field="first", test_related_field=related_instance
+    )
+    instance.fieldlog_set.update(timestamp=timezone.now() - timedelta(days=3))
+    instance.test_char_field = "second"
+    instance.save()
+    instance.fieldlog_set.filter(new_value="second").update(
+        timestamp=timezone.now() - timedelta(days=2)
+    )
+    instance.test_char_field = "third"
+    instance.save()
+    return instance, related_instance
+
+
+@pytest.mark.django_db
+class TestAsOf:
+    def test_values_at_a_point_in_time(self, past_values, django_assert_num_queries):
+        instance, related_instance = past_values
+
+        # The logs, then the related instances.
+        with django_assert_num_queries(2):
+            values = TestModel.as_of(instance, timezone.now() - timedelta(days=1))
+
+        assert values["test_char_field"] == "second"
+        assert values["test_related_field"] == related_instance
+        assert TestModel.as_of(instance.pk, timezone.now())["test_char_field"] == (
+            "third"
+        )
+        assert TestModel.as_of(instance, timezone.now() - timedelta(days=4)) == {}
+
+    def test_many_instances(self, past_values, django_assert_num_queries):
+        instance, _ = past_values
+        other_instance = TestModel.objects.create(test_char_field="other")
+
+        with django_assert_num_queries(2):
+            values = FieldLog.objects.as_of_many(
+                TestModel,
+                [instance, str(other_instance.pk), 0],
+                timezone.now() - timedelta(days=1),
+            )
+
+        assert values[instance.pk]["test_char_field"] == "second"
+        assert values[other_instance.pk] == {}
+        assert values[0] == {}
+        assert (
+            FieldLog.objects.as_of_many(TestModel, [other_instance], timezone.now())[
+                other_instance.pk
+            ]["test_char_field"]
+            == "other"
+        )
+
+    def test_latest_logs_use_distinct_on_where_supported(self, monkeypatch):
+        monkeypatch.setattr(connection.features, "can_distinct_on_fields", True)
+
+        logs = FieldLog.objects.all()._latest_logs(timezone.now())
+
+        assert logs.query.distinct_fields == (
+            "instance_id",
+            "instance_int_id",
+            "instance_uuid",
+            "logged_field",
+            "field",
+        )
+        assert logs.query.order_by[-1] == "-pk"
+
+
+@pytest.mark.django_db
+def test_latest_log():
+    instance = TestModel.objects.create(test_char_field="a")
+    instance.test_char_field = "b"
+    instance.save()
+
+    log = instance.fieldlog_set.filter(field="test_char_field").latest("pk")
+
+    assert log.new_value == "b"
@@ -0,0 +1,217 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from fieldlogger.models import FieldLog
+from fieldlogger.retention import (
+    cutoff,
+    delete_expired,
+    expired_logs,
+    last_pk_before,
+    retention_cutoffs,
+)
+
+from .helpers import FakePostgresConnection, bound, set_config
+from .testapp.models import TestModel
+
+
+@pytest.fixture
+def retention_days(settings):
+    settings.FIELD_LOGGER_SETTINGS = {
+        **settings.FIELD_LOGGER_SETTINGS,
+        "RETENTION_DAYS": 30,
+    }
+
+
+@pytest.fixture
+def fake_postgres(monkeypatch):
+    fake = FakePostgresConnection(partitioned=True)
+    monkeypatch.setattr(
+        "fieldlogger.management.commands.prune_fieldlogs.connections",
+        {"default": fake},
+    )
+    return fake
+
+
+def aged_logs(days, model_name="testmodel"):
+    """Create a log per age in ``days``, in the order given; logs of
+    ``TestModel`` unless another ``model_name`` is given."""
+    for age in days:
+        if model_name == "testmodel":
+            instance = TestModel.objects.create(test_char_field=str(age))
+            logs = instance.fieldlog_set.all()
+        else:
+            log = FieldLog.objects.create(
+                app_label="testapp",
+                model_name=model_name,
+                instance_id="1",
+                field="test_char_field",
+                new_value=str(age),
+                created=True,
+            )
+            logs = FieldLog.objects.filter(pk=log.pk)
+        logs.update(timestamp=timezone.now() - timedelta(days=age))
+
+
+def remaining_ages():
+    return sorted(
+        int(value) for value in FieldLog.objects.values_list("new_value", flat=True)
+    )
+
+
+@pytest.mark.django_db
+class TestDeleteExpired:
+    def test_logs_are_deleted_in_pk_batches(self):
+        aged_logs([60, 50, 40, 10])
+        first_pk = FieldLog.objects.order_by("pk").first().pk
+        per_instance = TestModel.objects.first().fieldlog_set.count()
+
+        batches = list(
+            delete_expired(cutoff(30), batch_size=per_instance, start_pk=first_pk)
+        )
+
+        assert [deleted for _, deleted in batches] == [per_instance] * 3
+        assert batches[0][0] == first_pk + per_instance - 1
+        assert FieldLog.objects.count() == per_instance
+
+    def test_logs_inserted_out_of_timestamp_order(self):
+        aged_logs([60, 10, 50, 5])
+        per_instance = TestModel.objects.first().fieldlog_set.count()
+
+        batches = list(delete_expired(cutoff(30), batch_size=per_instance))
+
+        assert [deleted for _, deleted in batches] == [per_instance, 0, per_instance]
+        assert remaining_ages() == [5, 10]
+
+    def test_last_expired_log_is_probed_by_pk(self):
+        aged_logs([60, 10])
+
+        with CaptureQueriesContext(connection) as queries:
+            last_pk = last_pk_before(FieldLog.objects.all(), cutoff(30))
+
+        assert last_pk == FieldLog.objects.get(new_value="60").pk
+        (query,) = queries
+        assert "MAX(" not in query["sql"]
+        assert query["sql"].endswith(" DESC LIMIT 1")
+
+    def test_empty_table(self):
+        assert list(delete_expired(timezone.now())) == []
+        assert cutoff(None) is None
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestRetentionPolicy:
+    def test_models_keep_their_own_retention(self, retention_days):
+        set_config({"retention_days": 90}, "testmodel")
+        aged_logs([120, 60, 10])
+        aged_logs([60, 10], model_name="other")
+
+        before, condition = expired_logs(retention_cutoffs())
+        list(delete_expired(before, filters=condition))
+
+        assert remaining_ages() == [10, 10, 60]
+
+    def test_models_can_keep_logs_forever(self, retention_days):
+        set_config({"retention_days": None}, "testmodel")
+        aged_logs([60])
+        aged_logs([60], model_name="other")
+
+        cutoffs = retention_cutoffs()
+        assert cutoffs[("testapp", "testmodel")] is None
+        before, condition = expired_logs(cutoffs)
+        list(delete_expired(before, filters=condition))
+
+        assert remaining_ages() == [60]
+
+    def test_models_with_the_global_retention(self, retention_days):
+        set_config({"retention_days": 30}, "testapp")
+        assert list(retention_cutoffs()) == [None]
+
+    def test_no_retention(self):
+        assert expired_logs(retention_cutoffs()) is None
+
+        set_config({"retention_days": 30}, "testmodel")
+        assert list(retention_cutoffs()) == [None, ("testapp", "testmodel")]
+
+
+@pytest.mark.django_db
+class TestPruneFieldlogsCommand:
+    @pytest.mark.usefixtures("retention_days")
+    def test_logs_are_deleted_in_batches(self, monkeypatch, capsys):
+        sleeps = []
+        monkeypatch.setattr("time.sleep", sleeps.append)
+        aged_logs([60, 50, 10])
+
+        call_command("prune_fieldlogs", batch_size=2, sleep=0.5, verbosity=2)
+
+        out = capsys.readouterr().out
+        assert "Deleted 2 logs up to pk" in out
+        assert "Deleted 2 logs." in out
+        assert sleeps == [0.5]
+        assert remaining_ages() == [10]
+
+    @pytest.mark.usefixtures("retention_days")
+    def test_interrupted_runs_resume_from_the_checkpoint(
+        self, monkeypatch, tmp_path, capsys
+    ):
+        aged_logs([60, 50, 40, 10])
+        checkpoint = tmp_path / "checkpoint"
+
+        def interrupt(seconds):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr("time.sleep", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            call_command(
+                "prune_fieldlogs", batch_size=1, sleep=1, checkpoint=checkpoint
+            )
+
+        assert remaining_ages() == [10, 40, 50]
+        assert int(checkpoint.read_text()) == FieldLog.objects.get(new_value="50").pk
+        # Logs before the checkpoint are left alone.
+        next_pk = FieldLog.objects.get(new_value="40").pk
+        checkpoint.write_text(str(next_pk))
+
+        call_command("prune_fieldlogs", batch_size=1, checkpoint=checkpoint)
+
+        assert f"Resuming from pk {next_pk}." in capsys.readouterr().out
+        assert remaining_ages() == [10, 50]
+        assert not checkpoint.exists()
+
+    def test_retention_is_required(self):
+        with pytest.raises(CommandError, match="RETENTION_DAYS"):
+            call_command("prune_fieldlogs")
+
+    @pytest.mark.usefixtures("retention_days")
+    def test_expired_partitions_are_dropped(self, fake_postgres, capsys):
+        fake_postgres.partition_rows = [
+            (
+                "fieldlogger_fieldlog_legacy",
+                bound("MINVALUE", "'2000-01-01 00:00:00+00'"),
+            ),
+            (
+                "fieldlogger_fieldlog_p20990101",
+                bound("'2099-01-01 00:00:00+00'", "MAXVALUE"),
+            ),
+        ]
+        aged_logs([60])
+
+        call_command("prune_fieldlogs")
+
+        out = capsys.readouterr().out
+        assert out.count("Dropped partition") == 1
+        assert "Dropped partition fieldlogger_fieldlog_legacy." in out
+        assert remaining_ages() == []
+
+    @pytest.mark.usefixtures("retention_days", "restore_settings")
+    def test_partitions_are_kept_for_logs_kept_forever(self, fake_postgres):
+        set_config({"retention_days": None}, "testmodel")
+
+        call_command("prune_fieldlogs")
+
+        assert not any("DROP" in sql for sql in fake_postgres.executed)
@@ -0,0 +1,141 @@
+import pytest
+from django.db import NotSupportedError, connection, transaction
+
+from fieldlogger import fieldlogger, sequences
+from fieldlogger.models import FieldLog
+
+from .helpers import FakePostgresConnection
+from .testapp.models import TestModel, TestModelRelated
+
+
+@pytest.mark.django_db(transaction=True)
+class TestReservePks:
+    def test_first_reservation_starts_after_existing_rows(self):
+        instance = TestModelRelated.objects.create()
+
+        pks = sequences.reserve_pks(TestModelRelated, 3, "default")
+
+        assert list(pks) == [instance.pk + 1, instance.pk + 2, instance.pk + 3]
+
+    def test_reservations_do_not_overlap(self):
+        first = sequences.reserve_pks(TestModelRelated, 3, "default")
+        second = sequences.reserve_pks(TestModelRelated, 2, "default")
+
+        assert list(second) == [first[-1] + 1, first[-1] + 2]
+
+    def test_rows_inserted_by_other_means_are_skipped(self):
+        pks = sequences.reserve_pks(TestModelRelated, 2, "default")
+        TestModelRelated.objects.bulk_create(
+            [TestModelRelated(pk=pk) for pk in (pks[0], pks[1], pks[1] + 1)]
+        )
+
+        assert list(sequences.reserve_pks(TestModelRelated, 1, "default")) == [
+            pks[1] + 2
+        ]
+
+    def test_generated_keys_are_not_reserved(self):
+        pks = sequences.reserve_pks(TestModelRelated, 3, "default")
+
+        assert TestModelRelated.objects.create().pk == pks[-1] + 1
+
+    @pytest.mark.django_db(databases=["default", "other"])
+    def test_sequences_are_per_model_and_database(self):
+        first = sequences.reserve_pks(TestModelRelated, 2, "default")
+
+        assert list(sequences.reserve_pks(TestModelRelated, 1, "default")) == [
+            first[-1] + 1
+        ]
+        other = sequences.reserve_pks(TestModelRelated, 1, "other")
+        assert TestModelRelated.objects.using("other").create().pk == other[-1] + 1
+        model = sequences.reserve_pks(TestModel, 1, "default")
+        assert TestModel.objects.create().pk == model[-1] + 1
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("reset_pk_blocks")
+class TestAllocatePks:
+    def test_other_models_reserve_exactly_what_they_need(self):
+        first = sequences.allocate_pks(TestModelRelated, 2, "default")
+
+        assert sequences.allocate_pks(TestModelRelated, 1, "default") == [first[-1] + 1]
+        assert TestModelRelated.objects.create().pk == first[-1] + 2
+
+    def test_log_pks_are_handed_out_from_a_block(
+        self, settings, django_assert_num_queries
+    ):
+        settings.FIELD_LOGGER_SETTINGS["PK_BLOCK_SIZE"] = 10
+
+        first = sequences.allocate_pks(FieldLog, 3, "default")
+        start = first[0]
+        assert first == [start, start + 1, start + 2]
+        with django_assert_num_queries(0):
+            assert sequences.allocate_pks(FieldLog, 7, "default") == list(
+                range(start + 3, start + 10)
+            )
+
+        assert sequences.allocate_pks(FieldLog, 1, "default") == [start + 10]
+        # Keys generated by the database come after the block.
+        log = FieldLog.objects.create(app_label="testapp", model_name="m", field="f")
+        assert log.pk == start + 20
+
+    def test_batches_larger_than_a_block(self, settings):
+        settings.FIELD_LOGGER_SETTINGS["PK_BLOCK_SIZE"] = 2
+
+        first = sequences.allocate_pks(FieldLog, 3, "default")
+        assert sequences.allocate_pks(FieldLog, 1, "default") == [first[-1] + 1]
+
+    def test_no_block_is_kept_from_transactions(self, settings):
+        """On SQLite, a rollback would undo the reservation of the block."""
+        settings.FIELD_LOGGER_SETTINGS["PK_BLOCK_SIZE"] = 10
+
+        with pytest.raises(ValueError), transaction.atomic():
+            pks = sequences.allocate_pks(FieldLog, 1, "default")
+            raise ValueError
+
+        assert sequences.allocate_pks(FieldLog, 1, "default") == pks
+
+    def test_blocks_drawn_from_sequences_are_kept_from_transactions(self, monkeypatch):
+        monkeypatch.setattr(connection, "vendor", "postgresql")
+        monkeypatch.setattr(
+            sequences, "reserve_pks", lambda model_class, count, using: [7, 9]
+        )
+
+        with transaction.atomic():
+            assert sequences.allocate_pks(FieldLog, 1, "default") == [7]
+        assert sequences.allocate_pks(FieldLog, 1, "default") == [9]
+
+
+def test_pks_are_drawn_from_sequences_on_postgresql(monkeypatch):
+    fake = FakePostgresConnection()
+    monkeypatch.setattr(sequences, "connections", {"default": fake})
+
+    assert sequences.reserve_pks(TestModelRelated, 2, "default") == [1, 2]
+    assert fake.executed == [
+        "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)"
+    ]
+
+
+def test_other_databases_are_not_supported(monkeypatch):
+    monkeypatch.setattr(connection, "vendor", "mysql")
+
+    with pytest.raises(NotSupportedError, match="cannot be reserved on SQLite"):
+        sequences.reserve_pks(TestModelRelated, 2, "default")
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="PostgreSQL only.")
+def test_generated_keys_follow_the_drawn_ones_on_postgresql():
+    pks = sequences.reserve_pks(TestModelRelated, 3, "default")
+
+    assert len(set(pks)) == 3
+    assert TestModelRelated.objects.create().pk > max(pks)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_set_primary_keys_without_missing_pks(django_assert_num_queries):
+    log = FieldLog(pk=5)
+
+    with django_assert_num_queries(0):
+        fieldlogger.set_primary_keys([log], FieldLog)
+
+    assert log.pk == 5
@@ -1,10 +1,12 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from fieldlogger import signals
 from fieldlogger.models import FieldLog
 
-from .helpers import CREATE_FORM
-from .testapp.models import TestModel
+from .helpers import CREATE_FORM, set_config
+from .testapp.models import TestModel, TestModelRelated
 
 
 @pytest.mark.django_db(transaction=True)
@@ -37,3 +39,37 @@ def test_save_on_secondary_database_is_logged():
     update_logs = instance.fieldlog_set.filter(field="test_char_field", created=False)
     assert update_logs.count() == 1
     assert update_logs.get().old_value == "first"
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestUpdateFields:
+    def test_saves_without_logged_fields_do_not_fetch(self, django_assert_num_queries):
+        set_config({"exclude_fields": ["id", "test_text_field"]}, "testmodel")
+        instance = TestModel.objects.create(test_char_field="test")
+        instance.test_text_field = "changed"
+
+        # Only the update.
+        with django_assert_num_queries(1):
+            instance.save(update_fields=["test_text_field"])
+
+        assert not instance.fieldlog_set.filter(field="test_text_field").exists()
+
+    def test_only_the_saved_logged_fields_are_fetched(self):
+        related_instance = TestModelRelated.objects.create()
+        instance = TestModel.objects.create(test_char_field="test")
+        instance.test_char_field = "changed"
+        instance.test_related_field = related_instance
+
+        with CaptureQueriesContext(connection) as ctx:
+            instance.save(update_fields=["test_char_field", "test_related_field_id"])
+
+        select = ctx.captured_queries[0]["sql"]
+        assert select.startswith("SELECT")
+        assert '"test_char_field"' in select
+        assert '"test_related_field_id"' in select
+        assert '"test_text_field"' not in select
+        assert {
+            log.field: log.new_value
+            for log in instance.fieldlog_set.filter(created=False)
+        } == {"test_char_field": "changed", "test_related_field": related_instance}
@@ -0,0 +1,270 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from fieldlogger.models import FieldLog, FieldStateSnapshot
+
+from .helpers import CREATE_FORM, UPDATE_FORM, set_attributes, set_config
+from .testapp.models import TestModel, TestModelRelated, TestModelRelated2
+
+# Options of TestModel logging two of its fields.
+FIELDS = {"fields": ["test_char_field", "test_related_field"]}
+
+
+def snapshot_log_ids(instance):
+    return list(
+        FieldStateSnapshot.objects.filter(instance_id=str(instance.pk))
+        .order_by("pk")
+        .values_list("last_log_id", flat=True)
+    )
+
+
+def last_log_id(instance):
+    return instance.fieldlog_set.order_by("pk").last().pk
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestWriteSnapshots:
+    def test_every_so_many_logs(self):
+        set_config({**FIELDS, "snapshot_every": 3}, "testmodel")
+        instance = TestModel.objects.create(test_char_field="0")
+        # The first snapshot of an instance is taken right away.
+        expected = [last_log_id(instance)]
+
+        for value in range(1, 4):
+            instance.test_char_field = str(value)
+            instance.save()
+        expected.append(last_log_id(instance))
+        instance.test_char_field = "4"
+        instance.save()
+
+        assert snapshot_log_ids(instance) == expected
+        snapshot = FieldStateSnapshot.objects.order_by("pk").last()
+        assert snapshot.state["test_char_field"] == "3"
+        assert snapshot.timestamp == FieldLog.objects.get(pk=expected[-1]).timestamp
+        assert str(snapshot) == (
+            f"testapp__testmodel__{instance.pk}: state as of log {expected[-1]}"
+        )
+
+    def test_every_so_much_time(self):
+        set_config(FIELDS, "testmodel")
+        set_config({"snapshot_interval": 3600}, "testapp")
+        instance = TestModel.objects.create(test_char_field="0")
+        instance.test_char_field = "1"
+        instance.save()
+        assert len(snapshot_log_ids(instance)) == 1
+
+        FieldStateSnapshot.objects.update(timestamp=timezone.now() - timedelta(hours=2))
+        instance.test_char_field = "2"
+        instance.save()
+
+        assert snapshot_log_ids(instance)[1:] == [last_log_id(instance)]
+
+    def test_state_holds_all_the_logged_fields(self):
+        set_config({"snapshot_every": 10}, "testmodel")
+        related_instance = TestModelRelated.objects.create()
+        instance = TestModel.objects.create(
+            test_decimal_field=Decimal("3.149"),
+            test_json_field={"key": "value"},
+            test_related_field=related_instance,
+        )
+        instance.test_json_field["key"] = "changed"
+
+        state = FieldStateSnapshot.objects.get().state
+        assert state["test_decimal_field"] == 3.15
+        assert state["test_json_field"] == {"key": "value"}
+        assert state["test_related_field"] == related_instance.pk
+        assert state["test_char_field"] is None
+        assert "id" not in state
+
+    def test_deferred_fields_are_not_snapshotted(self):
+        instance = TestModel.objects.create(test_char_field="0")
+        set_config({"snapshot_every": 1}, "testmodel")
+
+        instance = TestModel.objects.only("test_char_field").get()
+        instance.test_char_field = "1"
+        instance.save()
+
+        assert not FieldStateSnapshot.objects.exists()
+
+    @pytest.mark.parametrize("in_memory_state", [False, True])
+    def test_unsaved_fields_keep_their_database_values(self, in_memory_state):
+        set_config(
+            {**FIELDS, "snapshot_every": 1, "in_memory_state": in_memory_state},
+            "testmodel",
+        )
+        instance = TestModel.objects.create(test_char_field="0")
+        FieldStateSnapshot.objects.all().delete()
+
+        instance.test_char_field = "1"
+        instance.test_related_field = TestModelRelated.objects.create()
+        instance.save(update_fields=["test_char_field"])
+
+        # Without the in-memory state, the value of test_related_field in
+        # the database is not known.
+        assert [snapshot.state for snapshot in FieldStateSnapshot.objects.all()] == (
+            [{"test_char_field": "1", "test_related_field": None}]
+            if in_memory_state
+            else []
+        )
+
+    def test_m2m_logs_are_counted(self):
+        set_config(
+            {**FIELDS, "fields": [*FIELDS["fields"], "test_many_to_many_field"]},
+            "testmodel",
+        )
+        set_config({"snapshot_every": 2}, "testmodel")
+        instance = TestModel.objects.create(test_char_field="0")
+        instance.test_many_to_many_field.add(TestModelRelated2.objects.create())
+        instance.test_char_field = "1"
+        instance.save()
+
+        assert snapshot_log_ids(instance)[1:] == [last_log_id(instance)]
+        assert "test_many_to_many_field" not in FieldStateSnapshot.objects.last().state
+
+
+def age_latest(days):
+    """Age the logs and snapshots of the last hour by ``days``."""
+    recent = timezone.now() - timedelta(hours=1)
+    for model in (FieldLog, FieldStateSnapshot):
+        model.objects.filter(timestamp__gt=recent).update(
+            timestamp=timezone.now() - timedelta(days=days)
+        )
+
+
+@pytest.fixture
+def history():
+    """An instance whose char field was "first" 4 days ago, "second" 2 days
+    ago and is "third" now, with a related instance set 4 days ago,
+    snapshotted on every log."""
+    set_config({**FIELDS, "snapshot_every": 1}, "testmodel")
+    related_instance = TestModelRelated.objects.create()
+    instance = TestModel.objects.create(
+        test_char_field="first", test_related_field=related_instance
+    )
+    age_latest(4)
+    instance.test_char_field = "second"
+    instance.save()
+    age_latest(2)
+    instance.test_char_field = "third"
+    instance.save()
+    return instance, related_instance
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+class TestAsOf:
+    def test_values_come_from_the_snapshot(self, history, django_assert_num_queries):
+        instance, related_instance = history
+        yesterday = timezone.now() - timedelta(days=1)
+        # Logs covered by the snapshots are not needed anymore.
+        FieldLog.objects.filter(timestamp__lt=yesterday)._raw_delete("default")
+
+        # The snapshots, the logs after them, then the related instances.
+        with django_assert_num_queries(3):
+            values = TestModel.as_of(instance, yesterday)
+
+        assert values["test_char_field"] == "second"
+        assert values["test_related_field"] == related_instance
+        assert TestModel.as_of(instance, timezone.now() - timedelta(days=5)) == {}
+
+    def test_logs_after_the_snapshot_are_applied(self, history):
+        instance, _ = history
+        set_config({"snapshot_every": 10}, "testmodel")
+        instance.test_char_field = "fourth"
+        instance.save()
+
+        values = TestModel.as_of(instance, timezone.now())
+
+        assert values["test_char_field"] == "fourth"
+        assert FieldStateSnapshot.objects.last().state["test_char_field"] == "third"
+
+    def test_same_values_as_from_the_logs(self):
+        # The in-memory state holds the fields not saved with update_fields.
+        set_config({"snapshot_every": 2, "in_memory_state": True}, "testmodel")
+        instance = TestModel.objects.create(
+            **CREATE_FORM,
+            test_related_field=TestModelRelated.objects.create(),
+            test_one_to_one_field=TestModelRelated2.objects.create(),
+        )
+        set_attributes(instance, UPDATE_FORM, update_fields=True)
+        instance.test_many_to_many_field.add(TestModelRelated2.objects.create())
+        other_instance = TestModel.objects.create(test_char_field="other")
+        FieldStateSnapshot.objects.filter(instance_id=str(other_instance.pk)).delete()
+
+        pks = [instance.pk, other_instance.pk]
+        with_snapshots = FieldLog.objects.as_of_many(TestModel, pks, timezone.now())
+        assert (
+            FieldStateSnapshot.objects.filter(instance_id=str(instance.pk)).count() > 1
+        )
+        set_config({"snapshot_every": None}, "testmodel")
+        from_logs = FieldLog.objects.as_of_many(TestModel, pks, timezone.now())
+
+        assert with_snapshots[other_instance.pk] == from_logs[other_instance.pk]
+        assert {
+            field: value
+            for field, value in with_snapshots[instance.pk].items()
+            if value is not None
+        } == from_logs[instance.pk]
+        assert from_logs[instance.pk]["test_many_to_many_field"]
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(
+    FIELD_LOGGER_SETTINGS={
+        "BUFFER_LOGS": True,
+        "LOGGING_APPS": {
+            "testapp": {"models": {"TestModel": {**FIELDS, "snapshot_every": 2}}}
+        },
+    }
+)
+def test_snapshots_are_written_with_buffered_logs():
+    with transaction.atomic():
+        instance = TestModel.objects.create(test_char_field="0")
+        instance.test_char_field = "1"
+        instance.save()
+        assert not FieldStateSnapshot.objects.exists()
+
+    snapshot = FieldStateSnapshot.objects.get()
+    assert snapshot.last_log_id == last_log_id(instance)
+    assert snapshot.state == {"test_char_field": "1", "test_related_field": None}
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+def test_compact_logs_with_native_ids_are_snapshotted(history):
+    instance, _ = history
+    settings.FIELD_LOGGER_SETTINGS["COMPACT_LOGS"] = True
+    settings.FIELD_LOGGER_SETTINGS["NATIVE_INSTANCE_IDS"] = True
+    set_config({"snapshot_every": 2}, "testmodel")
+
+    instance.test_char_field = "fourth"
+    instance.save()
+    assert FieldStateSnapshot.objects.count() == 3
+    instance.test_char_field = "fifth"
+    instance.save()
+
+    assert FieldStateSnapshot.objects.count() == 4
+    assert TestModel.as_of(instance, timezone.now())["test_char_field"] == "fifth"
+    assert (
+        TestModel.as_of(instance, timezone.now() - timedelta(days=1))["test_char_field"]
+        == "second"
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("restore_settings")
+def test_expired_snapshots_are_pruned(history, capsys):
+    set_config({"retention_days": 3}, "global")
+
+    call_command("prune_fieldlogs")
+
+    assert "Deleted 1 snapshots." in capsys.readouterr().out
+    assert FieldStateSnapshot.objects.count() == 2
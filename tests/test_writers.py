@@ -0,0 +1,368 @@
+import threading
+from contextlib import nullcontext
+
+import pytest
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from fieldlogger import fieldlogger, writers
+from fieldlogger.models import FieldLog
+
+from .settings import get_callback
+from .testapp.models import TestModel
+
+LOGGING_APPS = {
+    "testapp": {"models": {"TestModel": {"fields": ["test_char_field"]}}},
+}
+
+
+def log_inserts(queries):
+    return [
+        query["sql"]
+        for query in queries
+        if query["sql"].startswith('INSERT INTO "fieldlogger_fieldlog"')
+    ]
+
+
+@pytest.fixture
+def buffer_logs():
+    with override_settings(
+        FIELD_LOGGER_SETTINGS={"BUFFER_LOGS": True, "LOGGING_APPS": LOGGING_APPS}
+    ):
+        yield
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("buffer_logs")
+class TestTransactionBuffer:
+    def test_logs_are_inserted_once_on_commit(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                for i in range(3):
+                    TestModel.objects.create(test_char_field=str(i))
+                assert FieldLog.objects.count() == 0
+
+        assert len(log_inserts(ctx.captured_queries)) == 1
+        assert FieldLog.objects.count() == 3
+        assert all(log.pk for log in FieldLog.objects.all())
+
+    def test_logs_are_discarded_on_rollback(self):
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                TestModel.objects.create(test_char_field="rolled back")
+                raise ValueError
+
+        with transaction.atomic():
+            TestModel.objects.create(test_char_field="committed")
+
+        assert list(FieldLog.objects.values_list("new_value", flat=True)) == [
+            "committed"
+        ]
+
+    def test_logs_of_rolled_back_savepoints_are_discarded(self):
+        with transaction.atomic():
+            TestModel.objects.create(test_char_field="outer")
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    TestModel.objects.create(test_char_field="inner")
+                    raise ValueError
+
+        assert list(FieldLog.objects.values_list("new_value", flat=True)) == ["outer"]
+
+    def test_logs_of_released_savepoints_are_kept(self):
+        with transaction.atomic():
+            with transaction.atomic():
+                TestModel.objects.create(test_char_field="inner")
+            TestModel.objects.create(test_char_field="outer")
+
+        assert FieldLog.objects.count() == 2
+
+    def test_max_size_forces_an_early_flush(self, settings):
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "BUFFER_MAX_SIZE": 2,
+        }
+
+        with transaction.atomic():
+            for i in range(3):
+                TestModel.objects.create(test_char_field=str(i))
+            assert FieldLog.objects.count() == 2
+
+        assert FieldLog.objects.count() == 3
+
+    def test_early_flush_skips_rolled_back_savepoints(self, settings):
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "BUFFER_MAX_SIZE": 2,
+        }
+
+        with transaction.atomic():
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    TestModel.objects.create(test_char_field="inner")
+                    raise ValueError
+            TestModel.objects.create(test_char_field="outer")
+
+        assert list(FieldLog.objects.values_list("new_value", flat=True)) == ["outer"]
+
+    def test_logs_outside_transactions_are_inserted_immediately(self):
+        TestModel.objects.create(test_char_field="test")
+        assert FieldLog.objects.count() == 1
+
+    def test_logs_saved_by_callbacks_are_not_inserted_twice(self, settings):
+        def save_logs(instance, fields, logs):
+            for log in logs.values():
+                log.save()
+
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "CALLBACKS": [save_logs],
+        }
+
+        with transaction.atomic():
+            TestModel.objects.create(test_char_field="test")
+            assert FieldLog.objects.count() == 1
+
+        assert FieldLog.objects.count() == 1
+
+    def test_fields_saved_by_callbacks_are_inserted_with_the_logs(self, settings):
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "CALLBACKS": [get_callback("global")],
+            "FAIL_SILENTLY": False,
+        }
+
+        with transaction.atomic():
+            TestModel.objects.create(test_char_field="test")
+            assert FieldLog.objects.count() == 0
+
+        assert FieldLog.objects.get().extra_data == {"global": True}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_logs_are_inserted_immediately_by_default():
+    with transaction.atomic():
+        TestModel.objects.create(test_char_field="test")
+        assert TestModel.objects.get().fieldlog_set.exists()
+
+
+@pytest.fixture
+def async_logs():
+    with override_settings(
+        FIELD_LOGGER_SETTINGS={"ASYNC_LOGS": True, "LOGGING_APPS": LOGGING_APPS}
+    ):
+        yield
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("async_logs")
+class TestAsyncLogs:
+    def test_logs_are_inserted_by_the_writer_thread(self):
+        TestModel.objects.create(test_char_field="test")
+        writers.flush()
+
+        assert FieldLog.objects.get().new_value == "test"
+
+    def test_logs_are_queued_on_commit(self):
+        with transaction.atomic():
+            TestModel.objects.create(test_char_field="committed")
+            writers.flush()
+            assert FieldLog.objects.count() == 0
+
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                TestModel.objects.create(test_char_field="rolled back")
+                raise ValueError
+
+        writers.flush()
+        assert list(FieldLog.objects.values_list("new_value", flat=True)) == [
+            "committed"
+        ]
+
+    def test_buffered_logs_are_queued_on_commit(self, settings):
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "BUFFER_LOGS": True,
+            "BUFFER_MAX_SIZE": 1,
+        }
+
+        with transaction.atomic():
+            TestModel.objects.create(test_char_field="first")
+            TestModel.objects.create(test_char_field="second")
+            writers.flush()
+            assert FieldLog.objects.count() == 0
+
+        writers.flush()
+        assert FieldLog.objects.count() == 2
+
+    def test_logs_are_queued_after_the_callbacks(self, settings):
+        counts = []
+
+        def callback(instance, logging_fields, logs):
+            writers.flush()
+            counts.append(FieldLog.objects.count())
+            logs["test_char_field"].extra_data = {"seen": True}
+            logs["test_char_field"].save()
+
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "CALLBACKS": [callback],
+        }
+
+        TestModel.objects.create(test_char_field="test")
+        writers.flush()
+
+        assert counts == [0]
+        # Saved by the callback, so not inserted again by the writer.
+        assert FieldLog.objects.get().extra_data == {"seen": True}
+
+    @pytest.mark.parametrize("atomic", [False, True])
+    def test_fields_saved_by_callbacks_are_inserted_with_the_logs(
+        self, settings, atomic
+    ):
+        settings.FIELD_LOGGER_SETTINGS = {
+            **settings.FIELD_LOGGER_SETTINGS,
+            "CALLBACKS": [get_callback("global")],
+            "FAIL_SILENTLY": False,
+        }
+
+        with transaction.atomic() if atomic else nullcontext():
+            TestModel.objects.create(test_char_field="test")
+        writers.flush()
+
+        assert FieldLog.objects.get().extra_data == {"global": True}
+
+    def test_held_logs_are_queued_by_the_outermost_block(self):
+        with writers.hold_async_logs():
+            TestModel.objects.create(test_char_field="test")
+            writers.flush()
+            assert FieldLog.objects.count() == 0
+
+        writers.flush()
+        assert FieldLog.objects.count() == 1
+
+    def test_logs_written_outside_of_holds_are_queued_at_once(self):
+        log = FieldLog(app_label="testapp", model_name="testmodel", field="f")
+
+        writers.write_logs([log], fieldlogger._insert_logs)
+        writers.flush()
+
+        assert FieldLog.objects.get().field == "f"
+
+    def test_shutdown_inserts_queued_logs(self):
+        TestModel.objects.create(test_char_field="test")
+        writers.shutdown()
+
+        assert FieldLog.objects.count() == 1
+        assert writers._writer is None
+
+    def test_settings_change_stops_the_writer(self):
+        TestModel.objects.create(test_char_field="test")
+        assert writers._writer is not None
+
+        with override_settings(FIELD_LOGGER_SETTINGS={}):
+            assert writers._writer is None
+
+
+def test_flush_without_writer():
+    writers.flush()
+
+
+class Recorder:
+    """Fake ``insert`` that records the batches; the writer thread can be
+    paused."""
+
+    def __init__(self):
+        self.batches = []
+        self.resume = threading.Event()
+        self.resume.set()
+        self.called = threading.Event()
+
+    def __call__(self, logs, using):
+        if threading.current_thread().name == "fieldlogger-writer":
+            self.called.set()
+            self.resume.wait()
+        self.batches.append((using, [log.field for log in logs]))
+
+
+def new_logs(*fields):
+    return [FieldLog(field=field) for field in fields]
+
+
+class TestAsyncWriter:
+    def test_logs_are_inserted_in_batches(self):
+        insert = Recorder()
+        writer = writers.AsyncWriter(insert, batch_size=2, flush_interval=60)
+
+        writer.put(new_logs("a"), "default")
+        writer.put(new_logs("b", "c"), "default")
+        writer.put(new_logs("d"), "other")
+        writer.flush()
+        writer.stop()
+
+        assert insert.batches == [
+            ("default", ["a", "b", "c"]),
+            ("other", ["d"]),
+        ]
+
+    def test_logs_are_inserted_after_the_flush_interval(self):
+        insert = Recorder()
+        writer = writers.AsyncWriter(insert, flush_interval=0.01)
+
+        writer.put(new_logs("a"), "default")
+        assert insert.called.wait(5)
+        writer.stop()
+
+        assert insert.batches == [("default", ["a"])]
+
+    @pytest.mark.parametrize("on_full", [writers.ON_FULL_DROP, writers.ON_FULL_SYNC])
+    def test_full_queue(self, on_full, caplog):
+        insert = Recorder()
+        insert.resume.clear()
+        writer = writers.AsyncWriter(
+            insert, queue_size=1, batch_size=1, on_full=on_full
+        )
+
+        writer.put(new_logs("a"), "default")
+        assert insert.called.wait(5)  # taken by the thread, which is paused
+        writer.put(new_logs("b"), "default")  # fills the queue
+        writer.put(new_logs("c"), "default")
+        insert.resume.set()
+        writer.stop()
+
+        fields = [field for _, fields in insert.batches for field in fields]
+        if on_full == writers.ON_FULL_DROP:
+            assert sorted(fields) == ["a", "b"]
+            assert "dropping 1 logs" in caplog.text
+        else:
+            assert sorted(fields) == ["a", "b", "c"]
+
+    def test_copies_of_the_logs_are_inserted(self):
+        def insert(logs, using):
+            for log in logs:
+                log.field = ""
+                log._state.adding = False
+
+        writer = writers.AsyncWriter(insert)
+        logs = new_logs("a", "b")
+        logs[1]._state.adding = False  # saved by other means
+        writer.put(logs, "default")
+        writer.stop()
+
+        assert [log.field for log in logs] == ["a", "b"]
+        assert logs[0]._state.adding
+
+    def test_failed_inserts_are_logged(self, caplog):
+        def insert(logs, using):
+            raise ValueError("boom")
+
+        writer = writers.AsyncWriter(insert)
+        writer.put(new_logs("a"), "default")
+        writer.stop()
+
+        assert "failed to insert 1 logs" in caplog.text
+
+    def test_invalid_on_full(self):
+        with pytest.raises(ValueError):
+            writers.AsyncWriter(lambda logs, using: None, on_full="wait")
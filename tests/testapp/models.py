@@ -1,8 +1,10 @@
+import uuid
+
 import django
 from django.db import models
 
 from fieldlogger.managers import FieldLoggerManager
-from fieldlogger.mixins import FieldLoggerMixin
+from fieldlogger.mixins import FieldLoggerMixin, FieldLoggerStateMixin
 
 
 class TestingFieldsMixin(models.Model):
@@ -51,7 +53,7 @@ class TestModelRelated(FieldLoggerMixin, TestingFieldsMixin):
     )
 
 
-class TestModel(FieldLoggerMixin, TestingFieldsMixin):
+class TestModel(FieldLoggerStateMixin, FieldLoggerMixin, TestingFieldsMixin):
     test_related_field = models.ForeignKey(
         TestModelRelated, on_delete=models.CASCADE, null=True
     )
@@ -66,6 +68,24 @@ class TestModel(FieldLoggerMixin, TestingFieldsMixin):
     objects = FieldLoggerManager()
 
 
+class TestUUIDModel(FieldLoggerMixin, models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    test_char_field = models.CharField(max_length=255, null=True)
+
+    __test__ = False
+
+
+class TestUUIDChildModel(TestUUIDModel):
+    pass
+
+
+class TestCharPkModel(FieldLoggerMixin, models.Model):
+    id = models.CharField(max_length=32, primary_key=True)
+    test_char_field = models.CharField(max_length=255, null=True)
+
+    __test__ = False
+
+
 if django.VERSION >= (5, 0):
     TestModel.add_to_class(
         "test_generated_field",